@@ -14,13 +14,15 @@ from .models import (
     Territory,
     Assignment,
 )
+from .rbac import for_request
+from . import search
 
 # -----------------------------
 # Helpers de RBAC (Admin/Gestor vs Representante)
 # -----------------------------
-def _is_manager(user):
-    """Admin ou membro do grupo 'Gestor' têm visão total."""
-    return user.is_superuser or user.groups.filter(name__in=["Admin", "Gestor"]).exists()
+def _is_manager(request):
+    """Admin ou membro do grupo 'Gestor' têm visão total (resolvido uma vez por request, ver crm.rbac)."""
+    return for_request(request).is_manager
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -32,7 +34,7 @@ class OwnableAdmin(admin.ModelAdmin):
     """
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if _is_manager(request.user):
+        if _is_manager(request):
             return qs
         # filtra por owner quando existir; visitreport herda do appointment
         field_names = {f.name for f in self.model._meta.fields}
@@ -50,7 +52,7 @@ class OwnableAdmin(admin.ModelAdmin):
         """
         form = super().get_form(request, obj, **kwargs)
         if "owner" in form.base_fields:
-            if _is_manager(request.user):
+            if _is_manager(request):
                 # gestor/admin veem todos os usuários
                 form.base_fields["owner"].queryset = User.objects.all()
             else:
@@ -65,7 +67,7 @@ class OwnableAdmin(admin.ModelAdmin):
         Em edição, deixa 'owner' somente leitura para não-gestores.
         """
         ro = list(super().get_readonly_fields(request, obj))
-        if not _is_manager(request.user) and obj is not None and hasattr(self.model, "owner"):
+        if not _is_manager(request) and obj is not None and hasattr(self.model, "owner"):
             ro.append("owner")
         return ro
 
@@ -74,7 +76,7 @@ class OwnableAdmin(admin.ModelAdmin):
         Garante que o owner correto será gravado mesmo se houver tentativa de burla.
         """
         if hasattr(obj, "owner"):
-            if not _is_manager(request.user):
+            if not _is_manager(request):
                 # força o owner do rep SEMPRE
                 obj.owner = request.user
             elif not change and not getattr(obj, "owner_id", None):
@@ -84,17 +86,25 @@ class OwnableAdmin(admin.ModelAdmin):
     
     def get_fields(self, request, obj=None):
         fields = list(super().get_fields(request, obj))
-        if not _is_manager(request.user) and obj is None and "owner" in fields:
+        if not _is_manager(request) and obj is None and "owner" in fields:
             fields.remove("owner")
         return fields
     
 
 
+class SearchIndexAdmin(OwnableAdmin):
+    """Busca pelo documento normalizado (crm.search): sem acento e indexada, em vez de icontains."""
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.matching(queryset, search_term), False
+
+
 # -----------------------------
 # Admins
 # -----------------------------
 @admin.register(Doctor)
-class DoctorAdmin(OwnableAdmin):
+class DoctorAdmin(SearchIndexAdmin):
     # Alguns projetos usam campos com nomes levemente diferentes;
     # criamos "callables" para evitar quebrar se houver variação.
     def crm_display(self, obj):
@@ -110,7 +120,9 @@ class DoctorAdmin(OwnableAdmin):
         return ""
 
     list_display = ("name", "crm_display", "specialty_display", "owner")
-    search_fields = ("name", "owner__username")
+    # owner é FK anulável: o select_related automático do changelist não o inclui
+    list_select_related = ("owner",)
+    search_fields = ("search_text",)
     list_filter = ("owner",)
     ordering = ("name",)
     crm_display.short_description = "CRM"
@@ -124,6 +136,7 @@ class AppointmentAdmin(OwnableAdmin):
         return getattr(obj, "when", getattr(obj, "scheduled_at", None))
 
     list_display = ("doctor", "when_display", "status", "owner")
+    list_select_related = ("doctor", "owner")
     list_filter = ("status", "owner")
     search_fields = ("doctor__name", "owner__username")
     ordering = ("-id",)
@@ -139,7 +152,7 @@ class VisitReportAdmin(OwnableAdmin):
 
 
 @admin.register(Organization)
-class OrganizationAdmin(OwnableAdmin):
+class OrganizationAdmin(SearchIndexAdmin):
     def state_display(self, obj):
         for attr in ("state", "uf", "region"):
             if hasattr(obj, attr):
@@ -147,7 +160,8 @@ class OrganizationAdmin(OwnableAdmin):
         return ""
 
     list_display = ("name", "state_display", "owner")
-    search_fields = ("name", "owner__username")
+    list_select_related = ("owner",)
+    search_fields = ("search_text",)
     list_filter = ("owner",)
     ordering = ("name",)
     state_display.short_description = "UF/Região"
@@ -156,6 +170,7 @@ class OrganizationAdmin(OwnableAdmin):
 @admin.register(Deal)
 class DealAdmin(OwnableAdmin):
     list_display = ("title", "status", "owner", "updated_at")
+    list_select_related = ("owner",)
     list_filter = ("status", "owner")
     search_fields = ("title", "owner__username")
     ordering = ("-updated_at", "-id")
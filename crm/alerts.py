@@ -0,0 +1,117 @@
+"""
+Alertas de visitas próximas (72h, 'urgent' se < 24h).
+
+O beat chama precompute() a cada minuto e grava no cache o payload de cada
+usuário ativo: representantes veem só as próprias visitas, gestores veem
+todas. As páginas e o canal SSE só leem o cache; o banco só é consultado
+quando a chave expirou (ex.: worker parado) ou quando uma visita da janela
+foi gravada: os signals incrementam a versão "alerts" (crm.caching) e as
+chaves antigas deixam de ser lidas.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching, rbac
+from .models import Appointment
+
+WINDOW = timedelta(hours=72)
+URGENT = timedelta(hours=24)
+LIMIT = 20
+CACHE_TTL = 180  # o beat regrava a cada minuto
+
+
+def version():
+    return cache.get(caching.version_key('alerts'), 0)
+
+
+async def aversion():
+    return await cache.aget(caching.version_key('alerts'), 0)
+
+
+def cache_key(user_id, ver):
+    return f"alerts:v{ver}:user:{user_id}"
+
+
+def affects(*whens, now=None):
+    """Alguma das datas (antiga/nova de uma visita) cai na janela dos alertas?"""
+    now = now or timezone.now()
+    return any(w is not None and now <= w <= now + WINDOW for w in whens)
+
+
+def mark_dirty(*whens):
+    """Chamado pelos signals de Appointment: invalida os payloads após o commit se a janela mudou."""
+    if affects(*whens):
+        caching.bump_on_commit('alerts')
+
+
+def _upcoming(now):
+    return (Appointment.objects
+            .filter(status='agendada', when__gte=now, when__lte=now + WINDOW)
+            .order_by('when')
+            .values('id', 'when', 'owner_id', 'doctor__name'))
+
+
+def _payload(rows, now):
+    tz = timezone.get_current_timezone()
+    alerts = []
+    for a in rows[:LIMIT]:
+        urgency = 'urgent' if a['when'] - now <= URGENT else 'soon'
+        when_str = timezone.localtime(a['when'], tz).strftime('%d/%m %H:%M')
+        alerts.append({
+            'id': a['id'],
+            'doctor': a['doctor__name'],
+            'when': when_str,
+            'urgency': urgency,
+            'message': f"Visita com {a['doctor__name']} • {when_str}",
+        })
+    return {'count': len(alerts), 'alerts': alerts}
+
+
+def _manager_ids():
+    User = get_user_model()
+    return set(User.objects.filter(is_active=True)
+               .filter(Q(is_superuser=True) | Q(groups__name__in=rbac.MANAGER_GROUPS))
+               .values_list('pk', flat=True))
+
+
+def precompute(now=None):
+    """Uma consulta para a janela inteira; agrupa por dono em memória e grava tudo no cache."""
+    now = now or timezone.now()
+    # versão lida antes da consulta: uma gravação no meio invalida o que for escrito aqui
+    ver = version()
+    rows = list(_upcoming(now))
+    by_owner = {}
+    for r in rows:
+        by_owner.setdefault(r['owner_id'], []).append(r)
+    User = get_user_model()
+    user_ids = set(User.objects.filter(is_active=True).values_list('pk', flat=True))
+    managers = _manager_ids()
+    everyone = _payload(rows, now)
+    values = {
+        cache_key(uid, ver): everyone if uid in managers else _payload(by_owner.get(uid, []), now)
+        for uid in user_ids
+    }
+    cache.set_many(values, CACHE_TTL)
+    return len(values)
+
+
+def build_for(user, now=None):
+    now = now or timezone.now()
+    qs = _upcoming(now)
+    if not rbac.is_manager(user):
+        qs = qs.filter(owner_id=user.pk)
+    return _payload(list(qs[:LIMIT]), now)
+
+
+def get_alerts(user):
+    """Payload do usuário; só recalcula (e regrava) se a chave expirou."""
+    key = cache_key(user.pk, version())
+    payload = cache.get(key)
+    if payload is None:
+        payload = build_for(user)
+        cache.set(key, payload, CACHE_TTL)
+    return payload
@@ -2,3 +2,6 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
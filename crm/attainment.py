@@ -0,0 +1,204 @@
+"""
+Atingimento da meta mensal (Assignment.monthly_target) por representante,
+território e médico: visitas concluídas no mês contra a meta.
+
+- Um único GROUP BY com TruncMonth cobre todos os meses pedidos que não
+  estão no cache; o resto é agregação em memória.
+- Cada mês fica no cache com uma versão própria. Salvar/excluir uma visita
+  incrementa só a versão do(s) mês(es) tocado(s) (na prática, o corrente),
+  então os meses fechados continuam servidos do cache.
+- Mudanças de atribuição (metas, representantes) invalidam tudo via `gen`.
+
+Só conta a visita do próprio representante (Appointment.owner) ao médico
+atribuído; visitas acima da meta não compensam outros médicos.
+"""
+from datetime import date, datetime, time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from greens_scheduler import db
+
+CACHE_TTL = 7 * 24 * 3600
+MAX_MONTHS = 24
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, n):
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+def parse_month(value):
+    """'AAAA-MM' -> date do dia 1; None se inválido."""
+    try:
+        y, m = value.split('-')
+        return date(int(y), int(m), 1)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _gen():
+    return cache.get('attainment:gen', 0)
+
+
+def _version_key(month):
+    return f'attainment:ver:{month:%Y-%m}'
+
+
+def _data_key(month, version, gen):
+    return f'attainment:{month:%Y-%m}:v{version}:g{gen}'
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_months(months):
+    for month in set(months):
+        _incr(_version_key(month))
+
+
+def invalidate_all():
+    _incr('attainment:gen')
+
+
+def mark_dirty(*whens):
+    """Chamado pelos signals de Appointment: invalida os meses das datas (antiga e nova) após o commit."""
+    months = {month_start(timezone.localtime(w).date()) for w in whens if w is not None}
+    if months:
+        transaction.on_commit(lambda: invalidate_months(months))
+
+
+def _bounds(month):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(month, time.min), tz)
+    end = timezone.make_aware(datetime.combine(add_months(month, 1), time.min), tz)
+    return start, end
+
+
+def compute(months):
+    """
+    Calcula os meses pedidos (lista de date dia 1) em uma consulta de visitas
+    e uma de atribuições. Retorna {month: payload}.
+    """
+    from .models import Appointment, Assignment
+
+    months = sorted(set(months))
+    if not months:
+        return {}
+    lo, _ = _bounds(months[0])
+    _, hi = _bounds(months[-1])
+    wanted = set(months)
+
+    done = {}
+    rows = (
+        Appointment.objects.filter(status='concluida', when__gte=lo, when__lt=hi, owner__isnull=False)
+        .annotate(month=TruncMonth('when'))
+        .values('month', 'owner_id', 'doctor_id')
+        .annotate(n=Count('id'))
+        .values_list('month', 'owner_id', 'doctor_id', 'n')
+    )
+    for month, owner_id, doctor_id, n in rows:
+        month = month.date() if isinstance(month, datetime) else month
+        if month in wanted:
+            done[(month, owner_id, doctor_id)] = n
+
+    # atribuições vigentes em algum momento do intervalo; o recorte por mês é feito abaixo
+    assignments = list(
+        Assignment.objects.filter(Q(end__isnull=True) | Q(end__gte=months[0]), start__lt=add_months(months[-1], 1))
+        .values_list('representative_id', 'representative__user_id', 'territory_id', 'physician_id',
+                     'monthly_target', 'start', 'end', 'active')
+    )
+    result = {}
+    for month in months:
+        nxt = add_months(month, 1)
+        is_current = month == month_start(timezone.localdate())
+        reps = {}
+        doctors = []
+        for rep_id, user_id, terr_id, doctor_id, target, start, end, active in assignments:
+            if start >= nxt or (end is not None and end < month):
+                continue
+            if is_current and not active:
+                continue
+            n = min(done.get((month, user_id, doctor_id), 0), target)
+            rep = reps.setdefault(rep_id, {'target': 0, 'done': 0, 'territories': {}})
+            terr = rep['territories'].setdefault(terr_id, {'target': 0, 'done': 0})
+            for bucket in (rep, terr):
+                bucket['target'] += target
+                bucket['done'] += n
+            doctors.append((rep_id, terr_id, doctor_id, target, n))
+        result[month] = {
+            'month': f'{month:%Y-%m}',
+            'target': sum(r['target'] for r in reps.values()),
+            'done': sum(r['done'] for r in reps.values()),
+            'reps': reps,
+            'doctors': doctors,
+        }
+    return result
+
+
+def get_months(months):
+    """Payloads dos meses, do cache quando possível; os ausentes são calculados juntos."""
+    months = sorted(set(months))
+    gen = _gen()
+    versions = cache.get_many([_version_key(m) for m in months])
+    keys = {m: _data_key(m, versions.get(_version_key(m), 0), gen) for m in months}
+    cached = cache.get_many(list(keys.values()))
+    out = {m: cached[k] for m, k in keys.items() if k in cached}
+    missing = [m for m in months if m not in out]
+    if missing:
+        with db.primary():  # guardado por dias sob a versão atual: não ler de réplica atrasada
+            fresh = compute(missing)
+        cache.set_many({keys[m]: fresh[m] for m in missing}, CACHE_TTL)
+        out.update(fresh)
+    return out
+
+
+def pct(done, target):
+    return round(100 * done / target, 1) if target else None
+
+
+def rep_rows(payload, rep_ids=None):
+    """Linhas por representante (ordenadas do menor atingimento para o maior)."""
+    rows = [
+        {'rep_id': rep_id, 'target': r['target'], 'done': r['done'], 'pct': pct(r['done'], r['target'])}
+        for rep_id, r in payload['reps'].items()
+        if rep_ids is None or rep_id in rep_ids
+    ]
+    rows.sort(key=lambda r: (r['pct'] if r['pct'] is not None else 101, r['rep_id']))
+    return rows
+
+
+def territory_rows(payload, rep_ids=None):
+    return [
+        {'rep_id': rep_id, 'territory_id': terr_id, 'target': t['target'], 'done': t['done'],
+         'pct': pct(t['done'], t['target'])}
+        for rep_id, r in payload['reps'].items()
+        if rep_ids is None or rep_id in rep_ids
+        for terr_id, t in r['territories'].items()
+    ]
+
+
+def doctor_rows(payload, rep_ids=None, pending_only=False):
+    return [
+        {'rep_id': rep_id, 'territory_id': terr_id, 'doctor_id': doctor_id, 'target': target, 'done': done,
+         'pct': pct(done, target)}
+        for rep_id, terr_id, doctor_id, target, done in payload['doctors']
+        if (rep_ids is None or rep_id in rep_ids) and not (pending_only and done >= target)
+    ]
+
+
+def recent_months(count, until=None):
+    last = month_start(until or timezone.localdate())
+    return [add_months(last, -i) for i in range(count - 1, -1, -1)]
+
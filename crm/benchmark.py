@@ -0,0 +1,178 @@
+"""
+Benchmark das telas e APIs mais usadas (comando `benchmark`).
+
+Para cada endpoint e papel (gestor e representante da base sintética,
+crm.synthetic) faz um request frio (depois de limpar o cache default) e
+N requests quentes pelo test Client, dentro do processo: mede latência
+(p50/p95), número de queries (via greens_scheduler.profiling, todas as
+conexões) e tamanho da resposta, consumindo também as respostas em stream.
+
+O resultado vira um JSON de baseline; `compare` aponta regressões: mais
+queries que o baseline, ou p95 acima da tolerância (relativa e absoluta,
+para não acusar ruído em endpoints de poucos milissegundos).
+"""
+import json
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from greens_scheduler import profiling
+
+from .models import Appointment
+from .synthetic import USER_PREFIX
+
+
+def _calendar_window():
+    # grade mensal do FullCalendar: do domingo antes do dia 1 até 6 semanas depois
+    first = timezone.localdate().replace(day=1)
+    start = first - timedelta(days=(first.weekday() + 1) % 7)
+    return {'start': f'{start:%Y-%m-%d}T00:00:00', 'end': f'{start + timedelta(days=42):%Y-%m-%d}T00:00:00'}
+
+
+# (nome, url name, parâmetros, papéis)
+ENDPOINTS = (
+    ('dashboard', 'dashboard', None, ('gestor', 'rep')),
+    ('api_events', 'api_events', _calendar_window, ('gestor', 'rep')),
+    ('api_alerts', 'api_alerts', None, ('gestor', 'rep')),
+    ('api_deals', 'api_deals', None, ('gestor', 'rep')),
+    ('contacts', 'contacts', None, ('gestor', 'rep')),
+    ('report_list', 'report_list', None, ('gestor', 'rep')),
+    ('deal_kanban', 'deal_kanban', None, ('gestor', 'rep')),
+    ('admin_appointments', 'admin:crm_appointment_changelist', None, ('gestor',)),
+    ('admin_doctors', 'admin:crm_doctor_changelist', None, ('gestor',)),
+    ('admin_deals', 'admin:crm_deal_changelist', None, ('gestor',)),
+    ('admin_reports', 'admin:crm_visitreport_changelist', None, ('gestor',)),
+)
+P95_TOLERANCE = 0.25
+P95_SLACK_MS = 5.0
+
+
+def _host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def _users():
+    User = get_user_model()
+    manager = User.objects.filter(username=f'{USER_PREFIX}gestor').first()
+    rep = User.objects.filter(username__startswith=f'{USER_PREFIX}rep').order_by('pk').first()
+    if manager is None or rep is None:
+        raise LookupError('base sintética não encontrada (rode generate_synthetic)')
+    return {'gestor': manager, 'rep': rep}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+def _request(client, url, params):
+    profile, stack = profiling.start()
+    start = time.perf_counter()
+    with stack:
+        response = client.get(url, params or {})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+    elapsed = (time.perf_counter() - start) * 1000
+    return response.status_code, elapsed, profile.queries, len(body)
+
+
+def run(iterations=20, warmup=2, only=None, out=None):
+    """{'papel:endpoint': {status, cold_ms, cold_queries, p50_ms, p95_ms, queries, bytes}}."""
+    users = _users()
+    clients = {}
+    for role, user in users.items():
+        clients[role] = Client(HTTP_HOST=_host())
+        clients[role].force_login(user)
+    results = {}
+    for name, url_name, params, roles in ENDPOINTS:
+        if only and name not in only:
+            continue
+        url = reverse(url_name)
+        for role in roles:
+            client = clients[role]
+            query = params() if params else None
+            cache.clear()
+            status, cold_ms, cold_queries, _ = _request(client, url, query)
+            for _ in range(warmup):
+                _request(client, url, query)
+            times, queries, size = [], [], 0
+            for _ in range(iterations):
+                status, elapsed, n, size = _request(client, url, query)
+                times.append(elapsed)
+                queries.append(n)
+            key = f'{role}:{name}'
+            results[key] = {
+                'status': status,
+                'cold_ms': round(cold_ms, 1),
+                'cold_queries': cold_queries,
+                'p50_ms': round(percentile(times, 0.5), 1),
+                'p95_ms': round(percentile(times, 0.95), 1),
+                'queries': max(queries),
+                'bytes': size,
+            }
+            if out:
+                r = results[key]
+                out(f"{key:<28} {r['status']}  p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  "
+                    f"frio {r['cold_ms']:>8.1f} ms  queries {r['queries']:>3} (frio {r['cold_queries']})  "
+                    f"{r['bytes']} bytes")
+    return results
+
+
+def meta(iterations):
+    return {
+        'appointments': Appointment.objects.count(),
+        'vendor': connection.vendor,
+        'created': timezone.now().isoformat(timespec='seconds'),
+        'iterations': iterations,
+    }
+
+
+def save(path, results, info):
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({'meta': info, 'results': results}, fh, indent=2, ensure_ascii=False, sort_keys=True)
+        fh.write('\n')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def compare(baseline, results, tolerance=P95_TOLERANCE, slack_ms=P95_SLACK_MS):
+    """Lista de regressões (texto) de `results` contra o JSON de baseline."""
+    problems = []
+    for key, now in sorted(results.items()):
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        if now['status'] != base['status']:
+            problems.append(f"{key}: status {base['status']} -> {now['status']}")
+        for field in ('queries', 'cold_queries'):
+            if now[field] > base[field]:
+                problems.append(f"{key}: {field} {base[field]} -> {now[field]}")
+        limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + slack_ms)
+        if now['p95_ms'] > limit:
+            problems.append(f"{key}: p95 {base['p95_ms']} ms -> {now['p95_ms']} ms (limite {limit:.1f} ms)")
+    return problems
+
+
+def scale_warnings(baseline, info):
+    """Avisos quando o baseline foi medido em outra escala ou outro banco."""
+    warnings = []
+    base = baseline.get('meta', {})
+    if base.get('vendor') and base['vendor'] != info['vendor']:
+        warnings.append(f"baseline medido em {base['vendor']}, agora {info['vendor']}")
+    n = base.get('appointments')
+    if n and abs(info['appointments'] - n) > 0.1 * n:
+        warnings.append(f"baseline com {n} visitas, agora {info['appointments']}")
+    return warnings
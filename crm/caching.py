@@ -0,0 +1,78 @@
+"""
+Chaves versionadas para cache de fragmentos e views (no cache default).
+
+Cada nome ("doctor", "visibility") tem um contador de versão, global ou
+por escopo (ex.: representante). As chaves dos fragmentos incluem as
+versões que os afetam; os signals só incrementam o contador e o conteúdo
+antigo deixa de ser lido (expira sozinho pelo TTL), sem varrer o cache.
+
+Os contadores usam o prefixo "ver:", que o TieredCache nunca guarda no L1:
+assim uma invalidação feita por um processo vale na hora para todos.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+
+from greens_scheduler import db
+
+VERSION_PREFIX = 'ver:'
+FRAGMENT_TTL = 600
+
+
+def version_key(name, scope=None):
+    return f'{VERSION_PREFIX}{name}' if scope is None else f'{VERSION_PREFIX}{name}:{scope}'
+
+
+def bump(name, scope=None):
+    """Incrementa o contador e devolve o valor novo."""
+    key = version_key(name, scope)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+def bump_on_commit(name, scope=None):
+    transaction.on_commit(lambda: bump(name, scope))
+
+
+def versions(*specs):
+    """
+    Versões atuais em uma ida ao cache. specs: nomes ou (nome, escopo).
+    Retorna uma string estável para compor chaves, ex. "doctor.3-visibility:7.1".
+    """
+    keys = [version_key(*((s,) if isinstance(s, str) else s)) for s in specs]
+    found = cache.get_many(keys)
+    return '-'.join(f"{k[len(VERSION_PREFIX):]}.{found.get(k, 0)}" for k in keys)
+
+
+def doctor_scope(access):
+    """Escopo de médicos visíveis do usuário e as versões que o invalidam."""
+    if access.is_manager:
+        return 'all', versions('doctor')
+    if access.rep_id:
+        return f'rep{access.rep_id}', versions('doctor', ('visibility', access.rep_id))
+    return f'user{access.user.pk}', versions('doctor')
+
+
+def fragment_key(*parts):
+    raw = ':'.join(str(p) for p in parts)
+    if len(raw) > 200:
+        raw = hashlib.sha1(raw.encode()).hexdigest()
+    return f'frag:{raw}'
+
+
+def cached_fragment(key, builder, ttl=FRAGMENT_TTL):
+    """
+    HTML (ou outro valor) do cache; em miss chama builder() e guarda. O
+    builder lê do primário: a chave já tem a versão nova, e um valor vindo
+    de uma réplica atrasada ficaria guardado por todo o TTL.
+    """
+    value = cache.get(key)
+    if value is None:
+        with db.primary():
+            value = builder()
+        cache.set(key, value, ttl)
+    return value
@@ -0,0 +1,211 @@
+"""
+Sincronização das visitas com a agenda externa via outbox (CalendarOutbox).
+
+- A linha do outbox é gravada pelos signals na mesma transação da visita;
+  o request nunca espera a API externa.
+- O worker drena em lotes; várias edições da mesma visita viram uma chamada
+  (vale o estado mais recente), com limite de chamadas por segundo.
+- Falhas transitórias voltam para a fila com backoff exponencial; depois de
+  MAX_ATTEMPTS a linha fica como 'failed' com o último erro.
+- Linhas enviadas ou substituídas são apagadas: o outbox só guarda o que
+  ainda falta enviar e as falhas definitivas.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .google_calendar import event_id, get_client
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30         # segundos; dobra a cada tentativa
+BACKOFF_MAX = 3600
+SEND_LEASE = timedelta(minutes=10)   # prazo de uma linha 'sending' antes de voltar à fila
+
+_pending = threading.local()
+
+
+def enabled():
+    return getattr(settings, 'GOOGLE_CALENDAR_SYNC', False)
+
+
+def event_payload(appt):
+    start = appt.when
+    return {
+        'summary': f'Visita: {appt.doctor.name}',
+        'description': appt.notes or '',
+        'start': {'dateTime': start.isoformat(), 'timeZone': settings.TIME_ZONE},
+        'end': {'dateTime': appt.ends_at.isoformat(), 'timeZone': settings.TIME_ZONE},
+    }
+
+
+def _entry(appt, action):
+    from .models import CalendarOutbox
+    payload = event_payload(appt) if action == CalendarOutbox.ACTION_UPSERT else {}
+    return CalendarOutbox(appointment_id=appt.pk, action=action, payload=payload)
+
+
+def enqueue(appt, action):
+    """Grava a linha do outbox (um INSERT) e agenda o worker para depois do commit."""
+    if not enabled():
+        return None
+    entry = _entry(appt, action)
+    entry.save()
+    kick()
+    return entry
+
+
+def enqueue_many(appts, action='upsert'):
+    """Versão em lote para bulk_create/bulk_update (que não disparam signals)."""
+    from .models import CalendarOutbox
+    if not enabled() or not appts:
+        return []
+    entries = CalendarOutbox.objects.bulk_create([_entry(a, action) for a in appts], batch_size=500)
+    kick()
+    return entries
+
+
+def _run_worker():
+    if not getattr(_pending, 'dirty', False):
+        return
+    _pending.dirty = False
+    from .tasks import sync_calendar
+    try:
+        sync_calendar.delay()
+    except Exception:
+        # broker fora do ar: o beat drena o outbox na próxima rodada
+        logger.warning('não foi possível agendar sync_calendar', exc_info=True)
+
+
+def kick():
+    """Um disparo do worker por transação, por mais visitas que ela altere."""
+    _pending.dirty = True
+    transaction.on_commit(_run_worker)
+
+
+class RateLimiter:
+    """Espaça as chamadas para no máximo `rate` por segundo (por processo)."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def _send(client, entry):
+    eid = event_id(entry.appointment_id)
+    key = f'{eid}:{entry.pk}'
+    if entry.action == entry.ACTION_DELETE:
+        client.delete_event(eid, idempotency_key=key)
+    else:
+        client.upsert_event(eid, entry.payload, idempotency_key=key)
+
+
+def _claim(batch_size):
+    """
+    Transação curta: trava as linhas vencidas (skip_locked), apaga as
+    substituídas e marca a mais recente de cada visita como 'sending'.
+    Retorna (linhas a enviar, linhas coalescidas).
+    """
+    from .models import CalendarOutbox
+    with transaction.atomic():
+        now = timezone.now()
+        # visita com envio em andamento em outro worker espera a vez (a ordem importa)
+        in_flight = CalendarOutbox.objects.filter(status='sending').values('appointment_id')
+        batch = list(
+            CalendarOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .exclude(appointment_id__in=in_flight)
+            .order_by('id')[:batch_size]
+        )
+        if not batch:
+            return [], 0
+        latest = {}
+        for entry in batch:
+            latest[entry.appointment_id] = entry   # ordenado por id: fica o mais recente
+        keep = {e.pk for e in latest.values()}
+
+        # linhas antigas da mesma visita (inclusive em backoff) ficam obsoletas;
+        # as travadas por outro worker ficam para a próxima rodada em vez de bloquear
+        superseded = list(
+            CalendarOutbox.objects.select_for_update(skip_locked=True).filter(status='pending').filter(
+                reduce(or_, (Q(appointment_id=a, id__lt=e.pk) for a, e in latest.items()))
+            ).exclude(pk__in=keep).values_list('pk', flat=True)
+        )
+        coalesced = CalendarOutbox.objects.filter(pk__in=superseded).delete()[0]
+
+        # o prazo em next_attempt_at devolve a linha à fila se o worker morrer no meio do envio
+        CalendarOutbox.objects.filter(pk__in=keep).update(status='sending', next_attempt_at=now + SEND_LEASE)
+    return list(latest.values()), coalesced
+
+
+def flush(batch_size=BATCH_SIZE, client=None, rate=None):
+    """
+    Drena o outbox. Retorna um dict com as contagens de chamadas enviadas,
+    linhas coalescidas, reagendadas e com falha definitiva.
+
+    Cada lote é reservado numa transação curta, enviado fora dela (a API e o
+    limite de taxa não seguram travas) e o resultado gravado numa segunda
+    transação curta. Linhas enviadas ou substituídas são apagadas; só as
+    que falharam de vez ficam na tabela, com o último erro.
+    """
+    from .models import CalendarOutbox
+    client = client or get_client()
+    limiter = RateLimiter(rate if rate is not None else getattr(settings, 'GOOGLE_CALENDAR_RATE', 5))
+    stats = {'sent': 0, 'coalesced': 0, 'retried': 0, 'failed': 0}
+    # envios interrompidos (worker morto) voltam para a fila quando o prazo vence
+    CalendarOutbox.objects.filter(status='sending', next_attempt_at__lte=timezone.now()).update(status='pending')
+    while True:
+        batch, coalesced = _claim(batch_size)
+        stats['coalesced'] += coalesced
+        if not batch:
+            break
+
+        done, retry = [], []
+        for entry in batch:
+            limiter.wait()
+            try:
+                _send(client, entry)
+            except Exception as exc:
+                retryable = getattr(exc, 'retryable', True)
+                entry.attempts += 1
+                entry.last_error = str(exc)[:2000]
+                if retryable and entry.attempts < MAX_ATTEMPTS:
+                    entry.status, entry.next_attempt_at = 'pending', timezone.now() + backoff(entry.attempts)
+                    stats['retried'] += 1
+                else:
+                    entry.status, entry.processed_at = 'failed', timezone.now()
+                    stats['failed'] += 1
+                    logger.error('sync da visita %s falhou: %s', entry.appointment_id, exc)
+                retry.append(entry)
+            else:
+                done.append(entry.pk)
+
+        with transaction.atomic():
+            CalendarOutbox.objects.filter(pk__in=done).delete()
+            CalendarOutbox.objects.bulk_update(
+                retry, ['attempts', 'last_error', 'next_attempt_at', 'status', 'processed_at']
+            )
+        stats['sent'] += len(done)
+    return stats
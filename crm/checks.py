@@ -0,0 +1,38 @@
+"""
+Checks do Django que dependem do banco (rodam com `manage.py check --database default`
+e no início do `migrate`).
+"""
+from django.core.checks import Tags, Warning, register
+from django.db import DatabaseError, connections
+
+
+@register(Tags.database)
+def overlap_constraints(app_configs=None, databases=None, **kwargs):
+    """crm.W001: constraints de exclusão da 0015 ausentes (havia sobreposições ou faltou btree_gist)."""
+    from .conflicts import CONSTRAINTS
+
+    errors = []
+    for alias in databases or ():
+        conn = connections[alias]
+        if conn.vendor != 'postgresql':
+            continue
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM django_migrations WHERE app = 'crm' AND name = '0015_appointment_duration'"
+                )
+                if cursor.fetchone() is None:
+                    continue
+                cursor.execute('SELECT conname FROM pg_constraint WHERE conname = ANY(%s)', [list(CONSTRAINTS)])
+                present = {row[0] for row in cursor.fetchall()}
+        except DatabaseError:
+            continue
+        missing = sorted(set(CONSTRAINTS) - present)
+        if missing:
+            errors.append(Warning(
+                f"Constraints de sobreposição ausentes em '{alias}': {', '.join(missing)}.",
+                hint='Resolva as visitas sobrepostas (`manage.py appointment_conflicts`) e instale com '
+                     '`manage.py appointment_conflicts --install`.',
+                id='crm.W001',
+            ))
+    return errors
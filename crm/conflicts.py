@@ -0,0 +1,157 @@
+"""
+Detecção de sobreposição de visitas (mesmo representante ou mesmo médico).
+
+Dois intervalos [início, fim) se sobrepõem quando a.when < b.ends_at e
+a.ends_at > b.when. Como a duração é limitada (MAX_DURATION_MINUTES), a busca
+também exige when > início - duração máxima: vira um range scan nos índices
+(dono|médico, when, ends_at), sem varrer o histórico inteiro.
+
+No Postgres, as constraints de exclusão (btree_gist) instaladas pela
+migração 0015 garantem o mesmo no banco, inclusive em corridas entre requests.
+Se a migração as pulou (sobreposições já existentes), o check crm.W001 avisa.
+"""
+import logging
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import MAX_DURATION_MINUTES, Appointment
+
+logger = logging.getLogger(__name__)
+
+MAX_DURATION = timedelta(minutes=MAX_DURATION_MINUTES)
+ACTIVE = ~Q(status='cancelada')
+
+CONSTRAINTS = {
+    'appt_owner_no_overlap': 'owner_id',
+    'appt_doctor_no_overlap': 'doctor_id',
+}
+
+
+def _window(start, end):
+    return Q(when__lt=end, when__gt=start - MAX_DURATION, ends_at__gt=start)
+
+
+def overlapping(start, end, owner_id=None, doctor_id=None, exclude_pk=None):
+    """Visitas ativas do dono ou do médico que se sobrepõem a [start, end)."""
+    who = Q()
+    if owner_id:
+        who |= Q(owner_id=owner_id)
+    if doctor_id:
+        who |= Q(doctor_id=doctor_id)
+    if not who:
+        return Appointment.objects.none()
+    qs = Appointment.objects.filter(ACTIVE, _window(start, end)).filter(who)
+    if exclude_pk:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs
+
+
+def for_appointment(appt):
+    """Conflitos da visita (ainda não salva ou editada); canceladas nunca conflitam."""
+    if appt.status == 'cancelada':
+        return Appointment.objects.none()
+    return overlapping(appt.when, appt.compute_end(), appt.owner_id, appt.doctor_id, appt.pk)
+
+
+def describe(qs, limit=5):
+    return [
+        {'id': pk, 'doctor': name, 'start': when.isoformat(), 'end': ends_at.isoformat()}
+        for pk, name, when, ends_at in qs.order_by('when').values_list('pk', 'doctor__name', 'when', 'ends_at')[:limit]
+    ]
+
+
+def check_slots(slots):
+    """
+    Valida muitos horários propostos com uma única consulta.
+    slots: [{'owner_id', 'doctor_id', 'start', 'end'}]. Retorna {índice: motivo},
+    considerando tanto as visitas gravadas quanto os outros itens do próprio lote.
+    """
+    if not slots:
+        return {}
+    owners = {s['owner_id'] for s in slots if s.get('owner_id')}
+    doctors = {s['doctor_id'] for s in slots if s.get('doctor_id')}
+    lo = min(s['start'] for s in slots)
+    hi = max(s['end'] for s in slots)
+    rows = Appointment.objects.filter(ACTIVE, _window(lo, hi)).filter(
+        Q(owner_id__in=owners) | Q(doctor_id__in=doctors)
+    ).values_list('owner_id', 'doctor_id', 'when', 'ends_at')
+
+    # por chave, intervalos ordenados pelo início
+    spans = defaultdict(list)
+    for owner_id, doctor_id, start, end in rows.iterator(chunk_size=2000):
+        if owner_id in owners:
+            insort(spans[('owner', owner_id)], (start, end))
+        if doctor_id in doctors:
+            insort(spans[('doctor', doctor_id)], (start, end))
+
+    errors = {}
+    for i, slot in enumerate(slots):
+        keys = [k for k in (('owner', slot.get('owner_id')), ('doctor', slot.get('doctor_id'))) if k[1]]
+        for kind, ref in keys:
+            intervals = spans[(kind, ref)]
+            # candidatos: começam antes do fim do slot e no máximo MAX_DURATION antes do início
+            j = bisect_left(intervals, (slot['start'] - MAX_DURATION,))
+            while j < len(intervals) and intervals[j][0] < slot['end']:
+                if intervals[j][1] > slot['start']:
+                    errors[i] = 'conflict with owner schedule' if kind == 'owner' else 'conflict with doctor schedule'
+                    break
+                j += 1
+            if i in errors:
+                break
+        if i not in errors:
+            for key in keys:
+                insort(spans[key], (slot['start'], slot['end']))
+    return errors
+
+
+def existing_conflicts(field='owner_id'):
+    """Visitas ativas que já se sobrepõem a outra (para limpar antes de instalar a constraint)."""
+    other = Appointment.objects.filter(
+        ACTIVE, **{field: OuterRef(field)},
+        when__lt=OuterRef('ends_at'), ends_at__gt=OuterRef('when'),
+    ).exclude(pk=OuterRef('pk'))
+    return Appointment.objects.filter(ACTIVE).exclude(**{f'{field}__isnull': True}).filter(Exists(other))
+
+
+def install_constraints(conn=None):
+    """
+    Cria as constraints de exclusão no Postgres. Pula (com aviso) as que
+    já teriam violações, para não travar a migração; rode
+    `manage.py appointment_conflicts --install` depois de resolver.
+    Retorna os nomes instalados.
+    """
+    conn = conn or connection
+    if conn.vendor != 'postgresql':
+        return []
+    installed = []
+    with conn.cursor() as cursor:
+        try:
+            with transaction.atomic(using=conn.alias):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        except Exception:
+            logger.warning('btree_gist indisponível; sobreposição só é checada pela aplicação', exc_info=True)
+            return []
+        for name, column in CONSTRAINTS.items():
+            cursor.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', [name])
+            if cursor.fetchone():
+                installed.append(name)
+                continue
+            if existing_conflicts(column).using(conn.alias).exists():
+                logger.warning('%s não instalada: já existem visitas sobrepostas (%s)', name, column)
+                continue
+            cursor.execute(
+                f'ALTER TABLE crm_appointment ADD CONSTRAINT {name} EXCLUDE USING gist '
+                f'({column} WITH =, tstzrange("when", ends_at, \'[)\') WITH &&) '
+                f"WHERE (status <> 'cancelada' AND {column} IS NOT NULL)"
+            )
+            installed.append(name)
+    return installed
+
+
+def is_overlap_violation(exc):
+    """IntegrityError vindo de uma das constraints de exclusão (corrida entre requests)."""
+    return any(name in str(exc) for name in CONSTRAINTS)
@@ -0,0 +1,175 @@
+"""
+Rollup de cobertura do dashboard.
+
+Cada linha de CoverageRollup guarda, para um dia e um escopo (geral,
+representante ou representante+território), os médicos atribuídos, os
+visitados e o total de visitas nos últimos 30 dias. O rebuild da madrugada
+recalcula o dia inteiro; durante o dia os signals só aplicam deltas às
+linhas de hoje (+1/-1 em visitas, e em visitados quando o médico ganha a
+primeira ou perde a última visita da janela). Mudanças de atribuição
+recalculam só os escopos do representante. O dashboard lê uma linha.
+
+Deltas aplicados por transações concorrentes podem divergir por uma
+unidade; o rebuild do dia seguinte corrige.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Appointment, Assignment, CoverageRollup, Doctor, DoctorVisibility
+
+WINDOW_DAYS = 30
+
+
+def _today():
+    return timezone.localdate()
+
+
+def _cutoff(day):
+    start = datetime.combine(day - timedelta(days=WINDOW_DAYS), time.min)
+    return timezone.make_aware(start, timezone.get_current_timezone())
+
+
+def compute(rep_id=None, territory_id=None, day=None):
+    day = day or _today()
+    cutoff = _cutoff(day)
+    if rep_id is None:
+        doctors = Doctor.objects.all()
+        appts = Appointment.objects.filter(when__gte=cutoff)
+    else:
+        if territory_id is None:
+            doctor_ids = DoctorVisibility.objects.filter(representative_id=rep_id).values('doctor_id')
+        else:
+            doctor_ids = Assignment.objects.filter(
+                representative_id=rep_id, territory_id=territory_id, active=True
+            ).values('physician_id')
+        doctors = Doctor.objects.filter(pk__in=doctor_ids)
+        appts = Appointment.objects.filter(doctor_id__in=doctor_ids, when__gte=cutoff)
+    return {
+        'assigned': doctors.count(),
+        'visited': appts.values('doctor_id').distinct().count(),
+        'visits_30d': appts.count(),
+    }
+
+
+def refresh(rep_id=None, territory_id=None, day=None):
+    day = day or _today()
+    row, _ = CoverageRollup.objects.update_or_create(
+        day=day, representative_id=rep_id, territory_id=territory_id,
+        defaults=compute(rep_id, territory_id, day),
+    )
+    return row
+
+
+def get_rollup(rep_id=None, territory_id=None):
+    """
+    Linha mais recente do escopo (a de hoje depois do rebuild). Só leitura:
+    sem nenhuma linha ainda (antes do primeiro rebuild), calcula sem gravar.
+    """
+    row = CoverageRollup.objects.filter(
+        day__lte=_today(), representative_id=rep_id, territory_id=territory_id
+    ).order_by('-day').first()
+    if row is None:
+        row = CoverageRollup(day=_today(), representative_id=rep_id, territory_id=territory_id,
+                             **compute(rep_id, territory_id))
+    return row
+
+
+def _refresh_rep(rep_id, day):
+    territory_ids = set(
+        Assignment.objects.filter(representative_id=rep_id).values_list('territory_id', flat=True)
+    )
+    CoverageRollup.objects.filter(day=day, representative_id=rep_id, territory__isnull=False) \
+        .exclude(territory_id__in=territory_ids).delete()
+    refresh(rep_id, day=day)
+    for tid in territory_ids:
+        refresh(rep_id, tid, day=day)
+
+
+def rebuild(day=None):
+    """Reconstrói todas as linhas do dia (comando `rebuild_coverage` / beat noturno)."""
+    day = day or _today()
+    with transaction.atomic():
+        CoverageRollup.objects.filter(day=day).delete()
+        refresh(day=day)
+        rep_ids = Assignment.objects.values_list('representative_id', flat=True).distinct()
+        for rep_id in rep_ids:
+            _refresh_rep(rep_id, day)
+    return CoverageRollup.objects.filter(day=day).count()
+
+
+# -----------------------------
+# Deltas (signals)
+# -----------------------------
+def _apply(day, deltas):
+    """deltas: {(rep_id, territory_id): Counter(campo=n)} -> um UPDATE por escopo, nunca abaixo de zero."""
+    for (rep_id, territory_id), delta in deltas.items():
+        values = {name: Greatest(F(name) + n, Value(0)) for name, n in delta.items() if n}
+        if values:
+            CoverageRollup.objects.filter(
+                day=day, representative_id=rep_id, territory_id=territory_id
+            ).update(**values)
+
+
+def apply_visits(visits, day):
+    """
+    visits: {doctor_id: saldo de visitas na janela}. Conta as visitas atuais
+    só desses médicos para saber quem passou a ter (ou deixou de ter) visita,
+    e soma nos escopos geral, dos representantes e dos territórios deles.
+    """
+    cutoff = _cutoff(day)
+    current = dict(
+        Appointment.objects.filter(doctor_id__in=visits, when__gte=cutoff)
+        .values('doctor_id').annotate(n=Count('pk')).values_list('doctor_id', 'n')
+    )
+    per_doctor = {}
+    for doctor_id, n in visits.items():
+        after = current.get(doctor_id, 0)
+        per_doctor[doctor_id] = Counter(visits_30d=n, visited=int(after > 0) - int(after - n > 0))
+
+    scopes = {(None, None): set(visits)}
+    for rep_id, doctor_id in DoctorVisibility.objects.filter(doctor_id__in=visits) \
+            .values_list('representative_id', 'doctor_id'):
+        scopes.setdefault((rep_id, None), set()).add(doctor_id)
+    for rep_id, territory_id, doctor_id in Assignment.objects.filter(physician_id__in=visits, active=True) \
+            .values_list('representative_id', 'territory_id', 'physician_id'):
+        scopes.setdefault((rep_id, territory_id), set()).add(doctor_id)
+
+    deltas = defaultdict(Counter)
+    for scope, doctor_ids in scopes.items():
+        for doctor_id in doctor_ids:
+            deltas[scope].update(per_doctor[doctor_id])
+    _apply(day, deltas)
+
+
+def track(changes):
+    """
+    changes: [(doctor_id, when, +1 ou -1)], visita que entra ou sai. Soma o
+    que cai na janela de hoje e aplica depois do commit; mover uma visita
+    dentro da janela para o mesmo médico não gera nada.
+    """
+    day = _today()
+    cutoff = _cutoff(day)
+    visits = Counter()
+    for doctor_id, when, sign in changes:
+        if doctor_id and when is not None and when >= cutoff:
+            visits[doctor_id] += sign
+    visits = {doctor_id: n for doctor_id, n in visits.items() if n}
+    if visits:
+        transaction.on_commit(lambda: apply_visits(visits, day))
+
+
+def doctors_changed(n):
+    """Médicos incluídos (n > 0) ou excluídos (n < 0): só o total do escopo geral muda."""
+    if n:
+        day = _today()
+        transaction.on_commit(lambda: _apply(day, {(None, None): Counter(assigned=n)}))
+
+
+def mark_dirty(rep_id):
+    """Atribuições do representante mudaram: recalcula os escopos dele depois do commit."""
+    transaction.on_commit(lambda: _refresh_rep(rep_id, _today()))
@@ -1,4 +1,6 @@
 from django import forms
+from django.template.loader import render_to_string
+from django.utils import timezone
 from .models import Doctor, Appointment, VisitReport, Organization
 
 class DoctorForm(forms.ModelForm):
@@ -36,26 +38,63 @@ class DoctorForm(forms.ModelForm):
                 raise forms.ValidationError('Já existe um médico com este Nome e CRM.')
         return data
 
+class DoctorPicker(forms.Widget):
+    """
+    Campo de médico com busca (static/js/doctor-picker.js + /api/doctors/lookup/):
+    não renderiza a lista de médicos, só o selecionado.
+    """
+    template = 'includes/doctor_picker.html'
+
+    def __init__(self, attrs=None, placeholder=None, empty_label=None):
+        super().__init__(attrs)
+        self.placeholder = placeholder
+        self.empty_label = empty_label
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        label = ''
+        if value:
+            label = Doctor.objects.filter(pk=value).values_list('name', flat=True).first() or ''
+        return render_to_string(self.template, {
+            'name': name, 'id': attrs.get('id') or f'id_{name}', 'value': value, 'label': label,
+            'placeholder': self.placeholder, 'empty_label': self.empty_label,
+        })
+
 class AppointmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         request = kwargs.pop('request', None)
         super().__init__(*args, **kwargs)
+        self._owner_id = self.instance.owner_id
         if request and getattr(request, 'user', None) and request.user.is_authenticated:
-            try:
-                from .models import Representative
-                rep, _ = Representative.objects.get_or_create(user=request.user)
-                qs = Doctor.objects.filter(assignments__representative=rep, assignments__active=True).distinct()
-                self.fields['doctor'].queryset = qs
-            except Exception:
-                pass
+            from .rbac import for_request
+            self.fields['doctor'].queryset = for_request(request).visible_doctors()
+            self._owner_id = self._owner_id or request.user.pk
 
     when = forms.DateTimeField(label='Data e Hora', widget=forms.DateTimeInput(attrs={'type':'datetime-local','class':'form-control'}))
+
+    def clean(self):
+        data = super().clean()
+        if self.errors:
+            return data
+        from .conflicts import for_appointment
+        appt = self.instance
+        appt.owner_id = appt.owner_id or self._owner_id
+        for field in ('doctor', 'when', 'duration', 'status'):
+            setattr(appt, field, data.get(field))
+        clash = for_appointment(appt).select_related('doctor').first()
+        if clash:
+            raise forms.ValidationError(
+                f'Conflito de horário com {clash.doctor.name} em {timezone.localtime(clash.when):%d/%m/%Y %H:%M}.'
+            )
+        return data
+
     class Meta:
         model = Appointment
-        fields = ['doctor','contact_name','when','status','notes']
+        fields = ['doctor','contact_name','when','duration','status','notes']
         widgets = {
-            'doctor': forms.Select(attrs={'class':'form-select'}),
+            'doctor': DoctorPicker(),
             'contact_name': forms.TextInput(attrs={'class':'form-control'}),
+            'duration': forms.NumberInput(attrs={'class':'form-control', 'min': 5, 'step': 5}),
             'status': forms.Select(attrs={'class':'form-select'}),
             'notes': forms.Textarea(attrs={'class':'form-control', 'rows':3}),
         }
@@ -1,5 +1,137 @@
+"""
+Clientes da agenda externa. O worker (crm.calendar_sync) fala só com esta
+interface; o cliente ativo vem de settings.GOOGLE_CALENDAR_CLIENT.
+
+Os ids dos eventos são determinísticos (ver event_id), então repetir um
+insert depois de uma falha de rede não duplica o evento.
+"""
+import logging
+
 from django.conf import settings
-def add_event_to_google_calendar(title, start, end, description=''):
-    if getattr(settings, 'GOOGLE_CALENDAR_SYNC', False):
-        print('Enviar para Google Calendar:', title, start, end)
-    return None
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class CalendarError(Exception):
+    """Falha ao falar com a agenda. retryable=False desiste sem novas tentativas."""
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def event_id(appointment_id):
+    # Google aceita ids próprios em base32hex (a-v, 0-9), 5 a 1024 caracteres
+    return f'greens{appointment_id:08d}'
+
+
+class CalendarClient:
+    """Interface: upsert/delete idempotentes por event_id."""
+    def upsert_event(self, event_id, event, idempotency_key):
+        raise NotImplementedError
+
+    def delete_event(self, event_id, idempotency_key):
+        raise NotImplementedError
+
+
+class LogClient(CalendarClient):
+    """Padrão em dev: só registra no log o que seria enviado."""
+    def upsert_event(self, event_id, event, idempotency_key):
+        logger.info('Enviar para Google Calendar: %s %s %s', event_id, event.get('summary'), event.get('start'))
+
+    def delete_event(self, event_id, idempotency_key):
+        logger.info('Remover do Google Calendar: %s', event_id)
+
+
+class FakeCalendarClient(CalendarClient):
+    """
+    Agenda em memória para testes e benchmarks. `fail_with` (exceção ou lista
+    de exceções) faz as próximas chamadas falharem, na ordem.
+    """
+    def __init__(self, fail_with=None):
+        self.events = {}
+        self.calls = []
+        self.seen_keys = set()
+        self.fail_with = list(fail_with or [])
+
+    def _call(self, op, event_id, idempotency_key):
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        self.calls.append((op, event_id, idempotency_key))
+        if idempotency_key in self.seen_keys:
+            return False
+        self.seen_keys.add(idempotency_key)
+        return True
+
+    def upsert_event(self, event_id, event, idempotency_key):
+        if self._call('upsert', event_id, idempotency_key):
+            self.events[event_id] = dict(event)
+
+    def delete_event(self, event_id, idempotency_key):
+        if self._call('delete', event_id, idempotency_key):
+            self.events.pop(event_id, None)
+
+
+class GoogleCalendarClient(CalendarClient):
+    """
+    Google Calendar via conta de serviço. Requer google-api-python-client e
+    google-auth (opcionais); credenciais em GOOGLE_CALENDAR_CREDENTIALS.
+    """
+    SCOPES = ['https://www.googleapis.com/auth/calendar.events']
+
+    def __init__(self):
+        try:
+            from google.oauth2 import service_account
+            from googleapiclient.discovery import build
+            from googleapiclient.errors import HttpError
+        except ImportError as exc:
+            raise ImproperlyConfigured('GoogleCalendarClient requer google-api-python-client') from exc
+        creds = service_account.Credentials.from_service_account_file(
+            settings.GOOGLE_CALENDAR_CREDENTIALS, scopes=self.SCOPES
+        )
+        self.calendar_id = settings.GOOGLE_CALENDAR_ID
+        self.events = build('calendar', 'v3', credentials=creds, cache_discovery=False).events()
+        self.HttpError = HttpError
+
+    def _execute(self, request):
+        try:
+            return request.execute(num_retries=0)
+        except self.HttpError as exc:
+            status = exc.resp.status
+            # 429 e 5xx são transitórios; o resto (400, 403 de permissão...) não adianta repetir
+            raise CalendarError(f'HTTP {status}: {exc}', retryable=status == 429 or status >= 500) from exc
+
+    def upsert_event(self, event_id, event, idempotency_key):
+        body = dict(event, id=event_id)
+        try:
+            self._execute(self.events.update(calendarId=self.calendar_id, eventId=event_id, body=body))
+        except CalendarError as exc:
+            if not str(exc).startswith('HTTP 404'):
+                raise
+            self._execute(self.events.insert(calendarId=self.calendar_id, body=body))
+
+    def delete_event(self, event_id, idempotency_key):
+        try:
+            self._execute(self.events.delete(calendarId=self.calendar_id, eventId=event_id))
+        except CalendarError as exc:
+            # já removido (404/410) conta como sucesso
+            if not str(exc).startswith(('HTTP 404', 'HTTP 410')):
+                raise
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        path = getattr(settings, 'GOOGLE_CALENDAR_CLIENT', 'crm.google_calendar.LogClient')
+        _client = import_string(path)()
+    return _client
+
+
+def set_client(client):
+    """Troca o cliente ativo (testes usam FakeCalendarClient). None volta ao configurado."""
+    global _client
+    _client = client
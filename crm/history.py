@@ -0,0 +1,281 @@
+"""
+Retenção das tabelas históricas (simple_history) por mês.
+
+Cada (tabela, mês) é uma partição lógica registrada em HistoryPartition:
+
+- Compactação (meses com mais de HISTORY_COMPACT_AFTER_DAYS): remove as
+  linhas '~' que não mudaram nenhum campo e, em cada sequência de edições do
+  mesmo usuário em até HISTORY_COMPACT_WINDOW minutos (arrastar na agenda,
+  mover no kanban), mantém só a última, com o resumo dos campos alterados no
+  history_change_reason. Criações, exclusões e o estado final de cada
+  sequência ficam; o sync incremental (crm.sync) continua vendo o último
+  evento de cada objeto.
+- Arquivamento (meses além de HISTORY_RETENTION_DAYS): exporta o mês para
+  history/<tabela>/<AAAA-MM>.jsonl.gz no default_storage e apaga as linhas.
+"""
+import gzip
+import json
+import logging
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .attainment import add_months, month_start
+
+logger = logging.getLogger(__name__)
+
+TRACKED = ('Doctor', 'Appointment', 'VisitReport', 'Organization', 'Deal')
+DELETE_BATCH = 2000
+ARCHIVE_PREFIX = 'history'
+
+
+def retention_days():
+    return getattr(settings, 'HISTORY_RETENTION_DAYS', 730)
+
+
+def compact_after_days():
+    return getattr(settings, 'HISTORY_COMPACT_AFTER_DAYS', 30)
+
+
+def compact_window():
+    return timedelta(minutes=getattr(settings, 'HISTORY_COMPACT_WINDOW', 30))
+
+
+def history_models():
+    from django.apps import apps
+    return [apps.get_model('crm', name).history.model for name in TRACKED]
+
+
+def _bounds(month):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(month, time.min), tz)
+    end = timezone.make_aware(datetime.combine(add_months(month, 1), time.min), tz)
+    return start, end
+
+
+def months(hmodel, until):
+    """Meses com histórico, do mais antigo até o mês anterior a `until` (date)."""
+    first = hmodel.objects.aggregate(m=Min('history_date'))['m']
+    if first is None:
+        return []
+    month = month_start(timezone.localtime(first).date())
+    last = month_start(until)
+    out = []
+    while month < last:
+        out.append(month)
+        month = add_months(month, 1)
+    return out
+
+
+def _partition(hmodel, month):
+    from .models import HistoryPartition
+    return HistoryPartition.objects.get_or_create(table=hmodel._meta.db_table, month=month)[0]
+
+
+def _delete(hmodel, ids):
+    removed = 0
+    for i in range(0, len(ids), DELETE_BATCH):
+        removed += hmodel.objects.filter(history_id__in=ids[i:i + DELETE_BATCH]).delete()[0]
+    return removed
+
+
+# -----------------------------
+# Compactação
+# -----------------------------
+def _plan_compaction(rows, fields, window):
+    """
+    rows: linhas de um mês ordenadas por (id, history_date, history_id).
+    Retorna (ids a apagar, {history_id mantido: motivo}).
+    """
+    drop, reasons = [], {}
+    prev = run = None
+
+    def close(run):
+        if run and run['dropped']:
+            drop.extend(run['dropped'])
+            changed = ', '.join(sorted(run['fields']))
+            reasons[run['last']] = f"compactado: {len(run['dropped']) + 1} alterações ({changed})"[:100]
+
+    for row in rows:
+        # criação/exclusão, motivo informado pelo usuário ou outro objeto: fecha a sequência
+        if prev is None or prev['id'] != row['id'] or row['history_type'] != '~' or row['history_change_reason']:
+            close(run)
+            prev, run = row, None
+            continue
+        changed = {f for f in fields if row[f] != prev[f]}
+        if not changed:
+            drop.append(row['history_id'])       # no-op: o estado já está na linha anterior
+            continue
+        if run and run['user'] == row['history_user_id'] and row['history_date'] - run['start'] <= window:
+            run['dropped'].append(run['last'])
+            run['last'] = row['history_id']
+            run['fields'] |= changed
+        else:
+            close(run)
+            run = {'start': row['history_date'], 'user': row['history_user_id'], 'last': row['history_id'],
+                   'dropped': [], 'fields': changed}
+        prev = row
+    close(run)
+    return drop, reasons
+
+
+def compact_month(hmodel, month, dry_run=False):
+    """Compacta um mês de uma tabela histórica. Retorna o número de linhas removidas."""
+    fields = [f.attname for f in hmodel.tracked_fields]
+    start, end = _bounds(month)
+    rows = (
+        hmodel.objects.filter(history_date__gte=start, history_date__lt=end)
+        .order_by('id', 'history_date', 'history_id')
+        .values('history_id', 'id', 'history_type', 'history_date', 'history_user_id',
+                'history_change_reason', *fields)
+    )
+    drop, reasons = _plan_compaction(rows.iterator(chunk_size=5000), fields, compact_window())
+    if dry_run:
+        return len(drop)
+    with transaction.atomic():
+        for history_id, reason in reasons.items():
+            hmodel.objects.filter(history_id=history_id).update(history_change_reason=reason)
+        removed = _delete(hmodel, drop)
+        part = _partition(hmodel, month)
+        part.rows = hmodel.objects.filter(history_date__gte=start, history_date__lt=end).count()
+        part.removed += removed
+        part.compacted_at = timezone.now()
+        part.save()
+    return removed
+
+
+# -----------------------------
+# Arquivamento
+# -----------------------------
+def archive_name(hmodel, month):
+    return f'{ARCHIVE_PREFIX}/{hmodel._meta.db_table}/{month:%Y-%m}.jsonl.gz'
+
+
+def archive_month(hmodel, month, dry_run=False):
+    """Exporta o mês para .jsonl.gz e apaga as linhas. Retorna o número de linhas arquivadas."""
+    start, end = _bounds(month)
+    qs = hmodel.objects.filter(history_date__gte=start, history_date__lt=end).order_by('history_id')
+    if dry_run:
+        return qs.count()
+    top = qs.aggregate(m=Max('history_id'))['m']
+    count = 0
+    name = ''
+    if top is not None:
+        with tempfile.TemporaryFile() as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode='wb') as gz:
+                for row in qs.filter(history_id__lte=top).values().iterator(chunk_size=5000):
+                    gz.write(json.dumps(row, cls=DjangoJSONEncoder).encode() + b'\n')
+                    count += 1
+            tmp.seek(0)
+            name = archive_name(hmodel, month)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            name = default_storage.save(name, File(tmp))
+    with transaction.atomic():
+        ids = list(qs.filter(history_id__lte=top).values_list('history_id', flat=True)) if top else []
+        _delete(hmodel, ids)
+        part = _partition(hmodel, month)
+        part.rows = 0
+        part.archived_at = timezone.now()
+        part.archive_name = name
+        part.save()
+    return count
+
+
+def run(dry_run=False, today=None):
+    """Compacta e arquiva o que estiver pendente em todas as tabelas. Retorna {tabela: {...}}."""
+    from .models import HistoryPartition
+
+    today = today or timezone.localdate()
+    compact_until = month_start(today - timedelta(days=compact_after_days()))
+    archive_until = month_start(today - timedelta(days=retention_days()))
+    report = {}
+    for hmodel in history_models():
+        table = hmodel._meta.db_table
+        done = {p.month: p for p in HistoryPartition.objects.filter(table=table)}
+        stats = {'compacted': 0, 'archived': 0, 'months': 0}
+        for month in months(hmodel, compact_until):
+            part = done.get(month)
+            if part and part.archived_at:
+                continue
+            if month < archive_until:
+                stats['archived'] += archive_month(hmodel, month, dry_run)
+                stats['months'] += 1
+            elif not (part and part.compacted_at):
+                stats['compacted'] += compact_month(hmodel, month, dry_run)
+                stats['months'] += 1
+        report[table] = stats
+        if stats['months']:
+            logger.info('histórico %s: %s', table, stats)
+    return report
+
+
+# -----------------------------
+# Relatório de inchaço
+# -----------------------------
+def bloat_report():
+    """Por tabela histórica: linhas (história x tabela viva), razão e, no Postgres, tamanho e tuplas mortas."""
+    from django.apps import apps
+
+    rows = []
+    for name in TRACKED:
+        model = apps.get_model('crm', name)
+        hmodel = model.history.model
+        row = {
+            'table': hmodel._meta.db_table,
+            'live_table': model._meta.db_table,
+            'history_rows': _estimate(hmodel),
+            'live_rows': _estimate(model),
+        }
+        row['ratio'] = round(row['history_rows'] / row['live_rows'], 1) if row['live_rows'] else None
+        row.update(_pg_stats(hmodel._meta.db_table))
+        rows.append(row)
+    return rows
+
+
+def _estimate(model):
+    # no Postgres, a estimativa do planner evita um COUNT(*) em tabelas grandes
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            found = cursor.fetchone()
+        if found and found[0] >= 0:
+            return found[0]
+    return model.objects.count()
+
+
+def _pg_stats(table):
+    if connection.vendor != 'postgresql':
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_total_relation_size(relid), n_dead_tup, n_live_tup, last_autovacuum '
+            'FROM pg_stat_user_tables WHERE relname = %s', [table]
+        )
+        found = cursor.fetchone()
+    if not found:
+        return {}
+    size, dead, live, vacuumed = found
+    return {
+        'total_bytes': size,
+        'dead_tuples': dead,
+        'dead_pct': round(100 * dead / (dead + live), 1) if dead + live else 0.0,
+        'last_autovacuum': vacuumed,
+    }
+
+
+def month_breakdown(hmodel, limit=24):
+    """Linhas por mês (mais recentes primeiro) de uma tabela histórica."""
+    qs = (
+        hmodel.objects.annotate(month=TruncMonth('history_date')).values('month')
+        .annotate(n=Count('history_id')).order_by('-month')[:limit]
+    )
+    return [(row['month'].date() if isinstance(row['month'], datetime) else row['month'], row['n']) for row in qs]
@@ -0,0 +1,275 @@
+"""
+Importação em lote de médicos (CSV ou XLSX).
+
+O arquivo é lido em streaming e processado em blocos. A deduplicação é
+feita em memória contra as chaves já existentes, carregadas uma vez:
+(nome em minúsculas, CRM) e (CRM, UF), as mesmas das constraints
+uniq_doctor_name_crm_ci e uniq_crm_uf. Depois vêm bulk_create/bulk_update
+com histórico. Linhas problemáticas vão para o relatório de conflitos.
+
+Pela tela, o arquivo vai para o storage e a importação roda no worker
+(crm.tasks.import_doctors_file); o andamento e o resultado ficam no cache
+(job_state) para a página de status.
+"""
+import csv
+import io
+import uuid
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from . import caching, coverage, search
+from .models import Doctor
+
+CHUNK_SIZE = 2000
+BATCH_SIZE = 1000
+UPLOAD_DIR = 'importacoes'
+JOB_TTL = 24 * 3600
+MAX_CONFLICTS_SHOWN = 200
+FIELDS = ('name', 'crm', 'uf', 'specialty', 'email', 'phone')
+COLUMN_ALIASES = {
+    'nome': 'name', 'name': 'name', 'medico': 'name', 'médico': 'name',
+    'crm': 'crm',
+    'uf': 'uf', 'estado': 'uf',
+    'especialidade': 'specialty', 'specialty': 'specialty',
+    'email': 'email', 'e-mail': 'email',
+    'telefone': 'phone', 'phone': 'phone', 'celular': 'phone',
+}
+
+
+def _header(cols):
+    return [COLUMN_ALIASES.get(str(c or '').strip().lower()) for c in cols]
+
+
+def _iter_csv(fh):
+    text = io.TextIOWrapper(fh, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    header = _header(next(reader, []))
+    for line, values in enumerate(reader, start=2):
+        yield line, {k: v for k, v in zip(header, values) if k}
+
+
+def _iter_xlsx(fh):
+    from openpyxl import load_workbook
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = _header(next(rows, ()))
+        for line, values in enumerate(rows, start=2):
+            yield line, {k: v for k, v in zip(header, values) if k}
+    finally:
+        wb.close()
+
+
+def iter_rows(fh, filename):
+    """(nº da linha, dict com os campos reconhecidos) para cada linha do arquivo."""
+    if Path(filename).suffix.lower() in ('.xlsx', '.xlsm'):
+        return _iter_xlsx(fh)
+    return _iter_csv(fh)
+
+
+def _clean(raw):
+    row = {f: str(raw.get(f) if raw.get(f) is not None else '').strip() for f in FIELDS}
+    row['uf'] = row['uf'].upper()[:2]
+    return row
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.conflicts = []  # (linha, motivo, dados)
+
+    def conflict(self, line, reason, row):
+        self.conflicts.append((line, reason, row))
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated,
+                'skipped': self.skipped, 'conflicts': len(self.conflicts)}
+
+
+class DoctorImporter:
+    """
+    update=False: médicos já cadastrados são ignorados (skipped).
+    update=True: os campos do arquivo sobrescrevem os do cadastro existente.
+    """
+
+    def __init__(self, owner=None, update=False, batch_size=BATCH_SIZE, dry_run=False):
+        self.owner = owner
+        self.update = update
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.report = ImportReport()
+        self.by_name_crm = {}
+        self.by_crm_uf = {}
+        self.keys_of = {}  # pk -> (chave nome+CRM, chave CRM+UF) atuais, para trocar no update
+        self._preload()
+
+    def _preload(self):
+        rows = Doctor.objects.values_list('pk', 'name', 'crm', 'uf').iterator(chunk_size=5000)
+        for pk, name, crm, uf in rows:
+            self._remember(pk, name, crm, uf)
+
+    def _remember(self, pk, name, crm, uf):
+        k_name = (name.lower(), crm)
+        k_uf = (crm, uf) if crm else None
+        if pk > 0:
+            # update que troca nome/CRM/UF: as chaves antigas não podem continuar apontando para ele
+            old_name, old_uf = self.keys_of.get(pk, (None, None))
+            if old_name != k_name and self.by_name_crm.get(old_name) == pk:
+                del self.by_name_crm[old_name]
+            if old_uf != k_uf and self.by_crm_uf.get(old_uf) == pk:
+                del self.by_crm_uf[old_uf]
+            self.keys_of[pk] = (k_name, k_uf)
+        self.by_name_crm[k_name] = pk
+        if k_uf:
+            self.by_crm_uf[k_uf] = pk
+
+    def run(self, rows, progress=None):
+        """progress(relatório, última linha lida) é chamado ao fim de cada bloco."""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, CHUNK_SIZE))
+            if not chunk:
+                break
+            self._process(chunk)
+            if progress:
+                progress(self.report, chunk[-1][0])
+        if self.report.created and not self.dry_run:
+            coverage.doctors_changed(self.report.created)
+        return self.report
+
+    def _process(self, chunk):
+        creates, updates = [], []
+        for line, raw in chunk:
+            row = _clean(raw)
+            if not row['name']:
+                self.report.conflict(line, 'sem nome', row)
+                continue
+            k_name = (row['name'].lower(), row['crm'])
+            k_uf = (row['crm'], row['uf']) if row['crm'] else None
+            pk_name = self.by_name_crm.get(k_name)
+            pk_uf = self.by_crm_uf.get(k_uf) if k_uf else None
+            if pk_name and pk_uf and pk_name != pk_uf:
+                self.report.conflict(line, 'nome+CRM e CRM+UF pertencem a médicos diferentes', row)
+                continue
+            pk = pk_name or pk_uf
+            if pk is not None and pk < 0:
+                self.report.conflict(line, f'duplicado no arquivo (linha {-pk})', row)
+                continue
+            if pk is None:
+                doctor = Doctor(owner=self.owner, **row)
+                doctor.search_text = search.doctor_document(doctor)
+                creates.append(doctor)
+                self._remember(-line, row['name'], row['crm'], row['uf'])
+            elif self.update:
+                updates.append((pk, row))
+                self._remember(pk, row['name'], row['crm'], row['uf'])
+            else:
+                self.report.skipped += 1
+        updates = self._changed(updates)
+        if not self.dry_run:
+            with transaction.atomic():
+                if creates:
+                    created = bulk_create_with_history(creates, Doctor, batch_size=self.batch_size,
+                                                       default_user=self.owner)
+                    for obj in created:
+                        self._remember(obj.pk, obj.name, obj.crm, obj.uf)
+                    search.index_changed(Doctor, [(obj.pk, obj.search_text) for obj in created])
+                if updates:
+                    bulk_update_with_history(updates, Doctor, list(FIELDS), batch_size=self.batch_size,
+                                             default_user=self.owner)
+                    # bulk_update não passa pelo save(): refaz o documento de busca (com instituições)
+                    search.reindex_doctors([obj.pk for obj in updates])
+                if creates or updates:
+                    caching.bump_on_commit('doctor')
+        self.report.created += len(creates)
+        self.report.updated += len(updates)
+
+    def _changed(self, updates):
+        """Carrega os existentes do bloco (uma consulta) e mantém só os que realmente mudam."""
+        if not updates:
+            return []
+        current = Doctor.objects.in_bulk([pk for pk, _ in updates])
+        changed = {}
+        for pk, row in updates:
+            obj = current.get(pk)
+            if obj is None:
+                continue
+            if any(getattr(obj, f) != v for f, v in row.items()):
+                for f, v in row.items():
+                    setattr(obj, f, v)
+                changed[pk] = obj
+            elif pk not in changed:
+                self.report.skipped += 1
+        return list(changed.values())
+
+
+def import_doctors(fh, filename, **kwargs):
+    return DoctorImporter(**kwargs).run(iter_rows(fh, filename))
+
+
+def _job_key(job_id):
+    return f'import-job:{job_id}'
+
+
+def job_state(job_id):
+    """Estado do job: status queued|running|done|failed, owner_id, lines, report, conflicts."""
+    return cache.get(_job_key(job_id))
+
+
+def _save_state(job_id, state, **changes):
+    state.update(changes)
+    cache.set(_job_key(job_id), state, JOB_TTL)
+
+
+def start_job(upload, owner, update=False, dry_run=False):
+    """Grava o upload no storage e registra o job. Retorna (job_id, argumentos da task)."""
+    job_id = uuid.uuid4().hex
+    name = default_storage.save(f'{UPLOAD_DIR}/{job_id}{Path(upload.name).suffix.lower()}', upload)
+    _save_state(job_id, {'status': 'queued', 'owner_id': owner.pk, 'filename': upload.name,
+                         'dry_run': dry_run, 'lines': 0})
+    return job_id, (job_id, name, upload.name, owner.pk, update, dry_run)
+
+
+def run_job(job_id, name, filename, owner_id, update=False, dry_run=False):
+    """Roda a importação de um arquivo do storage (no worker) e apaga o arquivo no fim."""
+    state = job_state(job_id) or {'owner_id': owner_id, 'filename': filename, 'dry_run': dry_run}
+    owner = get_user_model().objects.filter(pk=owner_id).first() if owner_id else None
+    _save_state(job_id, state, status='running', lines=0)
+
+    def progress(report, line):
+        _save_state(job_id, state, lines=line, report=report.as_dict())
+
+    try:
+        with default_storage.open(name, 'rb') as fh:
+            report = DoctorImporter(owner=owner, update=update, dry_run=dry_run).run(
+                iter_rows(fh.file, filename), progress=progress,
+            )
+    except Exception as exc:
+        _save_state(job_id, state, status='failed', error=str(exc)[:500])
+        raise
+    finally:
+        default_storage.delete(name)
+    _save_state(job_id, state, status='done', report=report.as_dict(),
+                conflicts=report.conflicts[:MAX_CONFLICTS_SHOWN])
+    return report.as_dict()
+
+
+def write_conflicts(report, fh):
+    w = csv.writer(fh, delimiter=';')
+    w.writerow(['linha', 'motivo'] + list(FIELDS))
+    for line, reason, row in report.conflicts:
+        w.writerow([line, reason] + [row.get(f, '') for f in FIELDS])
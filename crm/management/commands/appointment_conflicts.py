@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from crm import conflicts
+
+
+class Command(BaseCommand):
+    help = "Lista visitas sobrepostas (mesmo representante ou médico) e instala as constraints do Postgres."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--install", action="store_true",
+                            help="Instala as constraints de exclusão (Postgres) que ainda faltam.")
+
+    def handle(self, *args, **opts):
+        for label, field in (("representante", "owner_id"), ("médico", "doctor_id")):
+            qs = conflicts.existing_conflicts(field).select_related("doctor", "owner").order_by("when")
+            total = qs.count()
+            self.stdout.write(f"Sobreposições por {label}: {total}")
+            for appt in qs[:opts["limit"]]:
+                self.stdout.write(
+                    f"  #{appt.pk} {timezone.localtime(appt.when):%d/%m/%Y %H:%M}-{timezone.localtime(appt.ends_at):%H:%M} "
+                    f"{appt.doctor.name} ({appt.owner or '-'})"
+                )
+        if opts["install"]:
+            if connection.vendor != "postgresql":
+                self.stdout.write("Constraints de exclusão só existem no Postgres; nada a instalar.")
+                return
+            installed = conflicts.install_constraints()
+            self.stdout.write(self.style.SUCCESS(f"Constraints ativas: {', '.join(installed) or 'nenhuma'}."))
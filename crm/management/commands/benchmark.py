@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Mede latência (p50/p95) e queries das telas/APIs principais e do admin sobre a base sintética "
+            "(generate_synthetic). Limpa o cache default antes de cada medição fria: não rode em produção.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--only", help="Endpoints separados por vírgula (ex.: dashboard,api_events).")
+        parser.add_argument("--baseline", help="JSON de baseline para comparar; regressão encerra com erro.")
+        parser.add_argument("--save", help="Grava o resultado como baseline neste caminho.")
+        parser.add_argument("--tolerance", type=float, default=benchmark.P95_TOLERANCE,
+                            help="Aumento relativo aceito no p95 (padrão 0.25).")
+        parser.add_argument("--slack-ms", type=float, default=benchmark.P95_SLACK_MS,
+                            help="Aumento absoluto sempre aceito no p95, em ms (padrão 5).")
+
+    def handle(self, *args, **opts):
+        only = {name.strip() for name in opts["only"].split(",")} if opts["only"] else None
+        baseline = benchmark.load(opts["baseline"]) if opts["baseline"] else None
+        try:
+            results = benchmark.run(opts["iterations"], opts["warmup"], only, out=self.stdout.write)
+        except LookupError as exc:
+            raise CommandError(str(exc))
+        info = benchmark.meta(opts["iterations"])
+        if opts["save"]:
+            benchmark.save(opts["save"], results, info)
+            self.stdout.write(f"baseline gravado em {opts['save']}")
+        if baseline is None:
+            return
+        for warning in benchmark.scale_warnings(baseline, info):
+            self.stdout.write(self.style.WARNING(f"aviso: {warning}"))
+        problems = benchmark.compare(baseline, results, opts["tolerance"], opts["slack_ms"])
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+            raise CommandError(f"{len(problems)} regressão(ões) em relação a {opts['baseline']}")
+        self.stdout.write(self.style.SUCCESS("sem regressões"))
@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from crm import pdf
+
+
+class Command(BaseCommand):
+    help = "Gera o zip com os PDFs dos relatórios de um período."
+
+    def add_arguments(self, parser):
+        parser.add_argument("start", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("end", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("--owner", type=int, help="Só as visitas deste usuário (id).")
+
+    def handle(self, *args, **opts):
+        key = pdf.export_zip(opts["start"], opts["end"], opts["owner"])
+        self.stdout.write(self.style.SUCCESS(f"Zip gerado: {key}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from crm.utils import flush_visit_exports
+
+
+class Command(BaseCommand):
+    help = "Drena o outbox de visitas para os segmentos CSV mensais."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        n = flush_visit_exports(batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{n} visita(s) exportada(s)."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import synthetic
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+class Command(BaseCommand):
+    help = ("Gera uma base sintética (representantes, médicos, organizações, atribuições, visitas com "
+            "histórico e negócios) para benchmarks. Use um banco vazio ou dedicado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(SCALES), help="Atalho para --appointments (10k, 100k, 1m).")
+        parser.add_argument("--appointments", type=int, default=10_000)
+        parser.add_argument("--years", type=int, default=2, help="Anos de visitas até hoje (mais 30 dias à frente).")
+        parser.add_argument("--doctors", type=int, help="Padrão: uma vez a cada 20 visitas.")
+        parser.add_argument("--reps", type=int, help="Padrão: um a cada 2000 visitas (mínimo 5).")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        if synthetic.exists():
+            raise CommandError("Já existe uma base sintética (usuários bench_*); use um banco novo.")
+        appointments = SCALES[opts["scale"]] if opts["scale"] else opts["appointments"]
+        result = synthetic.generate(
+            appointments=appointments, years=opts["years"], doctors=opts["doctors"], reps=opts["reps"],
+            seed=opts["seed"], out=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"ok: {result['appointments']} visitas, {result['reports']} relatórios, {result['doctors']} médicos, "
+            f"{result['organizations']} organizações, {result['reps']} representantes, {result['deals']} negócios"
+        ))
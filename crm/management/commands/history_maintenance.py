@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from crm import history
+
+
+class Command(BaseCommand):
+    help = "Compacta e arquiva (por mês) as tabelas históricas conforme HISTORY_* nas settings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Só conta o que seria removido/arquivado.")
+
+    def handle(self, *args, **opts):
+        report = history.run(dry_run=opts["dry_run"])
+        verb = "seriam" if opts["dry_run"] else "foram"
+        for table, stats in report.items():
+            self.stdout.write(
+                f"{table}: {stats['months']} mês(es); {stats['compacted']} linha(s) compactada(s), "
+                f"{stats['archived']} arquivada(s) ({verb})"
+            )
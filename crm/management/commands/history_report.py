@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from crm import history
+
+
+class Command(BaseCommand):
+    help = "Tamanho das tabelas históricas (simple_history) em relação às tabelas vivas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=0, help="Mostra as linhas por mês (últimos N meses).")
+
+    def handle(self, *args, **opts):
+        for row in history.bloat_report():
+            line = (f"{row['table']}: {row['history_rows']} linha(s) de histórico para "
+                    f"{row['live_rows']} em {row['live_table']} (x{row['ratio'] if row['ratio'] is not None else '-'})")
+            if 'total_bytes' in row:
+                line += (f"; {row['total_bytes'] / 1024 / 1024:.1f} MB, {row['dead_tuples']} tupla(s) morta(s) "
+                         f"({row['dead_pct']}%), último autovacuum {row['last_autovacuum'] or '-'}")
+            self.stdout.write(line)
+        if opts["months"]:
+            for hmodel in history.history_models():
+                self.stdout.write(f"\n{hmodel._meta.db_table}")
+                for month, n in history.month_breakdown(hmodel, opts["months"]):
+                    self.stdout.write(f"  {month:%Y-%m}: {n}")
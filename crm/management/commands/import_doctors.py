@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.importers import DoctorImporter, iter_rows, write_conflicts
+
+
+class Command(BaseCommand):
+    help = "Importa médicos de um CSV/XLSX (deduplica por nome+CRM e CRM+UF)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--owner", help="username do dono dos médicos criados")
+        parser.add_argument("--update", action="store_true", help="Atualiza os médicos já cadastrados.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Só valida e gera o relatório.")
+        parser.add_argument("--conflicts", help="Grava as linhas em conflito neste CSV.")
+
+    def handle(self, *args, **opts):
+        owner = None
+        if opts["owner"]:
+            try:
+                owner = get_user_model().objects.get(username=opts["owner"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Usuário não encontrado: {opts['owner']}")
+        importer = DoctorImporter(owner=owner, update=opts["update"],
+                                  batch_size=opts["batch_size"], dry_run=opts["dry_run"])
+        with open(opts["path"], "rb") as fh:
+            report = importer.run(iter_rows(fh, opts["path"]))
+        if opts["conflicts"]:
+            with open(opts["conflicts"], "w", newline="", encoding="utf-8") as out:
+                write_conflicts(report, out)
+        r = report.as_dict()
+        self.stdout.write(self.style.SUCCESS(
+            f"Criados: {r['created']} • Atualizados: {r['updated']} • Ignorados: {r['skipped']} • Conflitos: {r['conflicts']}"
+        ))
@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from crm import routing
+
+
+class Command(BaseCommand):
+    help = "Calcula o roteiro semanal sugerido dos representantes (padrão: semana de amanhã)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--week", type=date.fromisoformat, help="Qualquer dia da semana, AAAA-MM-DD.")
+        parser.add_argument("--rep", type=int, action="append", help="Id do representante (repetível).")
+
+    def handle(self, *args, **opts):
+        if opts["week"]:
+            week_start = opts["week"] - timedelta(days=opts["week"].weekday())
+            first_day = None
+        else:
+            week_start, first_day = routing.current_week()
+        n = routing.build_plans(week_start, rep_ids=opts["rep"], first_day=first_day)
+        self.stdout.write(self.style.SUCCESS(f"{n} roteiro(s) para a semana de {week_start:%d/%m/%Y}."))
@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crm import coverage
+from crm.models import CoverageRollup
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o rollup de cobertura do dashboard (padrão: hoje)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--day", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("--keep-days", type=int, default=None,
+                            help="Apaga linhas mais antigas que N dias.")
+
+    def handle(self, *args, **opts):
+        day = opts["day"] or timezone.localdate()
+        n = coverage.rebuild(day)
+        if opts["keep_days"] is not None:
+            old = day.toordinal() - opts["keep_days"]
+            CoverageRollup.objects.filter(day__lt=date.fromordinal(old)).delete()
+        self.stdout.write(self.style.SUCCESS(f"{n} linha(s) de cobertura em {day:%d/%m/%Y}."))
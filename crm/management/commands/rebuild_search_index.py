@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from crm import search
+
+
+class Command(BaseCommand):
+    help = "Recalcula o documento de busca de médicos e organizações (e cria os índices trigram no Postgres)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--install", action="store_true", help="Cria a extensão pg_trgm e os índices GIN.")
+
+    def handle(self, *args, **opts):
+        if opts["install"]:
+            installed = search.install_indexes()
+            self.stdout.write(f"Índices: {', '.join(installed) or 'nenhum (banco sem pg_trgm)'}")
+        orgs = search.reindex_organizations()
+        doctors = search.reindex_doctors()
+        self.stdout.write(self.style.SUCCESS(f"{doctors} médico(s) e {orgs} organização(ões) atualizados."))
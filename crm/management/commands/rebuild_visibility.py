@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from crm import visibility
+
+
+class Command(BaseCommand):
+    help = "Reconstrói a tabela representante → médicos visíveis a partir das atribuições ativas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rep", type=int, help="Só o representante com este id.")
+
+    def handle(self, *args, **opts):
+        n = visibility.rebuild(opts["rep"])
+        self.stdout.write(self.style.SUCCESS(f"{n} par(es) representante/médico."))
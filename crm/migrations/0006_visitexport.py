@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_historicalvisitreport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('exported_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='crm.appointment')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('exported_at__isnull', True)), fields=['id'], name='visitexport_pending_idx')],
+            },
+        ),
+    ]
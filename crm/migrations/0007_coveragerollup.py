@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_visitexport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('assigned', models.PositiveIntegerField(default=0)),
+                ('visited', models.PositiveIntegerField(default=0)),
+                ('visits_30d', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('representative', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.representative')),
+                ('territory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='crm.territory')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'representative', 'territory'), name='uniq_coverage_rep_territory'), models.UniqueConstraint(condition=models.Q(('territory__isnull', True)), fields=('day', 'representative'), name='uniq_coverage_rep'), models.UniqueConstraint(condition=models.Q(('representative__isnull', True), ('territory__isnull', True)), fields=('day',), name='uniq_coverage_global')],
+            },
+        ),
+    ]
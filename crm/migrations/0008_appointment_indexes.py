@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_coveragerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['when'], name='appt_when_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['owner', 'when'], name='appt_owner_when_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'when'], name='appt_doctor_when_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'when'], name='appt_status_when_idx'),
+        ),
+    ]
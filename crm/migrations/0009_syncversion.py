@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=80, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
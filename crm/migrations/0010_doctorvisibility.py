@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    Assignment = apps.get_model('crm', 'Assignment')
+    DoctorVisibility = apps.get_model('crm', 'DoctorVisibility')
+    pairs = Assignment.objects.filter(active=True).values_list('representative_id', 'physician_id').distinct()
+    DoctorVisibility.objects.bulk_create(
+        (DoctorVisibility(representative_id=r, doctor_id=d) for r, d in pairs.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_syncversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorVisibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visibility', to='crm.doctor')),
+                ('representative', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visible_doctors', to='crm.representative')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('representative', 'doctor'), name='uniq_visibility_rep_doctor')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_doctorvisibility'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['stage', '-updated_at', '-id'], name='deal_stage_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deal',
+            index=models.Index(fields=['owner', '-updated_at'], name='deal_owner_updated_idx'),
+        ),
+    ]
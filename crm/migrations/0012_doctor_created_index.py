@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_deal_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['-created_at', '-id'], name='doctor_created_idx'),
+        ),
+    ]
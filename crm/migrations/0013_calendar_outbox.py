@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_doctor_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.PositiveIntegerField(db_index=True)),
+                ('action', models.CharField(choices=[('upsert', 'Criar/atualizar'), ('delete', 'Excluir')], max_length=10)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('done', 'Enviado'), ('skipped', 'Substituído'), ('failed', 'Falhou')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_at', 'id'], name='calendaroutbox_pending_idx')],
+            },
+        ),
+    ]
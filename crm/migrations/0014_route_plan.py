@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_calendar_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('payload', models.JSONField(default=list)),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('travel_minutes', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('representative', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_plans', to='crm.representative')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('representative', 'week_start'), name='uniq_routeplan_rep_week')],
+            },
+        ),
+    ]
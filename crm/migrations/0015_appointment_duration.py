@@ -0,0 +1,130 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:50
+
+import sys
+from datetime import timedelta
+
+import django.core.validators
+from django.conf import settings
+from django.db import DatabaseError, migrations, models, transaction
+from django.db.models import Exists, F, OuterRef
+
+
+def backfill_ends_at(apps, schema_editor):
+    # visitas antigas tinham 30 min fixos (o default de duration)
+    for name in ('Appointment', 'HistoricalAppointment'):
+        model = apps.get_model('crm', name)
+        model.objects.using(schema_editor.connection.alias).filter(ends_at__isnull=True).update(
+            ends_at=F('when') + timedelta(minutes=30)
+        )
+
+
+# Congelado aqui (não importar crm.conflicts): a migração precisa continuar
+# reproduzível mesmo que o modelo ou o módulo mudem depois.
+EXCLUSION_CONSTRAINTS = {
+    'appt_owner_no_overlap': 'owner_id',
+    'appt_doctor_no_overlap': 'doctor_id',
+}
+
+
+def _has_overlaps(Appointment, column, alias):
+    other = Appointment.objects.filter(
+        **{column: OuterRef(column)}, when__lt=OuterRef('ends_at'), ends_at__gt=OuterRef('when'),
+    ).exclude(status='cancelada').exclude(pk=OuterRef('pk'))
+    return (Appointment.objects.using(alias).exclude(status='cancelada')
+            .exclude(**{f'{column}__isnull': True}).filter(Exists(other)).exists())
+
+
+def install_exclusion_constraints(apps, schema_editor):
+    # só no Postgres (btree_gist); no SQLite a checagem indexada de crm.conflicts é o que vale
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    Appointment = apps.get_model('crm', 'Appointment')
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    except DatabaseError as exc:
+        sys.stderr.write(
+            f'\n  AVISO: btree_gist indisponível ({exc}); constraints de sobreposição NÃO instaladas.\n'
+            '  `manage.py check --database default` continuará apontando a falta.\n'
+        )
+        return
+    for name, column in EXCLUSION_CONSTRAINTS.items():
+        if _has_overlaps(Appointment, column, connection.alias):
+            # não trava o deploy: a falta fica registrada no catálogo e o check (crm.W001) acusa
+            sys.stderr.write(
+                f'\n  AVISO: {name} NÃO instalada: já existem visitas ativas sobrepostas ({column}).\n'
+                '  Resolva com `manage.py appointment_conflicts` e instale com `appointment_conflicts --install`.\n'
+            )
+            continue
+        schema_editor.execute(
+            f'ALTER TABLE crm_appointment ADD CONSTRAINT {name} EXCLUDE USING gist '
+            f'({column} WITH =, tstzrange("when", ends_at, \'[)\') WITH &&) '
+            f"WHERE (status <> 'cancelada' AND {column} IS NOT NULL)"
+        )
+
+
+def drop_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in EXCLUSION_CONSTRAINTS:
+        schema_editor.execute(f'ALTER TABLE crm_appointment DROP CONSTRAINT IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0014_route_plan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_owner_when_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_doctor_when_idx',
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='duration',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(480)], verbose_name='Duração (min)'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Término'),
+        ),
+        migrations.AddField(
+            model_name='historicalappointment',
+            name='duration',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(480)], verbose_name='Duração (min)'),
+        ),
+        migrations.AddField(
+            model_name='historicalappointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Término'),
+        ),
+        migrations.RunPython(backfill_ends_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, verbose_name='Término'),
+        ),
+        migrations.AlterField(
+            model_name='historicalappointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, verbose_name='Término'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['owner', 'when', 'ends_at'], name='appt_owner_span_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'when', 'ends_at'], name='appt_doctor_span_idx'),
+        ),
+        migrations.RunPython(install_exclusion_constraints, drop_exclusion_constraints),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:00
+
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+
+from django.db import DatabaseError, migrations, models, transaction
+
+# Congelado aqui (não importar crm.search): a migração precisa produzir o
+# mesmo documento e os mesmos índices mesmo que o módulo mude depois.
+INDEXES = {
+    'crm_doctor': 'doctor_search_trgm_idx',
+    'crm_organization': 'org_search_trgm_idx',
+}
+_SEP = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(_SEP.split(text)).strip()
+
+
+def doctor_document(doctor, institutions=()):
+    crm = f'{doctor.crm}{doctor.uf}' if doctor.crm and doctor.uf else ''
+    return normalize(' '.join([doctor.name, doctor.crm, doctor.uf, crm, doctor.specialty, *institutions]))
+
+
+def organization_document(org):
+    return normalize(' '.join([org.name, org.cnpj, org.city, org.state]))
+
+
+def backfill(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Doctor = apps.get_model('crm', 'Doctor')
+    Organization = apps.get_model('crm', 'Organization')
+
+    orgs = []
+    for org in Organization.objects.using(db).iterator(chunk_size=2000):
+        org.search_text = organization_document(org)
+        orgs.append(org)
+    Organization.objects.using(db).bulk_update(orgs, ['search_text'], batch_size=500)
+
+    names = defaultdict(list)
+    for doctor_id, name in Doctor.institutions.through.objects.using(db).values_list('doctor_id', 'organization__name'):
+        names[doctor_id].append(name)
+    batch = []
+    for doctor in Doctor.objects.using(db).iterator(chunk_size=2000):
+        doctor.search_text = doctor_document(doctor, names[doctor.pk])
+        batch.append(doctor)
+        if len(batch) >= 2000:
+            Doctor.objects.using(db).bulk_update(batch, ['search_text'], batch_size=500)
+            batch = []
+    Doctor.objects.using(db).bulk_update(batch, ['search_text'], batch_size=500)
+
+
+def install_indexes(apps, schema_editor):
+    # só no Postgres (pg_trgm); nos outros bancos a busca usa o índice em memória
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as exc:
+        sys.stderr.write(
+            f'\n  AVISO: pg_trgm indisponível ({exc}); busca sem índice trigram.\n'
+            '  Depois de habilitar a extensão, rode `manage.py rebuild_search_index --install`.\n'
+        )
+        return
+    for table, name in INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (search_text gin_trgm_ops)')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES.values():
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0015_appointment_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(install_indexes, drop_indexes),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0016_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['name', 'id'], name='doctor_name_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0017_doctor_name_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryPartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=80)),
+                ('month', models.DateField()),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('removed', models.PositiveIntegerField(default=0)),
+                ('compacted_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(blank=True, null=True)),
+                ('archive_name', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['table', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('table', 'month'), name='uniq_history_partition')],
+            },
+        ),
+    ]
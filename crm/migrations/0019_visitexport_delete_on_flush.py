@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:31
+
+from django.db import migrations
+
+
+def drop_exported(apps, schema_editor):
+    # sem a coluna, as linhas já exportadas voltariam a parecer pendentes
+    VisitExport = apps.get_model('crm', 'VisitExport')
+    VisitExport.objects.using(schema_editor.connection.alias).filter(exported_at__isnull=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0018_history_partition'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_exported, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='visitexport',
+            name='visitexport_pending_idx',
+        ),
+        migrations.RemoveField(
+            model_name='visitexport',
+            name='exported_at',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:43
+
+from django.db import migrations, models
+
+
+def drop_processed(apps, schema_editor):
+    # o worker agora apaga o que enviou ou coalesceu; o histórico antigo sai junto
+    CalendarOutbox = apps.get_model('crm', 'CalendarOutbox')
+    CalendarOutbox.objects.using(schema_editor.connection.alias).filter(status__in=['done', 'skipped']).delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0019_visitexport_delete_on_flush'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_processed, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='calendaroutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendente'), ('sending', 'Enviando'), ('failed', 'Falhou')], default='pending', max_length=10),
+        ),
+    ]
@@ -2,7 +2,11 @@ from django.db import models
 from django.db.models.functions import Lower
 from django.conf import settings
 from simple_history.models import HistoricalRecords
+from datetime import timedelta
+
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db.models import Q
+from django.utils import timezone
 
 class Doctor(models.Model):
     name = models.CharField('Nome', max_length=120)
@@ -18,13 +22,29 @@ class Doctor(models.Model):
     uf = models.CharField('UF', max_length=2, blank=True)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     institutions = models.ManyToManyField('crm.Organization', blank=True, related_name='physicians')
-    history = HistoricalRecords()
+    # documento normalizado da busca (crm.search); mantido pelo save() e pelos signals
+    search_text = models.TextField(editable=False, blank=True, default='')
+    history = HistoricalRecords(excluded_fields=['search_text'])
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['crm','uf'], name='uniq_crm_uf', condition=~Q(crm='')),
             models.UniqueConstraint(Lower('name'), 'crm', name='uniq_doctor_name_crm_ci')
         ]
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='doctor_created_idx'),
+            # paginação alfabética do seletor de médicos (/api/doctors/lookup/)
+            models.Index(fields=['name', 'id'], name='doctor_name_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .search import doctor_document
+        institutions = self.institutions.values_list('name', flat=True) if self.pk else ()
+        self.search_text = doctor_document(self, institutions)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'search_text'}
+        super().save(*args, **kwargs)
 
 
 STATUS_CHOICES = (
@@ -32,10 +52,19 @@ STATUS_CHOICES = (
     ('concluida','Concluída'),
     ('cancelada','Cancelada'),
 )
+DEFAULT_DURATION_MINUTES = 30
+MAX_DURATION_MINUTES = 8 * 60
+
 class Appointment(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='appointments', verbose_name='Médico')
     contact_name = models.CharField('Contato (opcional)', max_length=120, blank=True)
     when = models.DateTimeField('Data e Hora')
+    duration = models.PositiveSmallIntegerField(
+        'Duração (min)', default=DEFAULT_DURATION_MINUTES,
+        validators=[MinValueValidator(5), MaxValueValidator(MAX_DURATION_MINUTES)],
+    )
+    # when + duration, mantido pelo save(); é o limite usado na checagem de sobreposição (crm.conflicts)
+    ends_at = models.DateTimeField('Término', editable=False)
     status = models.CharField('Status', max_length=20, choices=STATUS_CHOICES, default='agendada')
     notes = models.TextField('Observações', blank=True)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
@@ -43,9 +72,27 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         ordering = ['-when']
+        indexes = [
+            models.Index(fields=['when'], name='appt_when_idx'),
+            # (dono|médico, início, fim): a busca de conflitos é um range scan limitado pela duração máxima
+            models.Index(fields=['owner', 'when', 'ends_at'], name='appt_owner_span_idx'),
+            models.Index(fields=['doctor', 'when', 'ends_at'], name='appt_doctor_span_idx'),
+            models.Index(fields=['status', 'when'], name='appt_status_when_idx'),
+        ]
     def __str__(self):
         return f"{self.doctor.name} - {self.when:%d/%m/%Y %H:%M}"
 
+    def compute_end(self):
+        self.ends_at = self.when + timedelta(minutes=self.duration or DEFAULT_DURATION_MINUTES)
+        return self.ends_at
+
+    def save(self, *args, **kwargs):
+        self.compute_end()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'when', 'duration'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'ends_at'}
+        super().save(*args, **kwargs)
+
 VISIT_NUMBER_CHOICES = (
     ('1a', '1ª visita'),
     ('2a', '2ª visita'),
@@ -80,9 +127,17 @@ class Organization(models.Model):
     notes = models.TextField('Notas', blank=True)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     created_at = models.DateTimeField(auto_now_add=True)
-    history = HistoricalRecords()
+    search_text = models.TextField(editable=False, blank=True, default='')
+    history = HistoricalRecords(excluded_fields=['search_text'])
     def __str__(self): return self.name
-    history = HistoricalRecords()
+
+    def save(self, *args, **kwargs):
+        from .search import organization_document
+        self.search_text = organization_document(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'search_text'}
+        super().save(*args, **kwargs)
 
 class Pipeline(models.Model):
     name = models.CharField(max_length=80, unique=True)
@@ -112,7 +167,11 @@ class Deal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     history = HistoricalRecords()
-    history = HistoricalRecords()
+    class Meta:
+        indexes = [
+            models.Index(fields=['stage', '-updated_at', '-id'], name='deal_stage_updated_idx'),
+            models.Index(fields=['owner', '-updated_at'], name='deal_owner_updated_idx'),
+        ]
     def __str__(self): return self.title
 
 
@@ -138,3 +197,118 @@ class Assignment(models.Model):
     end = models.DateField(null=True, blank=True)
     class Meta:
         unique_together = ('physician','representative','territory')
+
+
+class DoctorVisibility(models.Model):
+    """
+    Denormalização "representante → médicos visíveis" (atribuições ativas, sem
+    repetir território). Mantida por crm.visibility a partir dos signals de Assignment.
+    """
+    representative = models.ForeignKey(Representative, on_delete=models.CASCADE, related_name='visible_doctors')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='visibility')
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['representative', 'doctor'], name='uniq_visibility_rep_doctor'),
+        ]
+
+
+class VisitExport(models.Model):
+    """Outbox das linhas da planilha de visitas; drenado (e apagado) em lote pelo Celery (ver crm.utils)."""
+    appointment = models.ForeignKey(Appointment, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class RoutePlan(models.Model):
+    """Roteiro semanal sugerido por representante (crm.routing), recalculado no lote noturno."""
+    representative = models.ForeignKey(Representative, on_delete=models.CASCADE, related_name='route_plans')
+    week_start = models.DateField()
+    payload = models.JSONField(default=list)
+    visits = models.PositiveIntegerField(default=0)
+    travel_minutes = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['representative', 'week_start'], name='uniq_routeplan_rep_week'),
+        ]
+
+
+class CalendarOutbox(models.Model):
+    """
+    Outbox da sincronização com a agenda externa, gravado junto com a visita.
+    Guarda só o id da visita (não FK) para que exclusões também sejam enviadas.
+    Drenado pelo worker com coalescência por visita (ver crm.calendar_sync);
+    linhas enviadas ou substituídas são apagadas.
+    """
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [(ACTION_UPSERT, 'Criar/atualizar'), (ACTION_DELETE, 'Excluir')]
+    STATUS_CHOICES = [('pending', 'Pendente'), ('sending', 'Enviando'), ('failed', 'Falhou')]
+
+    appointment_id = models.PositiveIntegerField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='calendaroutbox_pending_idx',
+                         condition=Q(status='pending')),
+        ]
+
+
+class CoverageRollup(models.Model):
+    """
+    KPIs de cobertura (janela de 30 dias) materializados por dia e escopo.
+    representative nulo = visão geral; territory nulo = todos os territórios do representante.
+    Mantido por crm.signals / crm.coverage e reconstruído por `rebuild_coverage`.
+    """
+    day = models.DateField()
+    representative = models.ForeignKey(Representative, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    territory = models.ForeignKey(Territory, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    assigned = models.PositiveIntegerField(default=0)
+    visited = models.PositiveIntegerField(default=0)
+    visits_30d = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'representative', 'territory'], name='uniq_coverage_rep_territory'),
+            models.UniqueConstraint(fields=['day', 'representative'], name='uniq_coverage_rep',
+                                    condition=Q(territory__isnull=True)),
+            models.UniqueConstraint(fields=['day'], name='uniq_coverage_global',
+                                    condition=Q(representative__isnull=True, territory__isnull=True)),
+        ]
+
+
+class SyncVersion(models.Model):
+    """Contador de versão por escopo ('appointment:all', 'deal:user:7'...); base dos ETags das APIs."""
+    scope = models.CharField(max_length=80, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self):
+        return f"{self.scope}@{self.version}"
+
+
+class HistoryPartition(models.Model):
+    """
+    Mês de uma tabela histórica (simple_history) e o que a manutenção já fez
+    com ele (crm.history): compactação e arquivamento em arquivo .jsonl.gz.
+    """
+    table = models.CharField(max_length=80)
+    month = models.DateField()
+    rows = models.PositiveIntegerField(default=0)
+    removed = models.PositiveIntegerField(default=0)
+    compacted_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True)
+    archive_name = models.CharField(max_length=255, blank=True)
+    class Meta:
+        ordering = ['table', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['table', 'month'], name='uniq_history_partition'),
+        ]
+    def __str__(self):
+        return f"{self.table} {self.month:%Y-%m}"
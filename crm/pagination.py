@@ -0,0 +1,134 @@
+"""
+Paginação por keyset (cursor) das listas.
+
+A ordenação precisa terminar em uma chave única (normalmente o id) e ter
+índice; a página seguinte filtra "depois da última linha" em vez de usar
+OFFSET, então a página N custa o mesmo que a primeira.
+"""
+import base64
+import datetime
+import json
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PER_PAGE = 50
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, cursor, request=None, param='cursor'):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.request = request
+        self.param = param
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    @property
+    def is_first(self):
+        return not self.cursor
+
+    def _url(self, cursor):
+        params = self.request.GET.copy() if self.request is not None else {}
+        params.pop(self.param, None)
+        if cursor:
+            params[self.param] = cursor
+        query = params.urlencode() if params else ''
+        return f"?{query}" if query else '?'
+
+    @property
+    def next_url(self):
+        return self._url(self.next_cursor) if self.next_cursor else ''
+
+    @property
+    def first_url(self):
+        return self._url('')
+
+
+def _value(item, field):
+    if isinstance(item, dict):
+        return item[field]
+    return getattr(item, field)
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # o DjangoJSONEncoder corta datetimes em milissegundos: o cursor ficaria
+    # antes da última linha e `after` pularia as do mesmo milissegundo
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(item, ordering):
+    values = [_value(item, f.lstrip('-')) for f in ordering]
+    raw = json.dumps(values, cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering, model=None):
+    """
+    Valores do cursor na ordem de `ordering`. Com `model`, cada valor passa
+    pelo to_python() do campo; qualquer valor que não converte vira InvalidCursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+    if model is None:
+        return values
+    converted = []
+    for field, value in zip(ordering, values):
+        if value is None or isinstance(value, (list, dict, bool)):
+            raise InvalidCursor(cursor)
+        try:
+            converted.append(model._meta.get_field(field.lstrip('-')).to_python(value))
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+    return converted
+
+
+def after(qs, ordering, values):
+    """(k1 > v1) OR (k1 = v1 AND k2 > v2) ..., respeitando a direção de cada chave."""
+    clauses = []
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        op = 'lt' if field.startswith('-') else 'gt'
+        eq = {f.lstrip('-'): v for f, v in zip(ordering[:i], values[:i])}
+        clauses.append(Q(**eq, **{f'{name}__{op}': values[i]}))
+    return qs.filter(reduce(lambda a, b: a | b, clauses))
+
+
+def paginate(qs, request, ordering, per_page=PER_PAGE, param='cursor'):
+    """
+    Página de `qs` ordenada por `ordering` (campos do próprio modelo) a partir
+    do cursor em request.GET[param]. Levanta InvalidCursor se o cursor não
+    decodifica ou se algum valor não é do tipo do campo.
+    """
+    ordering = tuple(ordering)
+    qs = qs.order_by(*ordering)
+    cursor = request.GET.get(param, '')
+    if cursor:
+        qs = after(qs, ordering, decode_cursor(cursor, ordering, qs.model))
+    rows = list(qs[:per_page + 1])
+    items = rows[:per_page]
+    next_cursor = encode_cursor(items[-1], ordering) if len(rows) > per_page else ''
+    return KeysetPage(items, next_cursor, cursor, request=request, param=param)
@@ -0,0 +1,100 @@
+"""
+Renderização dos PDFs de relatório de visita.
+
+O PDF é gravado no storage com nome derivado do conteúdo (id do relatório,
+updated_at e os dados da consulta que aparecem no documento): downloads
+repetidos saem direto do storage e qualquer edição gera um arquivo novo.
+A renderização roda no worker (crm.tasks.render_report_pdf).
+"""
+import hashlib
+import io
+import tempfile
+import zipfile
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+
+from greens_scheduler import metrics
+
+from .models import VisitReport
+
+PDF_DIR = 'relatorios/pdf'
+ZIP_DIR = 'relatorios/zip'
+
+
+def _reports():
+    return VisitReport.objects.select_related('appointment__doctor')
+
+
+def _fingerprint(pk, updated_at, when, status, doctor_name):
+    # tudo o que aparece no PDF; mudou qualquer um, muda o nome do arquivo
+    return f"{pk}:{updated_at.isoformat()}:{when.isoformat()}:{status}:{doctor_name}"
+
+
+def storage_key(rep):
+    appt = rep.appointment
+    raw = _fingerprint(rep.pk, rep.updated_at, appt.when, appt.status, appt.doctor.name)
+    digest = hashlib.sha1(raw.encode()).hexdigest()[:16]
+    return f"{PDF_DIR}/relatorio-{rep.pk}-{digest}.pdf"
+
+
+def render(rep):
+    from xhtml2pdf import pisa
+    html = render_to_string('relatorios/pdf.html', {'rep': rep})
+    buf = io.BytesIO()
+    pisa.CreatePDF(src=html, dest=buf)
+    metrics.inc('pdfs_rendered_total')
+    return buf.getvalue()
+
+
+def ensure_pdf(rep):
+    """Garante o PDF no storage e devolve a chave; só renderiza se ainda não existir."""
+    key = storage_key(rep)
+    if not default_storage.exists(key):
+        default_storage.save(key, ContentFile(render(rep)))
+    return key
+
+
+def ensure_pdf_by_id(report_id):
+    return ensure_pdf(_reports().get(pk=report_id))
+
+
+def period_reports(start, end, owner_id=None):
+    qs = _reports().filter(appointment__when__date__gte=start, appointment__when__date__lte=end)
+    if owner_id is not None:
+        qs = qs.filter(appointment__owner_id=owner_id)
+    return qs.order_by('appointment__when', 'pk')
+
+
+def zip_key(start, end, owner_id=None):
+    """
+    Chave do zip do período, com as mesmas entradas de storage_key: muda quando
+    entra ou sai um relatório ou quando algum PDF do período mudaria.
+    """
+    rows = period_reports(start, end, owner_id).values_list(
+        'pk', 'updated_at', 'appointment__when', 'appointment__status', 'appointment__doctor__name',
+    )
+    digest = hashlib.sha1()
+    for row in rows.iterator(chunk_size=2000):
+        digest.update(_fingerprint(*row).encode() + b'\n')
+    scope = 'todos' if owner_id is None else f'u{owner_id}'
+    digest = digest.hexdigest()[:12]
+    return f"{ZIP_DIR}/relatorios-{start:%Y%m%d}-{end:%Y%m%d}-{scope}-{digest}.zip"
+
+
+def export_zip(start, end, owner_id=None):
+    """Zip com os PDFs do período (renderiza só os que faltam no storage)."""
+    key = zip_key(start, end, owner_id)
+    if default_storage.exists(key):
+        return key
+    # em disco, não em memória: o período pode ter milhares de PDFs
+    with tempfile.TemporaryFile() as tmp:
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for rep in period_reports(start, end, owner_id).iterator(chunk_size=200):
+                with default_storage.open(ensure_pdf(rep), 'rb') as fh:
+                    zf.writestr(f"relatorio-{rep.pk}-{rep.appointment.when:%Y%m%d}.pdf", fh.read())
+        tmp.seek(0)
+        default_storage.save(key, File(tmp))
+    return key
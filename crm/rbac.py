@@ -0,0 +1,119 @@
+"""
+Resolução de RBAC (Admin/Gestor vs Representante) em um só lugar.
+
+Access resolve papel e representante uma única vez por request
+(RBACMiddleware anexa em request.access) e escopa querysets de médicos
+pela tabela DoctorVisibility (crm.visibility). Opcionalmente guarda o
+resultado no cache entre requests (RBAC_CACHE_TTL > 0); os signals
+invalidam ao mudar grupos, usuário ou atribuições.
+"""
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+
+from greens_scheduler import db
+
+MANAGER_GROUPS = ("Admin", "Gestor")
+
+
+def _ttl():
+    return getattr(settings, 'RBAC_CACHE_TTL', 0)
+
+
+def _generation():
+    return cache.get('rbac:gen', 0)
+
+
+def cache_key(user_id):
+    return f"rbac:{_generation()}:user:{user_id}"
+
+
+def resolve(user):
+    """Dicionário com is_manager e rep_id do usuário."""
+    from .models import Representative
+
+    if not getattr(user, 'is_authenticated', False):
+        return {'is_manager': False, 'rep_id': None}
+    ttl = _ttl()
+    key = cache_key(user.pk)
+    if ttl:
+        data = cache.get(key)
+        if data is not None:
+            return data
+    # com cache entre requests, não guardar o que veio de uma réplica atrasada
+    with db.primary() if ttl else nullcontext():
+        is_manager = user.is_superuser or user.groups.filter(name__in=MANAGER_GROUPS).exists()
+        rep_id = Representative.objects.filter(user=user).values_list('pk', flat=True).first()
+    data = {'is_manager': is_manager, 'rep_id': rep_id}
+    if ttl:
+        cache.set(key, data, ttl)
+    return data
+
+
+def invalidate_user(user_id):
+    cache.delete(cache_key(user_id))
+
+
+def invalidate_all():
+    try:
+        cache.incr('rbac:gen')
+    except ValueError:
+        cache.set('rbac:gen', 1, None)
+
+
+class Access:
+    """Papel e escopo do usuário; resolve no primeiro acesso e reaproveita no resto do request."""
+
+    def __init__(self, user):
+        self.user = user
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = resolve(self.user)
+        return self._data
+
+    @property
+    def is_manager(self):
+        return self.data['is_manager']
+
+    @property
+    def is_superuser(self):
+        return bool(getattr(self.user, 'is_superuser', False))
+
+    @property
+    def rep_id(self):
+        return self.data['rep_id']
+
+    def scope_by_owner(self, qs, field='owner'):
+        # Representante só enxerga o que é dele
+        return qs if self.is_manager else qs.filter(**{field: self.user})
+
+    def visible_doctors(self, qs=None):
+        """
+        Regra única de médicos visíveis (telas, formulários, lookup e APIs):
+        gestor vê todos; representante, os da tabela de visibilidade (join, sem
+        DISTINCT); sem papel, os que ele mesmo cadastrou.
+        """
+        from .models import Doctor
+        from .visibility import doctors_for
+        qs = Doctor.objects.all() if qs is None else qs
+        if self.is_manager:
+            return qs
+        if self.rep_id:
+            return doctors_for(qs, self.rep_id)
+        return qs.filter(owner=self.user)
+
+
+def for_request(request):
+    """Access do request (criado pelo RBACMiddleware ou aqui, na primeira chamada)."""
+    access = getattr(request, 'access', None)
+    if access is None:
+        access = request.access = Access(request.user)
+    return access
+
+
+def is_manager(user):
+    return resolve(user)['is_manager']
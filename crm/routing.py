@@ -0,0 +1,362 @@
+"""
+Roteiro semanal sugerido por representante.
+
+Entradas: médicos atribuídos (Assignment), a cidade/UF das instituições de
+cada médico, as visitas já marcadas na semana e o que falta da meta mensal.
+Saída: uma sequência de visitas por dia útil, escolhida por vizinho mais
+próximo ponderado pela meta pendente e refinada com 2-opt.
+
+As distâncias (em minutos) vêm de uma matriz local em CSV
+(settings.ROUTE_DISTANCE_MATRIX, colunas origem;destino;minutos com
+"Cidade/UF"); pares ausentes caem em estimativas por mesma cidade / UF.
+
+O núcleo (`plan`) é Python puro e não toca o banco; `plan_reps` carrega os
+dados de todos os representantes em poucas consultas para o lote noturno.
+"""
+import csv
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+WEEK_DAYS = 5
+DAY_START = time(8, 0)
+DAY_END = time(18, 0)
+VISIT_MINUTES = 30
+MAX_VISITS_PER_DAY = 8
+# minutos de deslocamento que valem uma visita pendente da meta
+TARGET_WEIGHT = 60
+SAME_CITY_MINUTES = 15
+SAME_UF_MINUTES = 120
+OTHER_UF_MINUTES = 480
+
+
+def location_key(city, state):
+    """'São Paulo', 'sp' -> 'sao paulo/SP' (chave da matriz)."""
+    city = unicodedata.normalize('NFKD', city or '').encode('ascii', 'ignore').decode().strip().lower()
+    return f"{city}/{(state or '').strip().upper()}"
+
+
+class DistanceMatrix:
+    """Minutos entre localidades; simétrica e com estimativa para pares ausentes."""
+    def __init__(self, minutes=None):
+        self.minutes = {}
+        for (a, b), m in (minutes or {}).items():
+            self.add(a, b, m)
+
+    def add(self, a, b, minutes):
+        self.minutes[(a, b)] = self.minutes[(b, a)] = minutes
+
+    @classmethod
+    def from_csv(cls, path):
+        matrix = cls()
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.reader(f, delimiter=';'):
+                if len(row) < 3 or not row[2].strip().replace('.', '', 1).isdigit():
+                    continue   # cabeçalho ou linha inválida
+                a, b = (location_key(*(p.rsplit('/', 1) + [''])[:2]) for p in row[:2])
+                matrix.add(a, b, float(row[2]))
+        return matrix
+
+    def __call__(self, a, b):
+        # granularidade é a cidade: entre dois endereços da mesma cidade conta o deslocamento local
+        if a is None or b is None or a == b:
+            return SAME_CITY_MINUTES
+        m = self.minutes.get((a, b))
+        if m is not None:
+            return m
+        same_uf = a.rsplit('/', 1)[-1] == b.rsplit('/', 1)[-1]
+        return SAME_UF_MINUTES if same_uf else OTHER_UF_MINUTES
+
+
+_matrix_cache = {}
+_START = object()   # início do dia sem âncora: a primeira parada não tem deslocamento
+
+
+def load_matrix():
+    path = getattr(settings, 'ROUTE_DISTANCE_MATRIX', None)
+    if not path or not Path(path).exists():
+        return DistanceMatrix()
+    mtime = Path(path).stat().st_mtime
+    cached = _matrix_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _matrix_cache[path] = (mtime, DistanceMatrix.from_csv(path))
+    return cached[1]
+
+
+# -----------------------------
+# Núcleo do planejamento (sem banco)
+# -----------------------------
+def route_cost(locs, matrix, start=_START):
+    """Minutos de deslocamento percorrendo `locs` em ordem."""
+    cost, cur = 0, start
+    for loc in locs:
+        cost += 0 if cur is _START else matrix(cur, loc)
+        cur = loc
+    return cost
+
+
+def two_opt(stops, matrix, start=_START):
+    """Melhora a ordem de um caminho aberto (a partir de `start`) trocando arestas."""
+    best = list(stops)
+    if len(best) < 3:
+        return best
+    locs = [s['loc'] for s in best]
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(best) - 1):
+            prev = locs[i - 1] if i else start
+            for j in range(i + 1, len(best)):
+                before = after = 0
+                if prev is not _START:
+                    before, after = matrix(prev, locs[i]), matrix(prev, locs[j])
+                if j + 1 < len(best):
+                    before += matrix(locs[j], locs[j + 1])
+                    after += matrix(locs[i], locs[j + 1])
+                if after < before:
+                    best[i:j + 1] = best[i:j + 1][::-1]
+                    locs[i:j + 1] = locs[i:j + 1][::-1]
+                    improved = True
+    return best
+
+
+def _free_windows(day, busy):
+    """Janelas livres do dia entre DAY_START/DAY_END, descontando as visitas marcadas."""
+    tz = timezone.get_current_timezone()
+    cur = timezone.make_aware(datetime.combine(day, DAY_START), tz)
+    end = timezone.make_aware(datetime.combine(day, DAY_END), tz)
+    windows = []
+    for b_start, b_end in sorted(busy):
+        if b_start > cur:
+            windows.append((cur, min(b_start, end)))
+        cur = max(cur, b_end)
+    if cur < end:
+        windows.append((cur, end))
+    return windows
+
+
+def _schedule(day, stops, busy, matrix, start_loc):
+    """Põe horário nas paradas respeitando deslocamento e visitas já marcadas."""
+    windows = _free_windows(day, busy)
+    out, cur_loc, w = [], start_loc, 0
+    cursor = windows[0][0] if windows else None
+    visit = timedelta(minutes=VISIT_MINUTES)
+    for stop in stops:
+        travel = 0 if cur_loc is _START else matrix(cur_loc, stop['loc'])
+        while w < len(windows):
+            begin = max(cursor, windows[w][0]) + timedelta(minutes=travel)
+            if begin + visit <= windows[w][1]:
+                break
+            w += 1
+            cursor = windows[w][0] if w < len(windows) else None
+        if w >= len(windows):
+            break
+        out.append(dict(stop, start=begin, travel=travel))
+        cursor, cur_loc = begin + visit, stop['loc']
+    return out
+
+
+def plan(candidates, matrix, days, busy=None, start_locs=None):
+    """
+    candidates: [{'doctor_id', 'name', 'loc', 'priority'}], um por médico.
+    days: datas da semana a planejar; busy: {data: [(início, fim)]};
+    start_locs: {data: loc da primeira visita já marcada} (âncora do dia).
+    Retorna [{'date', 'visits': [...], 'travel_minutes'}].
+    """
+    busy = busy or {}
+    start_locs = start_locs or {}
+    # agrupa por localidade, cada grupo ordenado por prioridade (pop do fim = maior)
+    by_loc = defaultdict(list)
+    for c in candidates:
+        if c['priority'] > 0:
+            by_loc[c['loc']].append(c)
+    for group in by_loc.values():
+        group.sort(key=lambda c: c['priority'])
+
+    day_minutes = (DAY_END.hour - DAY_START.hour) * 60 + DAY_END.minute - DAY_START.minute
+    result = []
+    for day in days:
+        used = sum((e - s).total_seconds() / 60 for s, e in busy.get(day, ()))
+        budget = day_minutes - used
+        start = cur = start_locs.get(day, _START)
+        stops = []
+        while by_loc and budget >= VISIT_MINUTES and len(stops) < MAX_VISITS_PER_DAY:
+            best, best_score = None, None
+            for loc, group in by_loc.items():
+                if cur is _START:
+                    travel = 0
+                else:
+                    travel = matrix(cur, loc)
+                    if travel + VISIT_MINUTES > budget:
+                        continue
+                score = group[-1]['priority'] * TARGET_WEIGHT - travel
+                if best_score is None or score > best_score:
+                    best, best_score, best_travel = loc, score, travel
+            if best is None:
+                break
+            stop = by_loc[best].pop()
+            if not by_loc[best]:
+                del by_loc[best]
+            stops.append(stop)
+            budget -= best_travel + VISIT_MINUTES
+            cur = best
+        stops = two_opt(stops, matrix, start)
+        visits = _schedule(day, stops, busy.get(day, ()), matrix, start)
+        # o que não coube no horário volta para os próximos dias
+        for stop in stops[len(visits):]:
+            by_loc[stop['loc']].append(stop)
+            by_loc[stop['loc']].sort(key=lambda c: c['priority'])
+        result.append({
+            'date': day,
+            'visits': visits,
+            'travel_minutes': round(sum(v['travel'] for v in visits)),
+        })
+    return result
+
+
+# -----------------------------
+# Carga dos dados e lote por representante
+# -----------------------------
+def week_days(week_start, first_day=None):
+    """Dias úteis da semana de `week_start` (segunda), a partir de `first_day`."""
+    days = [week_start + timedelta(days=i) for i in range(WEEK_DAYS)]
+    return [d for d in days if first_day is None or d >= first_day]
+
+
+def _month_bounds(day):
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _weeks_left(day):
+    _, end = _month_bounds(day)
+    return max(1, -(-(end - day).days // 7))
+
+
+def plan_reps(week_start, rep_ids=None, first_day=None, matrix=None):
+    """
+    Planeja a semana para vários representantes com um punhado de consultas.
+    Retorna {rep_id: resultado de `plan`}.
+    """
+    from .models import Appointment, Assignment, Doctor, Representative
+
+    matrix = matrix or load_matrix()
+    days = week_days(week_start, first_day)
+    if not days:
+        return {}
+    tz = timezone.get_current_timezone()
+    month_start, month_end = _month_bounds(days[0])
+    week_from = timezone.make_aware(datetime.combine(days[0], time.min), tz)
+    week_to = timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min), tz)
+
+    reps = Representative.objects.all()
+    if rep_ids is not None:
+        reps = reps.filter(pk__in=rep_ids)
+    rep_users = dict(reps.values_list('pk', 'user_id'))
+
+    targets = defaultdict(dict)
+    for rep_id, doctor_id, target in (
+        Assignment.objects.filter(active=True, representative_id__in=rep_users)
+        .values('representative_id', 'physician_id')
+        .annotate(target=Sum('monthly_target'))
+        .values_list('representative_id', 'physician_id', 'target')
+    ):
+        targets[rep_id][doctor_id] = target
+    doctor_ids = {d for per_rep in targets.values() for d in per_rep}
+
+    month_visits = dict(
+        Appointment.objects.filter(doctor_id__in=doctor_ids, when__date__gte=month_start,
+                                   when__date__lt=month_end)
+        .exclude(status='cancelada')
+        .values('doctor_id').annotate(n=Count('id')).values_list('doctor_id', 'n')
+    )
+    week_appts = list(
+        Appointment.objects.filter(owner_id__in=rep_users.values(), when__gte=week_from, when__lt=week_to)
+        .exclude(status='cancelada')
+        .values_list('owner_id', 'doctor_id', 'when', 'ends_at')
+    )
+    doctor_ids |= {row[1] for row in week_appts}
+
+    inst_locs = {}
+    for doctor_id, city, state in (
+        Doctor.institutions.through.objects.filter(doctor_id__in=doctor_ids)
+        .order_by('doctor_id', 'id').values_list('doctor_id', 'organization__city', 'organization__state')
+    ):
+        if doctor_id not in inst_locs and (city or state):
+            inst_locs[doctor_id] = location_key(city, state)
+    names, locs = {}, {}
+    for pk, name, uf in Doctor.objects.filter(pk__in=doctor_ids).values_list('pk', 'name', 'uf'):
+        # sem instituição, cai na UF do médico (ou em "local desconhecido")
+        names[pk] = name
+        locs[pk] = inst_locs.get(pk) or (location_key('', uf) if uf else None)
+
+    busy = defaultdict(lambda: defaultdict(list))
+    anchors = defaultdict(dict)
+    seen_week = defaultdict(set)
+    for owner_id, doctor_id, when, ends_at in sorted(week_appts, key=lambda r: r[2]):
+        day = timezone.localtime(when).date()
+        busy[owner_id][day].append((when, ends_at))
+        anchors[owner_id].setdefault(day, locs.get(doctor_id))
+        seen_week[owner_id].add(doctor_id)
+
+    weeks_left = _weeks_left(days[0])
+    plans = {}
+    for rep_id, user_id in rep_users.items():
+        candidates = []
+        for doctor_id, target in targets.get(rep_id, {}).items():
+            remaining = target - month_visits.get(doctor_id, 0)
+            if remaining <= 0 or doctor_id in seen_week[user_id]:
+                continue
+            candidates.append({
+                'doctor_id': doctor_id, 'name': names.get(doctor_id, ''),
+                'loc': locs.get(doctor_id), 'remaining': remaining,
+                'priority': remaining / weeks_left,
+            })
+        plans[rep_id] = plan(candidates, matrix, days, busy[user_id], anchors[user_id])
+    return plans
+
+
+def _serialize(result):
+    return [{
+        'date': d['date'].isoformat(),
+        'travel_minutes': d['travel_minutes'],
+        'visits': [{
+            'doctor_id': v['doctor_id'], 'doctor': v['name'], 'loc': v['loc'],
+            'start': v['start'].isoformat(), 'travel': v['travel'], 'remaining': v['remaining'],
+        } for v in d['visits']],
+    } for d in result]
+
+
+def build_plans(week_start, rep_ids=None, first_day=None):
+    """Calcula e grava (upsert) os RoutePlan da semana. Retorna quantos foram gravados."""
+    from .models import RoutePlan
+
+    plans = plan_reps(week_start, rep_ids, first_day)
+    rows = [
+        RoutePlan(
+            representative_id=rep_id, week_start=week_start, payload=_serialize(result),
+            visits=sum(len(d['visits']) for d in result),
+            travel_minutes=sum(d['travel_minutes'] for d in result),
+        )
+        for rep_id, result in plans.items()
+    ]
+    RoutePlan.objects.bulk_create(
+        rows, batch_size=500, update_conflicts=True,
+        unique_fields=['representative', 'week_start'],
+        update_fields=['payload', 'visits', 'travel_minutes', 'updated_at'],
+    )
+    return len(rows)
+
+
+def current_week(day=None):
+    """Semana a planejar: a de `day` (padrão amanhã); sábado/domingo já olham a próxima."""
+    day = day or timezone.localdate() + timedelta(days=1)
+    if day.weekday() >= WEEK_DAYS:
+        day += timedelta(days=7 - day.weekday())
+    return day - timedelta(days=day.weekday()), day
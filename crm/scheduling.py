@@ -0,0 +1,127 @@
+"""
+Agendamento em lote de visitas (rotas mensais dos gestores).
+
+Valida o lote inteiro com consultas por conjunto (médicos visíveis e donos
+em uma consulta cada), grava tudo com um bulk_create em uma transação e
+enfileira os efeitos colaterais (planilha e outbox da agenda) uma vez por lote.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history
+
+from greens_scheduler import metrics
+
+from . import alerts, attainment, calendar_sync, conflicts, coverage, sync
+from .models import DEFAULT_DURATION_MINUTES, MAX_DURATION_MINUTES, Appointment, STATUS_CHOICES, VisitExport
+from .utils import visit_export_row
+
+MAX_BATCH = 1000
+STATUS_MAP = dict(STATUS_CHOICES)
+
+
+def _as_int(value):
+    """Inteiro vindo do JSON: aceita int ou texto com dígitos (bool, float, listas etc. não)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def _text(value):
+    """Campo de texto opcional do JSON: None vira '', qualquer coisa que não seja str é inválida."""
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else None
+
+
+def validate(entries, user, access, parse_when):
+    """
+    Devolve (visitas não salvas, erros). Cada erro é {'index': i, 'error': msg};
+    se houver qualquer erro, nada deve ser gravado.
+    """
+    errors = []
+    if not isinstance(entries, list) or not entries:
+        return [], [{'index': None, 'error': 'expected a non-empty list'}]
+    if len(entries) > MAX_BATCH:
+        return [], [{'index': None, 'error': f'at most {MAX_BATCH} visits per batch'}]
+
+    parsed = []
+    for i, e in enumerate(entries):
+        if not isinstance(e, dict):
+            errors.append({'index': i, 'error': 'invalid item'})
+            continue
+        # os valores vêm do JSON sem tipo garantido: checa antes de converter
+        start = e.get('start')
+        doctor_id = _as_int(e.get('doctor'))
+        when = parse_when(start) if isinstance(start, str) else None
+        status = e.get('status') or 'agendada'
+        duration = _as_int(e.get('duration') or DEFAULT_DURATION_MINUTES)
+        owner_id = _as_int(e.get('owner')) if e.get('owner') else user.pk
+        contact_name, notes = _text(e.get('contact_name')), _text(e.get('notes'))
+        if doctor_id is None:
+            errors.append({'index': i, 'error': 'invalid doctor'})
+        elif when is None:
+            errors.append({'index': i, 'error': 'invalid start'})
+        elif duration is None or not 5 <= duration <= MAX_DURATION_MINUTES:
+            errors.append({'index': i, 'error': 'invalid duration'})
+        elif not isinstance(status, str) or status not in STATUS_MAP:
+            errors.append({'index': i, 'error': 'invalid status'})
+        elif owner_id is None or (owner_id != user.pk and not access.is_manager):
+            errors.append({'index': i, 'error': 'invalid owner'})
+        elif contact_name is None:
+            errors.append({'index': i, 'error': 'invalid contact_name'})
+        elif notes is None:
+            errors.append({'index': i, 'error': 'invalid notes'})
+        else:
+            parsed.append((i, doctor_id, when, duration, status, owner_id, contact_name, notes))
+
+    # uma consulta para os médicos visíveis e outra para os donos
+    doctors = access.visible_doctors().in_bulk({p[1] for p in parsed})
+    owner_ids = {p[5] for p in parsed}
+    valid_owners = set(get_user_model().objects.filter(pk__in=owner_ids, is_active=True)
+                       .values_list('pk', flat=True))
+
+    appts, indexes = [], []
+    for i, doctor_id, when, duration, status, owner_id, contact_name, notes in parsed:
+        if doctor_id not in doctors:
+            errors.append({'index': i, 'error': 'doctor not visible'})
+        elif owner_id not in valid_owners:
+            errors.append({'index': i, 'error': 'invalid owner'})
+        else:
+            appt = Appointment(
+                doctor=doctors[doctor_id], when=when, duration=duration, status=status, owner_id=owner_id,
+                contact_name=contact_name[:120], notes=notes,
+            )
+            appt.compute_end()   # bulk_create não passa pelo save()
+            appts.append(appt)
+            indexes.append(i)
+
+    # sobreposição com a agenda gravada e dentro do próprio lote, numa consulta só
+    active = [(i, a) for i, a in zip(indexes, appts) if a.status != 'cancelada']
+    clashes = conflicts.check_slots([
+        {'owner_id': a.owner_id, 'doctor_id': a.doctor_id, 'start': a.when, 'end': a.ends_at} for _, a in active
+    ])
+    for n, reason in clashes.items():
+        errors.append({'index': active[n][0], 'error': reason})
+    errors.sort(key=lambda err: err['index'])
+    return appts, errors
+
+
+def create_batch(appts, user):
+    """Grava o lote e seus efeitos (saves em massa não disparam os signals)."""
+    with transaction.atomic():
+        created = bulk_create_with_history(appts, Appointment, batch_size=500, default_user=user)
+        VisitExport.objects.bulk_create(
+            [VisitExport(appointment=a, payload=visit_export_row(a)) for a in created], batch_size=500
+        )
+        sync.bump_on_commit('appointment', {a.owner_id for a in created})
+        coverage.track([(a.doctor_id, a.when, 1) for a in created])
+        attainment.mark_dirty(*{a.when for a in created})
+        alerts.mark_dirty(*{a.when for a in created})
+        calendar_sync.enqueue_many(created)
+        n = len(created)
+        transaction.on_commit(lambda: metrics.inc('appointments_created_total', n))
+    return created
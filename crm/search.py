@@ -0,0 +1,316 @@
+"""
+Busca de médicos e organizações (typeahead, contatos e admin).
+
+- Cada linha guarda em `search_text` um documento normalizado (minúsculas,
+  sem acento): nome, CRM/UF, especialidade e, no médico, os nomes das
+  instituições. Mantido pelo save() e pelos signals; `reindex_doctors`
+  cobre os caminhos em lote (importador, comando `rebuild_search_index`).
+- Postgres: índice GIN trigram (pg_trgm) em search_text, criado pela
+  migração 0016. Cada termo vira um LIKE '%termo%' indexado; sem resultado
+  suficiente, cai no operador fuzzy de word_similarity (erros de digitação).
+- Outros bancos (SQLite em dev/CI): índice invertido de trigramas em
+  memória do processo. Saves e reindexações aplicam só as linhas alteradas
+  (index_changed, depois do commit) e incrementam a versão "search-<modelo>";
+  um processo que ficou para trás (gravação feita por outro) reconstrói o
+  índice na próxima busca.
+"""
+import heapq
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_SIMILARITY = 0.3      # limiar do fuzzy (igual ao padrão do pg_trgm)
+INDEXES = {
+    'crm_doctor': 'doctor_search_trgm_idx',
+    'crm_organization': 'org_search_trgm_idx',
+}
+
+_SEP = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """'Dr. João Açaí' -> 'dr joao acai'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(_SEP.split(text)).strip()
+
+
+def doctor_document(doctor, institutions=()):
+    # "12345 sp" e "12345sp": o CRM costuma ser digitado das duas formas
+    crm = f'{doctor.crm}{doctor.uf}' if doctor.crm and doctor.uf else ''
+    return normalize(' '.join([doctor.name, doctor.crm, doctor.uf, crm, doctor.specialty, *institutions]))
+
+
+def organization_document(org):
+    return normalize(' '.join([org.name, org.cnpj, org.city, org.state]))
+
+
+def reindex_doctors(doctor_ids=None, batch_size=2000):
+    """Recalcula search_text (com instituições) dos médicos; todos se doctor_ids for None."""
+    from .models import Doctor
+
+    qs = Doctor.objects.only('id', 'name', 'crm', 'uf', 'specialty', 'search_text').order_by('pk')
+    if doctor_ids is not None:
+        qs = qs.filter(pk__in=list(doctor_ids))
+    through = Doctor.institutions.through
+    changed = 0
+    last = 0
+    while True:
+        batch = list(qs.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            break
+        last = batch[-1].pk
+        names = defaultdict(list)
+        rows = through.objects.filter(doctor_id__in=[d.pk for d in batch]).values_list(
+            'doctor_id', 'organization__name')
+        for doctor_id, name in rows:
+            names[doctor_id].append(name)
+        dirty = []
+        for doctor in batch:
+            text = doctor_document(doctor, names[doctor.pk])
+            if text != doctor.search_text:
+                doctor.search_text = text
+                dirty.append(doctor)
+        Doctor.objects.bulk_update(dirty, ['search_text'], batch_size=500)
+        index_changed(Doctor, [(d.pk, d.search_text) for d in dirty])
+        changed += len(dirty)
+    if changed:
+        caching.bump_on_commit('doctor')
+    return changed
+
+
+def reindex_organizations(batch_size=2000):
+    from .models import Organization
+
+    dirty = []
+    for org in Organization.objects.only('id', 'name', 'cnpj', 'city', 'state', 'search_text').iterator(
+            chunk_size=batch_size):
+        text = organization_document(org)
+        if text != org.search_text:
+            org.search_text = text
+            dirty.append(org)
+    Organization.objects.bulk_update(dirty, ['search_text'], batch_size=500)
+    index_changed(Organization, [(o.pk, o.search_text) for o in dirty])
+    if dirty:
+        caching.bump_on_commit('organization')
+    return len(dirty)
+
+
+# -----------------------------
+# Consulta
+# -----------------------------
+def _trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class LocalIndex:
+    """Índice invertido de trigramas (id -> texto) para bancos sem pg_trgm."""
+
+    def __init__(self, rows):
+        self.texts = {}
+        self.postings = defaultdict(set)
+        for pk, text in rows:
+            self.upsert(pk, text)
+
+    def upsert(self, pk, text):
+        self.remove(pk)
+        self.texts[pk] = text
+        for gram in _trigrams(text):
+            self.postings[gram].add(pk)
+
+    def remove(self, pk):
+        old = self.texts.pop(pk, None)
+        if old is None:
+            return
+        for gram in _trigrams(old):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(pk)
+                if not ids:
+                    del self.postings[gram]
+
+    def search(self, term, limit, allowed=None):
+        """[(pk, score)] ordenados: prefixo > substring > similaridade de trigramas."""
+        tokens = term.split()
+        exact = self._exact(tokens)
+        if allowed is not None:
+            exact &= allowed
+        scored = [(pk, self._score(pk, term, tokens, 2)) for pk in exact]
+        if len(scored) < limit and len(term) >= 3:
+            scored += [item for item in self._fuzzy(term, exact) if allowed is None or item[0] in allowed]
+        return heapq.nsmallest(limit, scored, key=lambda item: (-item[1], len(self.texts[item[0]]), item[0]))
+
+    def _exact(self, tokens):
+        # termos curtos valem como prefixo de palavra; os demais, como substring
+        grams = set()
+        for token in tokens:
+            if len(token) < 3:
+                grams.add(f'  {token}'[-3:] if len(token) == 1 else f' {token}')
+            else:
+                grams.update(token[i:i + 3] for i in range(len(token) - 2))
+        postings = sorted((self.postings.get(g, set()) for g in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {pk for pk in candidates if all(t in self.texts[pk] for t in tokens)}
+
+    def _score(self, pk, term, tokens, base):
+        text = self.texts[pk]
+        words = text.split()
+        score = base + (2 if text.startswith(term) else 0)
+        score += sum(1 for t in tokens if any(w.startswith(t) for w in words)) / len(tokens)
+        return score
+
+    def _fuzzy(self, term, skip):
+        grams = _trigrams(term)
+        hits = Counter()
+        for gram in grams:
+            hits.update(self.postings.get(gram, ()))
+        return [
+            (pk, n / len(grams)) for pk, n in hits.items()
+            if pk not in skip and n / len(grams) >= MIN_SIMILARITY
+        ]
+
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _local_version_name(model):
+    return f'search-{model._meta.model_name}'
+
+
+def _local_version(model):
+    return cache.get(caching.version_key(_local_version_name(model)), 0)
+
+
+def _local_search(model, term, limit, allowed):
+    # busca e atualizações sob o mesmo lock: index_changed mexe nos conjuntos em lugar
+    name = model._meta.model_name
+    version = _local_version(model)
+    with _local_lock:
+        entry = _local.get(name)
+        if entry is None or entry[0] != version:
+            entry = (version, LocalIndex(model.objects.values_list('pk', 'search_text').iterator(chunk_size=5000)))
+            _local[name] = entry
+        return entry[1].search(term, limit, allowed)
+
+
+def index_changed(model, rows=(), deleted=()):
+    """
+    rows: [(pk, search_text)] gravados; deleted: pks excluídos. Depois do
+    commit, aplica ao índice local deste processo e incrementa a versão. Só
+    vale para bancos sem pg_trgm.
+    """
+    rows, deleted = list(rows), list(deleted)
+    if connections['default'].vendor == 'postgresql' or not (rows or deleted):
+        return
+    name = model._meta.model_name
+
+    def apply():
+        version = caching.bump(_local_version_name(model))
+        with _local_lock:
+            entry = _local.get(name)
+            # só aplica se o índice estava em dia; senão a próxima busca reconstrói
+            if entry is None or entry[0] != version - 1:
+                return
+            for pk, text in rows:
+                entry[1].upsert(pk, text)
+            for pk in deleted:
+                entry[1].remove(pk)
+            _local[name] = (version, entry[1])
+
+    transaction.on_commit(apply)
+
+
+def invalidate_local():
+    """Caminhos em lote sem as linhas à mão (base sintética): todos os processos reconstroem."""
+    from .models import Doctor, Organization
+    for model in (Doctor, Organization):
+        caching.bump(_local_version_name(model))
+
+
+def _use_trigram_index(qs):
+    return connections[qs.db].vendor == 'postgresql'
+
+
+def ranked(qs, term, limit=DEFAULT_LIMIT):
+    """
+    Até `limit` objetos de qs (Doctor ou Organization) que casam com o termo,
+    do mais relevante para o menos. qs já vem escopado (RBAC) pelo chamador.
+    """
+    term = normalize(term)
+    if not term:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    table = qs.model._meta.db_table
+    if _use_trigram_index(qs):
+        found = list(
+            matching(qs, term).annotate(
+                _prefix=Case(When(search_text__startswith=term, then=Value(1)), default=Value(0),
+                             output_field=IntegerField()),
+                _sim=RawSQL(f'word_similarity(%s, {table}.search_text)', [term], output_field=FloatField()),
+            ).order_by('-_prefix', '-_sim', 'name')[:limit]
+        )
+        if len(found) < limit and len(term) >= 3:
+            seen = [obj.pk for obj in found]
+            found += list(
+                qs.filter(RawSQL(f'%s <%% {table}.search_text', [term], output_field=BooleanField()))
+                .exclude(pk__in=seen)
+                .annotate(_sim=RawSQL(f'word_similarity(%s, {table}.search_text)', [term], output_field=FloatField()))
+                .order_by('-_sim', 'name')[:limit - len(found)]
+            )
+        return found
+    # fallback: índice local; o escopo (RBAC) vira o conjunto de ids permitidos
+    allowed = set(qs.values_list('pk', flat=True)) if qs.query.where else None
+    hits = _local_search(qs.model, term, limit, allowed)
+    order = {pk: i for i, (pk, _) in enumerate(hits)}
+    objs = list(qs.filter(pk__in=list(order)))
+    objs.sort(key=lambda obj: order[obj.pk])
+    return objs
+
+
+def matching(qs, term):
+    """Filtro (sem ranking) para listas paginadas e admin: todos os termos presentes."""
+    term = normalize(term)
+    for token in term.split():
+        qs = qs.filter(search_text__contains=token)
+    return qs
+
+
+def install_indexes(conn=None):
+    """
+    Cria os índices GIN trigram no Postgres (pg_trgm). Sem permissão para a
+    extensão, registra um aviso: a busca funciona, mas com varredura.
+    Retorna os nomes instalados.
+    """
+    conn = conn or connections['default']
+    if conn.vendor != 'postgresql':
+        return []
+    with conn.cursor() as cursor:
+        try:
+            with transaction.atomic(using=conn.alias):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except Exception:
+            logger.warning('pg_trgm indisponível; busca sem índice trigram', exc_info=True)
+            return []
+        for table, name in INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (search_text gin_trgm_ops)')
+    return list(INDEXES.values())
@@ -0,0 +1,206 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from greens_scheduler import metrics
+
+from . import alerts, attainment, caching, calendar_sync, coverage, rbac, search, sync, visibility
+from .models import Appointment, Assignment, CalendarOutbox, Deal, Doctor, Organization, Representative
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_coverage_saved(sender, instance, created, **kwargs):
+    # delta na cobertura: sai o par (médico, data) antigo, entra o novo
+    old = None if created else getattr(instance, '_coverage_state', None)
+    new = (instance.doctor_id, instance.when)
+    if old != new:
+        coverage.track([(*new, 1)] + ([(*old, -1)] if old else []))
+    instance._coverage_state = new
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_coverage_deleted(sender, instance, **kwargs):
+    doctor_id, when = getattr(instance, '_coverage_state', None) or (instance.doctor_id, instance.when)
+    coverage.track([(doctor_id, when, -1)])
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_calendar_upsert(sender, instance, **kwargs):
+    calendar_sync.enqueue(instance, CalendarOutbox.ACTION_UPSERT)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_created_metric(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: metrics.inc('appointments_created_total'))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_calendar_delete(sender, instance, **kwargs):
+    calendar_sync.enqueue(instance, CalendarOutbox.ACTION_DELETE)
+
+
+# -----------------------------
+# Atingimento de metas e alertas: invalida só o que as datas (antiga e nova) tocam
+# -----------------------------
+@receiver(post_init, sender=Appointment)
+def appointment_loaded(sender, instance, **kwargs):
+    instance._attainment_when = instance.__dict__.get('when')
+    instance._coverage_state = (instance.__dict__.get('doctor_id'), instance.__dict__.get('when'))
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def appointment_attainment_changed(sender, instance, **kwargs):
+    old = getattr(instance, '_attainment_when', None)
+    attainment.mark_dirty(old, instance.when)
+    alerts.mark_dirty(old, instance.when)
+    instance._attainment_when = instance.when
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def assignment_attainment_changed(sender, instance, **kwargs):
+    transaction.on_commit(attainment.invalidate_all)
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def doctor_changed(sender, instance, created=True, signal=None, **kwargs):
+    # só inclusão/exclusão mexem no total de médicos
+    if created:
+        coverage.doctors_changed(-1 if signal is post_delete else 1)
+    # nome/CRM aparecem nos fragmentos em cache (dropdowns, tabela de contatos)
+    caching.bump_on_commit('doctor')
+    if signal is post_delete:
+        search.index_changed(Doctor, deleted=[instance.pk])
+    else:
+        search.index_changed(Doctor, [(instance.pk, instance.search_text)])
+
+
+# -----------------------------
+# Índice de busca: instituições entram no documento do médico
+# -----------------------------
+@receiver(m2m_changed, sender=Doctor.institutions.through)
+def doctor_institutions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._search_doctor_ids = list(instance.physicians.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.reindex_doctors([instance.pk])
+    elif action == 'post_clear':
+        search.reindex_doctors(getattr(instance, '_search_doctor_ids', []))
+    elif pk_set:
+        search.reindex_doctors(pk_set)
+
+
+@receiver(post_init, sender=Organization)
+def organization_loaded(sender, instance, **kwargs):
+    instance._search_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Organization)
+def organization_search_changed(sender, instance, created, **kwargs):
+    caching.bump_on_commit('organization')
+    search.index_changed(Organization, [(instance.pk, instance.search_text)])
+    if not created and instance.name != instance._search_name:
+        search.reindex_doctors(instance.physicians.values_list('pk', flat=True))
+    instance._search_name = instance.name
+
+
+@receiver(pre_delete, sender=Organization)
+def organization_deleting(sender, instance, **kwargs):
+    # as linhas do M2M somem em cascata, sem m2m_changed
+    instance._search_doctor_ids = list(instance.physicians.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Organization)
+def organization_deleted(sender, instance, **kwargs):
+    caching.bump_on_commit('organization')
+    search.index_changed(Organization, deleted=[instance.pk])
+    ids = getattr(instance, '_search_doctor_ids', [])
+    if ids:
+        transaction.on_commit(lambda: search.reindex_doctors(ids))
+
+
+# -----------------------------
+# Versões de sync (ETag / delta) das APIs de agenda e deals
+# -----------------------------
+def _remember_owner(sender, instance, **kwargs):
+    # lê do __dict__ para não disparar uma consulta quando o campo veio adiado (only/defer)
+    instance._sync_owner_id = instance.__dict__.get('owner_id')
+
+
+def _bump_versions(sender, instance, **kwargs):
+    owners = {instance.owner_id, getattr(instance, '_sync_owner_id', None)}
+    sync.bump_on_commit(sender._meta.model_name, owners)
+    instance._sync_owner_id = instance.owner_id
+
+
+for _model in (Appointment, Deal):
+    post_init.connect(_remember_owner, sender=_model, dispatch_uid=f'sync-init-{_model.__name__}')
+    post_save.connect(_bump_versions, sender=_model, dispatch_uid=f'sync-save-{_model.__name__}')
+    post_delete.connect(_bump_versions, sender=_model, dispatch_uid=f'sync-delete-{_model.__name__}')
+
+
+# -----------------------------
+# Invalidação do cache de RBAC
+# -----------------------------
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        rbac.invalidate_user(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            rbac.invalidate_user(user_id)
+    else:
+        # clear a partir do grupo: não sabemos quais usuários saíram
+        rbac.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, **kwargs):
+    rbac.invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    rbac.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Representative)
+def representative_changed(sender, instance, **kwargs):
+    rbac.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def assignment_access_changed(sender, instance, **kwargs):
+    user_id = Representative.objects.filter(pk=instance.representative_id).values_list('user_id', flat=True).first()
+    if user_id:
+        rbac.invalidate_user(user_id)
+
+
+# -----------------------------
+# Médicos visíveis por representante
+# -----------------------------
+@receiver(post_init, sender=Assignment)
+def assignment_loaded(sender, instance, **kwargs):
+    instance._visibility_pair = (instance.__dict__.get('representative_id'), instance.__dict__.get('physician_id'))
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def assignment_visibility_changed(sender, instance, **kwargs):
+    pairs = {(instance.representative_id, instance.physician_id),
+             getattr(instance, '_visibility_pair', (None, None))}
+    for rep_id, doctor_id in pairs:
+        if rep_id and doctor_id:
+            visibility.refresh_pair(rep_id, doctor_id)
+            caching.bump_on_commit('visibility', rep_id)
+            # cobertura depois da visibilidade, que ela usa como base
+            coverage.mark_dirty(rep_id)
+    instance._visibility_pair = (instance.representative_id, instance.physician_id)
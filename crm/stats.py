@@ -0,0 +1,60 @@
+"""
+Agregados do dashboard (totais por status e médicos mais visitados).
+
+Duas consultas por combinação de escopo/filtro: uma agregação condicional
+com as contagens por status e um top-N por médico. O resultado fica no cache
+por CACHE_TTL, numa chave que inclui a versão de sync do escopo
+(crm.sync, incrementada a cada escrita em Appointment): qualquer alteração
+invalida na hora, sem varrer o cache.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from greens_scheduler import db
+
+from . import sync
+from .models import STATUS_CHOICES, Appointment
+
+CACHE_TTL = 60
+TOP_N = 8
+
+
+def _scope(access, user):
+    return sync.scope_name('appointment', None if access.is_manager else user.pk)
+
+
+def cache_key(scope, version, doctor_id, status):
+    return f'stats:{scope}:v{version}:d{doctor_id or 0}:s{status or "-"}'
+
+
+def compute(qs):
+    """Contagens por status (uma consulta) e top-N médicos (outra) do queryset já escopado/filtrado."""
+    counts = qs.aggregate(
+        total=Count('id'),
+        **{code: Count('id', filter=Q(status=code)) for code, _ in STATUS_CHOICES},
+    )
+    top = list(
+        qs.values('doctor_id', 'doctor__name').annotate(n=Count('id')).order_by('-n', 'doctor__name')[:TOP_N]
+    )
+    return {
+        'total': counts.pop('total'),
+        'by_status': counts,
+        'top': [(row['doctor__name'], row['n']) for row in top],
+    }
+
+
+def dashboard_stats(access, user, doctor_id=None, status=None):
+    scope = _scope(access, user)
+    version, _ = sync.current(scope)
+    key = cache_key(scope, version, doctor_id, status)
+    data = cache.get(key)
+    if data is None:
+        qs = access.scope_by_owner(Appointment.objects.all())
+        if doctor_id:
+            qs = qs.filter(doctor_id=doctor_id)
+        if status:
+            qs = qs.filter(status=status)
+        with db.primary():  # chave com a versão nova: não ler de réplica atrasada
+            data = compute(qs)
+        cache.set(key, data, CACHE_TTL)
+    return data
@@ -0,0 +1,109 @@
+"""
+Versionamento por escopo e sync incremental das APIs de agenda e deals.
+
+- ETag / Last-Modified: vêm de SyncVersion, incrementado depois do commit
+  de cada escrita em Appointment/Deal (escopo geral + escopo do dono). Fora
+  da transação do escritor, a linha 'appointment:all' não vira uma fila de
+  locks. O ETag inclui também as versões de cache (crm.caching) dos nomes
+  que aparecem no payload, ex. 'doctor' para doctor__name.
+- Delta (?since=<cursor>): o cursor é o último history_id do
+  simple_history; mudanças e exclusões (tombstones) saem da tabela histórica.
+  Um objeto que passou para outro dono vira tombstone para o dono anterior.
+"""
+import hashlib
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Q
+from django.utils import timezone
+
+from . import caching
+from .models import SyncVersion
+
+
+def scope_name(label, owner_id=None):
+    return f"{label}:all" if owner_id is None else f"{label}:user:{owner_id}"
+
+
+def bump(label, owner_ids=()):
+    scopes = [scope_name(label)] + [scope_name(label, o) for o in sorted({o for o in owner_ids if o})]
+    now = timezone.now()
+    for scope in scopes:
+        updated = SyncVersion.objects.filter(scope=scope).update(version=F('version') + 1, updated_at=now)
+        if not updated:
+            obj, created = SyncVersion.objects.get_or_create(scope=scope, defaults={'version': 1})
+            if not created:
+                SyncVersion.objects.filter(pk=obj.pk).update(version=F('version') + 1, updated_at=now)
+
+
+def bump_on_commit(label, owner_ids=()):
+    owner_ids = set(owner_ids)
+    transaction.on_commit(lambda: bump(label, owner_ids))
+
+
+def current(scope):
+    """(versão, atualizado_em) do escopo; (0, None) se nunca houve escrita."""
+    row = SyncVersion.objects.filter(scope=scope).values_list('version', 'updated_at').first()
+    return row or (0, None)
+
+
+def _request_version(request, scope):
+    # etag_func e last_modified_func do @condition consultam a mesma versão
+    cache = request.__dict__.setdefault('_sync_versions', {})
+    if scope not in cache:
+        cache[scope] = current(scope)
+    return cache[scope]
+
+
+def conditional(scope_func, related=()):
+    """
+    Par (etag_func, last_modified_func) para django.views.decorators.http.condition.
+    scope_func(request) devolve o escopo de versão visível pelo usuário;
+    related são nomes de crm.caching (ex. 'doctor') cujas mudanças também
+    alteram o payload e, portanto, o ETag.
+    """
+    def etag(request, *args, **kwargs):
+        scope = scope_func(request)
+        version, _ = _request_version(request, scope)
+        extra = caching.versions(*related) if related else ''
+        raw = f"{scope}:{version}:{extra}:{request.get_full_path()}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return _request_version(request, scope_func(request))[1]
+
+    return {'etag_func': etag, 'last_modified_func': last_modified}
+
+
+def history_cursor(model):
+    return model.history.model.objects.aggregate(m=Max('history_id'))['m'] or 0
+
+
+def changes_since(model, cursor, owner_id=None):
+    """
+    Lê a tabela histórica após o cursor e devolve (novo_cursor, ids_alterados, ids_excluídos),
+    considerando só o último evento de cada objeto. Com owner_id, entram também
+    os eventos de objetos que já foram desse dono: se o último evento é de
+    outro dono, o objeto sai para ele como exclusão.
+    """
+    history = model.history.model.objects
+    qs = history.filter(history_id__gt=cursor)
+    if owner_id is not None:
+        owned_before = history.filter(id=OuterRef('id'), history_id__lt=OuterRef('history_id'), owner_id=owner_id)
+        qs = qs.filter(Q(owner_id=owner_id) | Exists(owned_before))
+    latest = {}
+    new_cursor = cursor
+    rows = qs.order_by('history_id').values_list('history_id', 'id', 'history_type', 'owner_id')
+    for history_id, obj_id, history_type, row_owner in rows:
+        latest[obj_id] = '-' if owner_id is not None and row_owner != owner_id else history_type
+        new_cursor = history_id
+    changed = [pk for pk, t in latest.items() if t != '-']
+    deleted = [pk for pk, t in latest.items() if t == '-']
+    return new_cursor, changed, deleted
+
+
+def parse_cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
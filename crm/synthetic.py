@@ -0,0 +1,267 @@
+"""
+Base sintética para medir desempenho (comando `generate_synthetic`).
+
+Gera, a partir de uma semente, usuários representantes (bench_rep*) e um
+gestor (bench_gestor), territórios, organizações, médicos com instituições,
+atribuições, anos de visitas (com relatórios e histórico datado) e negócios
+espalhados pelas etapas do pipeline padrão. Tudo em bulk_create, sem
+signals; no fim os derivados (visibilidade, cobertura, versões de cache e
+de sync) são recalculados de uma vez.
+
+Rode numa base vazia (ou dedicada): apagar milhões de linhas pelo ORM
+dispararia os signals (outbox da agenda, histórico) linha a linha.
+
+Cada médico pertence a um só representante e cada representante tem no
+máximo uma visita por horário, então a base respeita as constraints de
+sobreposição (crm.conflicts) também no Postgres.
+"""
+import math
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history
+
+from . import attainment, caching, coverage, rbac, sync, visibility
+from .models import (
+    Appointment, Assignment, Deal, Doctor, Organization, Pipeline, Representative, Stage, Territory, VisitReport,
+)
+from .search import doctor_document, invalidate_local, organization_document
+
+USER_PREFIX = 'bench_'
+TERRITORY_PREFIX = 'Bench '
+BATCH = 5000
+SLOT_HOURS = (8, 9, 10, 11, 13, 14, 15, 16, 17)
+UFS = ('SP', 'RJ', 'MG', 'PR', 'RS', 'SC', 'BA', 'PE', 'GO', 'DF')
+SPECIALTIES = ('Cardiologia', 'Dermatologia', 'Endocrinologia', 'Ginecologia', 'Neurologia',
+               'Oftalmologia', 'Ortopedia', 'Pediatria', 'Psiquiatria', 'Urologia')
+FIRST = ('Ana', 'Bruno', 'Carla', 'Daniel', 'Élida', 'Fábio', 'Gabriela', 'Hélio', 'Íris', 'João',
+         'Lúcia', 'Márcio', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sônia', 'Tiago', 'Vânia', 'Wagner')
+LAST = ('Almeida', 'Barbosa', 'Cardoso', 'Dias', 'Esteves', 'Ferreira', 'Gonçalves', 'Holanda', 'Lima',
+        'Moura', 'Nogueira', 'Oliveira', 'Pereira', 'Queiroz', 'Ribeiro', 'Souza', 'Teixeira', 'Vieira')
+CITIES = ('São Paulo', 'Campinas', 'Santos', 'Rio de Janeiro', 'Niterói', 'Belo Horizonte', 'Curitiba',
+          'Porto Alegre', 'Florianópolis', 'Salvador', 'Recife', 'Goiânia', 'Brasília')
+STAGES = ('Prospecção', 'Qualificação', 'Proposta', 'Fechamento')
+
+
+def plan(appointments, years=2, doctors=None, reps=None):
+    """Tamanhos derivados de `appointments` (cada um pode ser fixado)."""
+    workdays = int((365 * years + 30) * 5 / 7)
+    per_rep = int(workdays * len(SLOT_HOURS) * 0.6)   # 60% da agenda ocupada, no máximo
+    reps = max(reps or max(5, appointments // 2000), math.ceil(appointments / per_rep))
+    doctors = doctors or max(200, appointments // 20)
+    return {
+        'appointments': appointments,
+        'years': years,
+        'reps': reps,
+        'doctors': max(doctors, reps),
+        'organizations': max(20, doctors // 25),
+        'territories': max(3, reps // 5),
+        'deals': max(50, appointments // 10),
+    }
+
+
+def _log(out, msg):
+    if out:
+        out(msg)
+
+
+def _aware(day, hour):
+    return timezone.make_aware(datetime.combine(day, time(hour)), timezone.get_current_timezone())
+
+
+def _workdays(first, last):
+    day, out = first, []
+    while day <= last:
+        if day.weekday() < 5:
+            out.append(day)
+        day += timedelta(days=1)
+    return out
+
+
+def _people(rnd):
+    return f'{rnd.choice(FIRST)} {rnd.choice(LAST)} {rnd.choice(LAST)}'
+
+
+def _users(sizes):
+    User = get_user_model()
+    password = make_password(None)
+    manager = User.objects.create(username=f'{USER_PREFIX}gestor', password=password,
+                                  is_superuser=True, is_staff=True)
+    User.objects.bulk_create([
+        User(username=f'{USER_PREFIX}rep{i}', password=password, first_name=f'Rep {i}')
+        for i in range(sizes['reps'])
+    ])
+    users = list(User.objects.filter(username__startswith=f'{USER_PREFIX}rep').order_by('pk'))
+    Representative.objects.bulk_create([Representative(user=u) for u in users])
+    reps = list(Representative.objects.filter(user__in=users).select_related('user').order_by('pk'))
+    return manager, reps
+
+
+def _doctors(rnd, sizes, manager, out):
+    orgs = [
+        Organization(name=f'{rnd.choice(("Hospital", "Clínica", "Instituto"))} {rnd.choice(LAST)} {i}',
+                     city=rnd.choice(CITIES), state=rnd.choice(UFS), owner=manager)
+        for i in range(sizes['organizations'])
+    ]
+    for org in orgs:
+        org.search_text = organization_document(org)
+    bulk_create_with_history(orgs, Organization, batch_size=BATCH)
+    orgs = list(Organization.objects.filter(owner=manager).order_by('pk'))
+    through = Doctor.institutions.through
+    created = []
+    for start in range(0, sizes['doctors'], BATCH):
+        batch, links = [], []
+        for i in range(start, min(start + BATCH, sizes['doctors'])):
+            batch.append(Doctor(
+                name=f'Dr(a). {_people(rnd)}', crm=str(100000 + i), uf=rnd.choice(UFS),
+                specialty=rnd.choice(SPECIALTIES), email=f'medico{i}@example.com', owner=manager,
+            ))
+        institutions = [rnd.sample(orgs, rnd.choice((0, 1, 1, 2))) for _ in batch]
+        for doctor, insts in zip(batch, institutions):
+            doctor.search_text = doctor_document(doctor, [o.name for o in insts])
+        bulk_create_with_history(batch, Doctor, batch_size=BATCH)
+        ids = list(Doctor.objects.filter(owner=manager, crm__in=[d.crm for d in batch]).order_by('pk')
+                   .values_list('pk', flat=True))
+        for pk, insts in zip(ids, institutions):
+            links += [through(doctor_id=pk, organization_id=o.pk) for o in insts]
+        through.objects.bulk_create(links, batch_size=BATCH)
+        created += ids
+        _log(out, f'  médicos: {len(created)}/{sizes["doctors"]}')
+    return orgs, created
+
+
+def _assignments(rnd, sizes, reps, doctor_ids, first_day):
+    Territory.objects.bulk_create([
+        Territory(name=f'{TERRITORY_PREFIX}{i}', region=rnd.choice(UFS)) for i in range(sizes['territories'])
+    ])
+    territories = list(Territory.objects.filter(name__startswith=TERRITORY_PREFIX).order_by('pk'))
+    by_rep = {rep.pk: [] for rep in reps}
+    rows = []
+    for n, doctor_id in enumerate(doctor_ids):
+        rep = reps[n % len(reps)]
+        territory = territories[(n % len(reps)) % len(territories)]
+        by_rep[rep.pk].append(doctor_id)
+        rows.append(Assignment(physician_id=doctor_id, representative=rep, territory=territory,
+                               monthly_target=rnd.choice((1, 1, 2, 2, 3, 4))))
+    Assignment.objects.bulk_create(rows, batch_size=BATCH)
+    # start é auto_now_add: recua para o início da base, senão os meses antigos ficam sem meta
+    Assignment.objects.filter(representative__in=reps).update(start=first_day)
+    return by_rep
+
+
+def _history_rows(hmodel, entries):
+    """entries: (objeto, history_date, history_type, campos com valor diferente do atual)."""
+    fields = [f.attname for f in hmodel.tracked_fields]
+    return [
+        hmodel(history_date=when, history_type=kind, history_user_id=obj.owner_id,
+               **dict({name: getattr(obj, name) for name in fields}, **changes))
+        for obj, when, kind, changes in entries
+    ]
+
+
+def _appointments(rnd, sizes, reps, by_rep, first_day, out):
+    now = timezone.now()
+    days = _workdays(first_day, timezone.localdate() + timedelta(days=30))
+    slots = len(days) * len(SLOT_HOURS)
+    hmodel = Appointment.history.model
+    remaining, done = sizes['appointments'], 0
+    reports = 0
+    for n, rep in enumerate(reps):
+        count = remaining // (len(reps) - n)
+        remaining -= count
+        doctors = by_rep[rep.pk]
+        if not doctors or not count:
+            continue
+        picks = sorted(rnd.sample(range(slots), count))
+        for chunk_start in range(0, count, BATCH):
+            appts = []
+            for slot in picks[chunk_start:chunk_start + BATCH]:
+                when = _aware(days[slot // len(SLOT_HOURS)], SLOT_HOURS[slot % len(SLOT_HOURS)])
+                if when < now:
+                    status = rnd.choices(('concluida', 'cancelada', 'agendada'), (85, 10, 5))[0]
+                else:
+                    status = 'agendada'
+                appt = Appointment(doctor_id=rnd.choice(doctors), when=when, status=status, owner_id=rep.user_id,
+                                   duration=rnd.choice((30, 30, 45, 60)))
+                appt.compute_end()
+                appts.append(appt)
+            with transaction.atomic():
+                Appointment.objects.bulk_create(appts, batch_size=BATCH)
+                if appts[0].pk is None:
+                    raise RuntimeError('bulk_create sem pk (banco sem RETURNING); use Postgres ou SQLite >= 3.35')
+                # histórico datado: criação alguns dias antes e, se já passou, a mudança de status
+                entries = []
+                for a in appts:
+                    entries.append((a, min(now, a.when - timedelta(days=rnd.randint(1, 20))), '+',
+                                    {'status': 'agendada'}))
+                    if a.status != 'agendada':
+                        entries.append((a, min(now, a.when + timedelta(hours=1)), '~', {}))
+                hmodel.objects.bulk_create(_history_rows(hmodel, entries), batch_size=BATCH)
+                visits = [a for a in appts if a.status == 'concluida' and rnd.random() < 0.3]
+                VisitReport.objects.bulk_create([
+                    VisitReport(appointment=a, visit_number=rnd.choice(('1a', '2a', '3a+')),
+                                objective='Apresentação de portfólio', summary='Visita sintética.')
+                    for a in visits
+                ], batch_size=BATCH)
+            reports += len(visits)
+            done += len(appts)
+        _log(out, f'  visitas: {done}/{sizes["appointments"]}')
+    return done, reports
+
+
+def _deals(rnd, sizes, reps, by_rep, orgs):
+    pipe = Pipeline.objects.filter(is_default=True).first() or Pipeline.objects.first()
+    if pipe is None:
+        pipe = Pipeline.objects.create(name='Padrão', is_default=True)
+        Stage.objects.bulk_create([Stage(pipeline=pipe, name=name, order=i + 1) for i, name in enumerate(STAGES)])
+    stages = list(pipe.stages.order_by('order', 'id'))
+    weights = [len(stages) - i for i in range(len(stages))]
+    today = timezone.localdate()
+    deals = []
+    for i in range(sizes['deals']):
+        rep = reps[i % len(reps)]
+        stage = rnd.choices(stages, weights)[0]
+        deals.append(Deal(
+            title=f'Negócio {i}', organization=rnd.choice(orgs), contact_id=rnd.choice(by_rep[rep.pk] or [None]),
+            amount=Decimal(rnd.randrange(1000, 200000)), pipeline=pipe, stage=stage,
+            status=rnd.choices(('open', 'won', 'lost'), (70, 20, 10))[0],
+            expected_close=today + timedelta(days=rnd.randint(-90, 180)), owner_id=rep.user_id,
+        ))
+    for start in range(0, len(deals), BATCH):
+        bulk_create_with_history(deals[start:start + BATCH], Deal, batch_size=BATCH)
+    return len(deals)
+
+
+def generate(appointments=10000, years=2, doctors=None, reps=None, seed=42, out=None):
+    """Cria a base sintética; devolve os tamanhos gerados."""
+    rnd = random.Random(seed)
+    sizes = plan(appointments, years, doctors, reps)
+    first_day = timezone.localdate() - timedelta(days=365 * years)
+    _log(out, f'gerando: {sizes}')
+    with transaction.atomic():
+        manager, rep_objs = _users(sizes)
+        orgs, doctor_ids = _doctors(rnd, sizes, manager, out)
+        by_rep = _assignments(rnd, sizes, rep_objs, doctor_ids, first_day)
+    created, reports = _appointments(rnd, sizes, rep_objs, by_rep, first_day, out)
+    deals = _deals(rnd, sizes, rep_objs, by_rep, orgs)
+    _log(out, '  recalculando visibilidade, cobertura e versões de cache')
+    with transaction.atomic():
+        visibility.rebuild()
+        coverage.rebuild()
+        sync.bump('appointment', [rep.user_id for rep in rep_objs])
+        sync.bump('deal', [rep.user_id for rep in rep_objs])
+    attainment.invalidate_all()
+    rbac.invalidate_all()
+    for name in ('doctor', 'organization'):
+        caching.bump(name)
+    invalidate_local()
+    return dict(sizes, appointments=created, reports=reports, deals=deals)
+
+
+def exists():
+    return get_user_model().objects.filter(username__startswith=USER_PREFIX).exists()
@@ -0,0 +1,68 @@
+from celery import shared_task
+import logging
+from datetime import date
+
+from greens_scheduler.db import replica_reads
+
+from . import alerts, calendar_sync, coverage, history, importers, pdf, routing, utils
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def export_visits(batch_size=500):
+    n = utils.flush_visit_exports(batch_size=batch_size)
+    if n:
+        logger.info("visitas exportadas: %s", n)
+    return n
+
+
+@shared_task
+def rebuild_coverage():
+    return coverage.rebuild()
+
+
+@shared_task
+def precompute_alerts():
+    with replica_reads():
+        return alerts.precompute()
+
+
+@shared_task
+def render_report_pdf(report_id):
+    return pdf.ensure_pdf_by_id(report_id)
+
+
+@shared_task
+def export_reports_zip(start, end, owner_id=None):
+    """start/end em ISO (AAAA-MM-DD), serializáveis pelo broker."""
+    with replica_reads():
+        return pdf.export_zip(date.fromisoformat(start), date.fromisoformat(end), owner_id)
+
+
+
+@shared_task
+def import_doctors_file(job_id, name, filename, owner_id, update=False, dry_run=False):
+    """Importação enviada pela tela; o arquivo já está no storage (crm.importers.start_job)."""
+    return importers.run_job(job_id, name, filename, owner_id, update, dry_run)
+
+
+@shared_task
+def sync_calendar():
+    """Drena o outbox da agenda externa (disparado no commit e pelo beat)."""
+    stats = calendar_sync.flush()
+    if stats['sent'] or stats['failed']:
+        logger.info('sync de agenda: %s', stats)
+    return stats
+
+
+@shared_task
+def plan_routes():
+    """Lote noturno: roteiro da semana de amanhã para todos os representantes."""
+    week_start, first_day = routing.current_week()
+    return routing.build_plans(week_start, first_day=first_day)
+
+
+@shared_task
+def history_maintenance():
+    return history.run()
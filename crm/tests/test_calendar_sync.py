@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from crm import calendar_sync
+from crm.google_calendar import CalendarError, FakeCalendarClient, event_id
+from crm.models import CalendarOutbox
+
+
+@override_settings(GOOGLE_CALENDAR_SYNC=True)
+class FlushTests(TestCase):
+    def _row(self, appointment_id, summary, **kwargs):
+        return CalendarOutbox.objects.create(
+            appointment_id=appointment_id, action=CalendarOutbox.ACTION_UPSERT,
+            payload={'summary': summary}, **kwargs,
+        )
+
+    def test_sent_and_coalesced_rows_are_deleted(self):
+        self._row(1, 'antiga')
+        self._row(1, 'nova')
+        self._row(2, 'outra')
+        client = FakeCalendarClient()
+        stats = calendar_sync.flush(client=client, rate=0)
+        self.assertEqual((stats['sent'], stats['coalesced']), (2, 1))
+        self.assertEqual(client.events[event_id(1)]['summary'], 'nova')
+        self.assertFalse(CalendarOutbox.objects.exists())
+
+    def test_superseded_row_in_backoff_is_dropped(self):
+        self._row(1, 'antiga', next_attempt_at=timezone.now() + timedelta(hours=1))
+        self._row(1, 'nova')
+        client = FakeCalendarClient()
+        calendar_sync.flush(client=client, rate=0)
+        self.assertEqual(len(client.calls), 1)
+        self.assertFalse(CalendarOutbox.objects.exists())
+
+    def test_failures_go_back_to_queue_or_stay_failed(self):
+        retry, fatal = self._row(1, 'a'), self._row(2, 'b')
+        client = FakeCalendarClient(fail_with=[CalendarError('503'), CalendarError('403', retryable=False)])
+        stats = calendar_sync.flush(client=client, rate=0)
+        self.assertEqual((stats['retried'], stats['failed']), (1, 1))
+        retry.refresh_from_db()
+        fatal.refresh_from_db()
+        self.assertEqual((retry.status, retry.attempts), ('pending', 1))
+        self.assertGreater(retry.next_attempt_at, timezone.now())
+        self.assertEqual(fatal.status, 'failed')
+
+    def test_in_flight_appointment_waits(self):
+        self._row(1, 'enviando', status='sending', next_attempt_at=timezone.now() + calendar_sync.SEND_LEASE)
+        self._row(1, 'nova')
+        client = FakeCalendarClient()
+        self.assertEqual(calendar_sync.flush(client=client, rate=0)['sent'], 0)
+        self.assertEqual(client.calls, [])
+
+    def test_expired_lease_is_requeued(self):
+        self._row(1, 'enviando', status='sending', next_attempt_at=timezone.now() - timedelta(seconds=1))
+        client = FakeCalendarClient()
+        self.assertEqual(calendar_sync.flush(client=client, rate=0)['sent'], 1)
+        self.assertFalse(CalendarOutbox.objects.exists())
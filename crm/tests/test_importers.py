@@ -0,0 +1,77 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from crm.importers import DoctorImporter, iter_rows
+from crm.models import Doctor
+
+CSV = 'Nome;CRM;UF;Especialidade\nDra. Ana;1234;SP;Cardiologia\nDr. Beto;999;RJ;Pediatria\nDra. Ana;1234;SP;\n'
+
+
+def _rows(text):
+    return iter_rows(io.BytesIO(text.encode()), 'medicos.csv')
+
+
+class DoctorImporterTests(TestCase):
+    def test_creates_and_reports_duplicates_in_file(self):
+        report = DoctorImporter().run(_rows(CSV))
+        self.assertEqual((report.created, len(report.conflicts)), (2, 1))
+        self.assertEqual(Doctor.objects.count(), 2)
+
+    def test_update_that_changes_crm_frees_old_key(self):
+        Doctor.objects.create(name='Dra. Ana', crm='1234', uf='SP')
+        # a Ana muda de CRM; um médico novo pode ficar com o CRM antigo
+        report = DoctorImporter(update=True).run(_rows('Nome;CRM;UF\nDra. Ana;5678;SP\nDr. Caio;1234;SP\n'))
+        self.assertEqual((report.updated, report.created, report.conflicts), (1, 1, []))
+
+
+class ImportViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.manager = User.objects.create(username='gestor', is_superuser=True, is_staff=True)
+        cls.other = User.objects.create(username='outro', is_superuser=True, is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = media.name
+        self.client.force_login(self.manager)
+
+    def _upload(self):
+        upload = SimpleUploadedFile('medicos.csv', CSV.encode(), content_type='text/csv')
+        return self.client.post(reverse('contact_import'), {'arquivo': upload})
+
+    def test_import_runs_in_task_and_shows_result(self):
+        response = self._upload()
+        self.assertEqual(response.status_code, 302)
+        result = self.client.get(response['Location'])
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.context['report']['created'], 2)
+        self.assertEqual(len(result.context['conflicts']), 1)
+        self.assertEqual(Doctor.objects.count(), 2)
+        # o arquivo enviado sai do storage quando o job termina
+        self.assertEqual(os.listdir(os.path.join(self.media, 'importacoes')), [])
+
+    def test_status_is_private_to_uploader(self):
+        location = self._upload()['Location']
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(location).status_code, 404)
+        self.assertEqual(self.client.get(reverse('contact_import_status', args=['nao-existe'])).status_code, 404)
+
+    def test_pending_page_while_queued(self):
+        with mock.patch('crm.views._enqueue'):
+            location = self._upload()['Location']
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Refresh'], '3')
+        self.assertContains(response, 'Importando medicos.csv', status_code=202)
@@ -0,0 +1,27 @@
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from greens_scheduler import metrics
+
+
+class MetricsAccessTests(SimpleTestCase):
+    def _request(self, addr, auth=None):
+        headers = {'HTTP_AUTHORIZATION': auth} if auth else {}
+        return RequestFactory().get('/metrics/', REMOTE_ADDR=addr, **headers)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_no_token_in_production_denies_private_network(self):
+        # atrás do proxy todo request chega de rede privada
+        for addr in ('10.0.0.5', '172.18.0.2', '127.0.0.1'):
+            with self.subTest(addr=addr):
+                self.assertFalse(metrics.allowed(self._request(addr)))
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_no_token_in_debug_allows_loopback_only(self):
+        self.assertTrue(metrics.allowed(self._request('127.0.0.1')))
+        self.assertFalse(metrics.allowed(self._request('10.0.0.5')))
+
+    @override_settings(METRICS_TOKEN='s3cret', DEBUG=False)
+    def test_token(self):
+        self.assertTrue(metrics.allowed(self._request('203.0.113.9', 'Bearer s3cret')))
+        self.assertFalse(metrics.allowed(self._request('10.0.0.5', 'Bearer errado')))
+        self.assertFalse(metrics.allowed(self._request('10.0.0.5')))
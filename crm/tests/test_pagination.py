@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from crm import pagination
+from crm.models import Deal, Doctor, Pipeline, Stage
+
+
+def _cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+class KeysetPrecisionTests(TestCase):
+    """Linhas no mesmo milissegundo (importação em lote) não podem sumir entre páginas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='pag', is_superuser=True, is_staff=True)
+        Doctor.objects.bulk_create([
+            Doctor(name=f'Médico {i}', crm=str(1000 + i), uf='SP', owner=cls.user) for i in range(25)
+        ])
+        # mesmo milissegundo, microssegundos diferentes e fora da ordem do id
+        base = datetime(2026, 1, 5, 12, 0, 0, 123000, tzinfo=dt_timezone.utc)
+        for n, pk in enumerate(Doctor.objects.order_by('-pk').values_list('pk', flat=True)):
+            Doctor.objects.filter(pk=pk).update(created_at=base + timedelta(microseconds=n * 37 % 900))
+
+    def _walk(self, per_page):
+        seen, cursor = [], ''
+        while True:
+            request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+            page = pagination.paginate(Doctor.objects.all(), request, ('-created_at', '-id'), per_page=per_page)
+            seen += [d.pk for d in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_every_row_once(self):
+        for per_page in (1, 4, 7):
+            seen = self._walk(per_page)
+            self.assertEqual(len(seen), 25)
+            self.assertEqual(set(seen), set(Doctor.objects.values_list('pk', flat=True)))
+
+    def test_cursor_keeps_microseconds(self):
+        doctor = Doctor.objects.order_by('-created_at', '-id').first()
+        values = pagination.decode_cursor(pagination.encode_cursor(doctor, ('-created_at', '-id')),
+                                          ('-created_at', '-id'), Doctor)
+        self.assertEqual(values, [doctor.created_at, doctor.pk])
+
+
+class CursorValidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='cur', is_superuser=True, is_staff=True)
+        pipe = Pipeline.objects.create(name='Padrão')
+        stage = Stage.objects.create(pipeline=pipe, name='Prospecção', order=1)
+        Deal.objects.create(title='Negócio', pipeline=pipe, stage=stage, owner=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_decode_rejects_wrong_types(self):
+        ordering = ('-created_at', '-id')
+        for values in (['x', 1], ['2026-01-01T00:00:00+00:00', 'abc'], [None, 1], [[1], 1], [True, 1]):
+            with self.subTest(values=values), self.assertRaises(pagination.InvalidCursor):
+                pagination.decode_cursor(_cursor(values), ordering, Doctor)
+
+    def test_lists_fall_back_to_first_page(self):
+        bad = _cursor(['x', 1])
+        for name in ('contacts', 'deal_list'):
+            with self.subTest(view=name):
+                response = self.client.get(reverse(name), {'cursor': bad})
+                self.assertEqual(response.status_code, 302)
+
+    def test_api_rejects_bad_after(self):
+        response = self.client.get(reverse('api_deals'), {'limit': 5, 'after': _cursor(['x', 'y'])})
+        self.assertEqual(response.status_code, 400)
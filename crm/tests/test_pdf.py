@@ -0,0 +1,57 @@
+import tempfile
+import zipfile
+from datetime import date, datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from crm import pdf
+from crm.models import Appointment, Doctor, VisitReport
+
+
+class ReportPdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='pdf', is_superuser=True, is_staff=True)
+        cls.doctor = Doctor.objects.create(name='Dra. Ana', crm='1234', uf='SP', owner=cls.user)
+        appt = Appointment.objects.create(
+            doctor=cls.doctor, owner=cls.user,
+            when=timezone.make_aware(datetime(2026, 3, 10, 9, 0)),
+        )
+        cls.report = VisitReport.objects.create(appointment=appt, objective='Apresentação')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_refresh_does_not_enqueue_again(self):
+        url = reverse('report_pdf', args=[self.report.pk])
+        with mock.patch('crm.views._enqueue') as enqueue:
+            for _ in range(3):
+                self.assertEqual(self.client.get(url).status_code, 202)
+        enqueue.assert_called_once()
+
+    def test_zip_key_follows_pdf_content(self):
+        period = (date(2026, 3, 1), date(2026, 3, 31))
+        keys = [pdf.zip_key(*period)]
+        # nenhuma das duas mexe em updated_at do relatório, mas ambas aparecem no PDF
+        Doctor.objects.filter(pk=self.doctor.pk).update(name='Dra. Ana Souza')
+        keys.append(pdf.zip_key(*period))
+        Appointment.objects.filter(pk=self.report.appointment_id).update(status='concluida')
+        keys.append(pdf.zip_key(*period))
+        self.assertEqual(len(set(keys)), 3)
+
+    def test_export_zip(self):
+        with mock.patch('crm.pdf.render', return_value=b'%PDF-1.4'):
+            key = pdf.export_zip(date(2026, 3, 1), date(2026, 3, 31))
+        with default_storage.open(key, 'rb') as fh, zipfile.ZipFile(fh) as zf:
+            self.assertEqual(zf.namelist(), [f'relatorio-{self.report.pk}-20260310.pdf'])
+            self.assertEqual(zf.read(zf.namelist()[0]), b'%PDF-1.4')
@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from crm.models import Deal, Pipeline, Representative, Stage
+
+
+class RoutePlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.manager = User.objects.create(username='gestor', is_superuser=True, is_staff=True)
+        cls.rep = Representative.objects.create(user=User.objects.create(username='rep'))
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def test_unknown_rep_is_404(self):
+        response = self.client.get(reverse('route_plan'), {'rep': 99999})
+        self.assertEqual(response.status_code, 404)
+
+    def test_rep_without_plan_renders_empty_state(self):
+        # planejador sem linha para o representante (nada a gravar)
+        with mock.patch('crm.routing.build_plans', return_value=0):
+            response = self.client.get(reverse('route_plan'), {'rep': self.rep.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'ainda não gerado')
+
+
+class DealApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username='deals', is_superuser=True, is_staff=True)
+        pipe = Pipeline.objects.create(name='Padrão')
+        cls.stage = Stage.objects.create(pipeline=pipe, name='Prospecção', order=1)
+        Deal.objects.create(title='Negócio', pipeline=pipe, stage=cls.stage, owner=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_bad_filters_are_400(self):
+        for params in ({'stage': 'abc'}, {'pipeline': 'x'}, {'stage': 'abc', 'limit': 5}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('api_deals'), params).status_code, 400)
+
+    def test_stage_filter(self):
+        response = self.client.get(reverse('api_deals'), {'stage': self.stage.pk})
+        self.assertEqual([d['title'] for d in response.json()], ['Negócio'])
@@ -1,24 +1,82 @@
+import codecs
+import csv
+import io
 from pathlib import Path
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-DATA_PATH = Path(settings.BASE_DIR) / 'data' / 'visitas.xlsx'
-
-def append_visit_to_excel(row: dict):
-    import pandas as pd
-    df_new = pd.DataFrame([row])
-    for col in df_new.columns:
-        if str(col).lower() in ('datahora', 'when'):
-            try:
-                df_new[col] = pd.to_datetime(df_new[col]).dt.tz_localize(None)
-            except Exception:
-                pass
-    if DATA_PATH.exists():
-        try:
-            df_old = pd.read_excel(DATA_PATH)
-        except Exception:
-            df_old = pd.DataFrame()
-        df = pd.concat([df_old, df_new], ignore_index=True)
-    else:
-        df = df_new
-    DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-    df.to_excel(DATA_PATH, index=False)
+try:
+    import fcntl
+except ImportError:  # Windows (dev): um worker só, sem lock
+    fcntl = None
+
+# Planilha de visitas: segmentos CSV mensais (visitas-AAAA-MM.csv), só com append.
+EXPORT_DIR = Path(getattr(settings, 'VISIT_EXPORT_DIR', Path(settings.BASE_DIR) / 'data' / 'visitas'))
+EXPORT_COLUMNS = ['Medico', 'CRM', 'Especialidade', 'Contato', 'DataHora', 'Status', 'Observacoes']
+
+
+def visit_export_row(appt):
+    doctor = appt.doctor
+    return {
+        'Medico': doctor.name, 'CRM': doctor.crm,
+        'Especialidade': doctor.specialty, 'Contato': appt.contact_name,
+        'DataHora': timezone.localtime(appt.when).strftime('%Y-%m-%d %H:%M:%S'),
+        'Status': appt.status, 'Observacoes': appt.notes,
+    }
+
+
+def enqueue_visit_export(appt):
+    """Grava a linha no outbox (um INSERT); a escrita do arquivo fica para o worker."""
+    from .models import VisitExport
+    return VisitExport.objects.create(appointment=appt, payload=visit_export_row(appt))
+
+
+def _segment_path(dt):
+    return EXPORT_DIR / f"visitas-{timezone.localtime(dt):%Y-%m}.csv"
+
+
+def _write_segments(rows):
+    by_segment = {}
+    for r in rows:
+        by_segment.setdefault(_segment_path(r.created_at), []).append(r.payload)
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    for path, payloads in by_segment.items():
+        # workers drenando lotes diferentes podem anexar ao mesmo mês: lock
+        # exclusivo no arquivo, e "é novo?" decidido já com o lock na mão
+        with open(path, 'ab') as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            new = fh.seek(0, io.SEEK_END) == 0
+            buf = io.StringIO()
+            w = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, delimiter=';', extrasaction='ignore')
+            if new:
+                w.writeheader()
+            w.writerows(payloads)
+            # BOM só no início do arquivo, para o Excel reconhecer UTF-8
+            fh.write((codecs.BOM_UTF8 if new else b'') + buf.getvalue().encode('utf-8'))
+            fh.flush()
+
+
+def flush_visit_exports(batch_size=500):
+    """
+    Drena o outbox em lotes: cada lote é anexado ao segmento do mês e
+    apagado na mesma transação (o arquivo é o registro; o outbox não cresce).
+    Custo O(lote), sem reler a planilha. Retorna o número de linhas exportadas.
+    """
+    from .models import VisitExport
+    total = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                VisitExport.objects.select_for_update(skip_locked=True)
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            _write_segments(batch)
+            VisitExport.objects.filter(pk__in=[r.pk for r in batch]).delete()
+        total += len(batch)
+        if len(batch) < batch_size:
+            break
+    return total
@@ -1,22 +1,44 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.middleware.csrf import get_token
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.files.storage import default_storage
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
 from django.utils import timezone
-from django.db.models.functions import TruncMonth
-from django.db.models import Count
-from django.views.decorators.http import require_POST
+from django.db import IntegrityError, transaction
+from django.db.models.functions import RowNumber, TruncMonth
+from django.db.models import Count, F, Q, Sum, Window
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_POST
 from django.utils.dateparse import parse_datetime
 from django.template.loader import render_to_string
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
-from .models import Doctor, Appointment, STATUS_CHOICES, VisitReport
+from .models import DEFAULT_DURATION_MINUTES, MAX_DURATION_MINUTES, Doctor, Appointment, STATUS_CHOICES, VisitReport
 from .forms import DoctorForm, AppointmentForm, VisitReportForm
-from .utils import append_visit_to_excel
-from .google_calendar import add_event_to_google_calendar
+from .utils import enqueue_visit_export
+from greens_scheduler import db
+from greens_scheduler import profiling
+from greens_scheduler.cache import stats as cache_stats
+from . import alerts, attainment, caching, conflicts, coverage, importers, pagination, pdf, rbac, routing, scheduling, search, stats, sync, tasks
+
+logger = logging.getLogger(__name__)
 
-def _is_manager(user):
-    # Admin ou membro do grupo Gestor pode ver/editar tudo
-    return user.is_superuser or user.groups.filter(name__in=["Admin", "Gestor"]).exists()
+def _access(request):
+    # papel/escopo resolvidos uma vez por request (crm.rbac)
+    return rbac.for_request(request)
 
 def _parse_iso_safe(s):
     """
@@ -36,9 +58,9 @@ def _parse_iso_safe(s):
     # normaliza para tz atual
     return timezone.localtime(dt, timezone.get_current_timezone())
 
-def _scope_by_owner(qs, user):
+def _scope_by_owner(qs, request):
     # Representante só enxerga o que é dele
-    return qs if _is_manager(user) else qs.filter(owner=user)
+    return _access(request).scope_by_owner(qs)
 
 
 STATUS_MAP = dict(STATUS_CHOICES)
@@ -48,13 +70,6 @@ STATUS_COLORS = {
     'cancelada': {'bg': '#dc3545', 'bd': '#c82333'},
 }
 
-def _get_rep(request):
-    try:
-        rep, _ = Representative.objects.get_or_create(user=request.user)
-        return rep
-    except Exception:
-        return None
-
 
 def _apply_filters(qs, request):
     doctor_id = request.GET.get('medico') or request.GET.get('doctor')
@@ -65,10 +80,25 @@ def _apply_filters(qs, request):
         qs = qs.filter(status=status)
     return qs
 
+# Listas: paginação por keyset (crm.pagination); a última chave é sempre o id
+DOCTOR_ORDER = ('-created_at', '-id')
+APPT_ORDER = ('-when', '-id')
+ORG_ORDER = ('name', 'id')
+DEAL_ORDER = ('-updated_at', '-id')
+APPT_LIST_FIELDS = ('id', 'when', 'status', 'contact_name', 'notes', 'doctor__name')
+
+def _page(request, qs, ordering, per_page=pagination.PER_PAGE, param='cursor'):
+    """Página da lista; None se o cursor da URL for inválido (a view volta ao início)."""
+    try:
+        return pagination.paginate(qs, request, ordering, per_page=per_page, param=param)
+    except pagination.InvalidCursor:
+        return None
+
 def _parse_iso(value):
     if not value:
         return None
-    value = value.replace('Z', '+00:00')
+    # '+' do offset pode chegar como espaço quando a query string não vem codificada
+    value = value.strip().replace(' ', '+').replace('Z', '+00:00')
     dt = parse_datetime(value)
     if dt is None:
         try:
@@ -84,40 +114,112 @@ def _parse_iso(value):
 def dashboard(request):
     ctx = {}
     # KPIs básicos existentes continuam
-    # KPIs de cobertura (últimos 30 dias)
-    from datetime import datetime, timedelta
-    cutoff = datetime.now() - timedelta(days=30)
-    if request.user.is_superuser:
-        assigned_doctors = Doctor.objects.all().distinct()
-        visits_30d = Appointment.objects.filter(when__gte=cutoff).count()
-        visited_doctors = Doctor.objects.filter(appointments__when__gte=cutoff).distinct()
+    # KPIs de cobertura (últimos 30 dias), lidos do rollup diário (crm.coverage)
+    access = _access(request)
+    if access.is_manager:
+        row = coverage.get_rollup()
     else:
-        rep = _get_rep(request)
-        if rep:
-            assigned_doctors = Doctor.objects.filter(assignments__representative=rep, assignments__active=True).distinct()
-            visits_30d = Appointment.objects.filter(doctor__in=assigned_doctors, when__gte=cutoff).count()
-            visited_doctors = assigned_doctors.filter(appointments__when__gte=cutoff).distinct()
-        else:
-            assigned_doctors = Doctor.objects.filter(owner=request.user)
-            visits_30d = Appointment.objects.filter(owner=request.user, when__gte=cutoff).count()
-            visited_doctors = assigned_doctors.filter(appointments__when__gte=cutoff).distinct()
-    a = assigned_doctors.count() or 1
-    v = visited_doctors.count()
-    coverage_pct = round(100 * v / a, 1)
+        row = coverage.get_rollup(rep_id=access.rep_id) if access.rep_id else None
+    if row is not None:
+        assigned, visited, visits_30d = row.assigned, row.visited, row.visits_30d
+    else:
+        cutoff = timezone.now() - timedelta(days=coverage.WINDOW_DAYS)
+        assigned_doctors = Doctor.objects.filter(owner=request.user)
+        assigned = assigned_doctors.count()
+        visited = assigned_doctors.filter(appointments__when__gte=cutoff).distinct().count()
+        visits_30d = Appointment.objects.filter(owner=request.user, when__gte=cutoff).count()
+    a = assigned or 1
+    coverage_pct = round(100 * visited / a, 1)
     ctx.update({
         'kpi_assigned': a,
-        'kpi_visited': v,
+        'kpi_visited': visited,
         'kpi_coverage_pct': coverage_pct,
         'kpi_visits_30d': visits_30d,
     })
+    ctx.update(_attainment_panel(access))
+    ctx.update(_dashboard_charts(request, access, assigned))
     return render(request, 'dashboard.html', ctx)
 
+def _dashboard_charts(request, access, assigned):
+    """KPIs e gráficos (crm.stats, em cache) respeitando o filtro de médico/status da página."""
+    try:
+        doctor_id = int(request.GET.get('medico') or 0) or None
+    except ValueError:
+        doctor_id = None
+    status = request.GET.get('status') if request.GET.get('status') in STATUS_MAP else ''
+    data = stats.dashboard_stats(access, request.user, doctor_id, status)
+    by_status = data['by_status']
+    return {
+        'selected_doctor': doctor_id,
+        'selected_doctor_label': _doctor_label(request, doctor_id),
+        'selected_status': status,
+        # total de médicos vem do rollup de cobertura (mesmo escopo), sem outro COUNT
+        'kpi_total_doctors': 1 if doctor_id else assigned,
+        'kpi_total_appts': data['total'],
+        'kpi_agendada': by_status['agendada'],
+        'kpi_concluida': by_status['concluida'],
+        'kpi_cancelada': by_status['cancelada'],
+        'status_labels': _js([STATUS_MAP[code] for code in by_status]),
+        'status_data': _js(list(by_status.values())),
+        'top_labels': _js([name for name, _ in data['top']]),
+        'top_data': _js([n for _, n in data['top']]),
+    }
+
+def _js(value):
+    # o template injeta com |safe dentro de <script>; nomes de médico não podem fechar a tag
+    return json.dumps(value).replace('<', '\\u003c')
+
+ATTAINMENT_PANEL_ROWS = 8
+
+def _attainment_panel(access):
+    """Meta do mês no dashboard: piores representantes (gestor) ou os próprios territórios (representante)."""
+    if not access.is_manager and not access.rep_id:
+        return {}
+    month = attainment.month_start(timezone.localdate())
+    payload = attainment.get_months([month])[month]
+    if access.is_manager:
+        rows = attainment.rep_rows(payload)[:ATTAINMENT_PANEL_ROWS]
+        total = {'target': payload['target'], 'done': payload['done']}
+    else:
+        rows = attainment.territory_rows(payload, {access.rep_id})
+        own = payload['reps'].get(access.rep_id, {'target': 0, 'done': 0})
+        total = {'target': own['target'], 'done': own['done']}
+    _attainment_names(rows)
+    total['pct'] = attainment.pct(total['done'], total['target'])
+    return {'attainment_month': month, 'attainment_rows': rows, 'attainment_total': total}
+
+def _attainment_names(rows):
+    """Preenche os nomes de representante/território/médico das linhas (uma consulta por tipo)."""
+    rep_ids = {r['rep_id'] for r in rows}
+    terr_ids = {r['territory_id'] for r in rows if 'territory_id' in r}
+    doctor_ids = {r['doctor_id'] for r in rows if 'doctor_id' in r}
+    reps = {rep.pk: str(rep) for rep in Representative.objects.filter(pk__in=rep_ids).select_related('user')}
+    terrs = dict(Territory.objects.filter(pk__in=terr_ids).values_list('pk', 'name')) if terr_ids else {}
+    doctors = dict(Doctor.objects.filter(pk__in=doctor_ids).values_list('pk', 'name')) if doctor_ids else {}
+    for r in rows:
+        r['rep'] = reps.get(r['rep_id'], '')
+        if 'territory_id' in r:
+            r['territory'] = terrs.get(r['territory_id'], '')
+        if 'doctor_id' in r:
+            r['doctor'] = doctors.get(r['doctor_id'], '')
+    return rows
+
+def _doctor_label(request, doctor_id):
+    """Nome do médico já selecionado no seletor com busca (uma linha, no escopo do usuário)."""
+    if not doctor_id:
+        return ''
+    return _access(request).visible_doctors().filter(pk=doctor_id).values_list('name', flat=True).first() or ''
+
 # Agenda
 @login_required
 def agenda(request):
+    try:
+        selected = int(request.GET.get('medico') or 0) or None
+    except ValueError:
+        selected = None
     ctx = {
-        'doctors': Doctor.objects.all().order_by('name'),
-        'selected_doctor': int(request.GET.get('medico') or 0) if request.GET.get('medico') else None,
+        'selected_doctor': selected,
+        'selected_doctor_label': _doctor_label(request, selected),
         'selected_status': request.GET.get('status') or '',
     }
     return render(request, 'agenda.html', ctx)
@@ -128,11 +230,17 @@ from .models import Organization, Pipeline, Stage, Deal, Representative, Assignm
 
 @login_required
 def org_list(request):
-    qs = Organization.objects.order_by('name')
-    if not request.user.is_superuser:
-        qs = qs.filter(owner=request.user)
-    orgs = qs
-    return render(request, 'crm/org_list.html', {'orgs': orgs})
+    qs = _visible_orgs(request, Organization.objects.only('id', 'name', 'city', 'state', 'phone'))
+    q = request.GET.get('q', '').strip()
+    if q:
+        qs = search.matching(qs, q)
+    page = _page(request, qs, ORG_ORDER)
+    if page is None:
+        return redirect('org_list')
+    return render(request, 'crm/org_list.html', {'orgs': page, 'page': page, 'q': q})
+
+def _visible_orgs(request, qs):
+    return qs if request.user.is_superuser else qs.filter(owner=request.user)
 
 @login_required
 def org_create(request):
@@ -150,10 +258,14 @@ def org_create(request):
 
 @login_required
 def deal_list(request):
-    deals = Deal.objects.select_related('organization','contact','stage').order_by('-updated_at')
-    if not request.user.is_superuser:
-        deals = deals.filter(owner=request.user)
-    return render(request, 'crm/deal_list.html', {'deals': deals})
+    deals = _deals_for(request).select_related('organization','contact','stage').only(
+        'id', 'title', 'amount', 'updated_at', 'organization__name', 'contact__name', 'stage__name')
+    page = _page(request, deals, DEAL_ORDER)
+    if page is None:
+        return redirect('deal_list')
+    return render(request, 'crm/deal_list.html', {'deals': page, 'page': page})
+
+KANBAN_PAGE = 25
 
 @login_required
 def deal_kanban(request):
@@ -167,35 +279,88 @@ def deal_kanban(request):
             Stage(pipeline=pipe, name='Proposta', order=3),
             Stage(pipeline=pipe, name='Fechamento', order=4),
         ])
-    stages = Stage.objects.filter(pipeline=pipe).prefetch_related('deal_set')
-    return render(request, 'crm/kanban.html', {'pipeline': pipe, 'stages': stages})
-
-@login_required
-def api_deals(request):
-    pipe_id = request.GET.get('pipeline')
-    qs = Deal.objects.select_related('organization','contact','stage','pipeline')
+    # contagem e soma por etapa em um único GROUP BY
+    in_scope = Q() if request.user.is_superuser else Q(deal__owner=request.user)
+    stages = list(Stage.objects.filter(pipeline=pipe).annotate(
+        deal_count=Count('deal', filter=in_scope),
+        deal_total=Sum('deal__amount', filter=in_scope),
+    ).order_by('order', 'id'))
+    # primeiros KANBAN_PAGE cards de cada etapa em uma consulta (ROW_NUMBER por etapa)
+    cards = _deals_for(request).filter(pipeline=pipe).select_related('organization', 'contact').annotate(
+        rank=Window(RowNumber(), partition_by=[F('stage_id')], order_by=[F('updated_at').desc(), F('id').desc()]),
+    ).filter(rank__lte=KANBAN_PAGE).order_by('stage_id', 'rank')
+    by_stage = {}
+    for d in cards:
+        by_stage.setdefault(d.stage_id, []).append(d)
+    for s in stages:
+        s.cards = by_stage.get(s.id, [])
+        s.next_cursor = pagination.encode_cursor(s.cards[-1], DEAL_ORDER) if s.deal_count > len(s.cards) else ''
+    return render(request, 'crm/kanban.html', {'pipeline': pipe, 'stages': stages, 'page_size': KANBAN_PAGE})
+
+def _deals_for(request):
+    qs = Deal.objects.all()
     if not request.user.is_superuser:
         qs = qs.filter(owner=request.user)
-    if pipe_id: qs = qs.filter(pipeline_id=pipe_id)
-    payload = [{
+    return qs
+
+def _deals_scope(request):
+    return sync.scope_name('deal', None if request.user.is_superuser else request.user.pk)
+
+def _deal_payload(d):
+    return {
         'id': d.id, 'title': d.title, 'amount': float(d.amount),
         'org': d.organization.name if d.organization else '',
         'contact': d.contact.name if d.contact else '',
         'stage_id': d.stage_id, 'status': d.status,
-    } for d in qs]
-    return JsonResponse(payload, safe=False)
+    }
+
+@login_required
+@condition(**sync.conditional(_deals_scope, related=('doctor', 'organization')))
+def api_deals(request):
+    try:
+        pipe_id = int(request.GET.get('pipeline') or 0)
+        stage_id = int(request.GET.get('stage') or 0)
+    except ValueError:
+        return HttpResponseBadRequest('invalid pipeline/stage')
+    qs = _deals_for(request).select_related('organization','contact')
+    if pipe_id: qs = qs.filter(pipeline_id=pipe_id)
+    if stage_id: qs = qs.filter(stage_id=stage_id)
+    if 'since' in request.GET:
+        cursor = sync.parse_cursor(request.GET['since'])
+        if cursor is None:
+            return HttpResponseBadRequest('invalid since')
+        owner_id = None if request.user.is_superuser else request.user.pk
+        cursor, changed, deleted = sync.changes_since(Deal, cursor, owner_id)
+        deals = [_deal_payload(d) for d in qs.filter(pk__in=changed)]
+        visible = {d['id'] for d in deals}
+        deleted += [pk for pk in changed if pk not in visible]
+        return _sync_headers(JsonResponse({'cursor': cursor, 'deals': deals, 'deleted': deleted}), cursor)
+    cursor = sync.history_cursor(Deal)
+    if 'limit' in request.GET:
+        # paginação do kanban ("carregar mais"): {'deals': [...], 'next': cursor}
+        try:
+            limit = max(1, min(int(request.GET['limit']), 200))
+        except ValueError:
+            return HttpResponseBadRequest('invalid limit')
+        page = _page(request, qs, DEAL_ORDER, per_page=limit, param='after')
+        if page is None:
+            return HttpResponseBadRequest('invalid after')
+        payload = {'deals': [_deal_payload(d) for d in page], 'next': page.next_cursor}
+        return _sync_headers(JsonResponse(payload), cursor)
+    payload = [_deal_payload(d) for d in qs]
+    return _sync_headers(JsonResponse(payload, safe=False), cursor)
 
 @require_POST
 @login_required
 def api_deal_move(request):
     try:
-        d = Deal.objects.get(pk=int(request.POST['id']))
+        d = _deals_for(request).get(pk=int(request.POST['id']))
         stage_id = int(request.POST['stage_id'])
         st = Stage.objects.get(pk=stage_id)
         if d.pipeline_id != st.pipeline_id:
             return HttpResponseBadRequest('stage/pipeline mismatch')
         d.stage = st
-        d.save(update_fields=['stage'])
+        d.save(update_fields=['stage', 'updated_at'])
         return JsonResponse({'ok': True})
     except Exception:
         return HttpResponseBadRequest('invalid')
@@ -203,16 +368,57 @@ def api_deal_move(request):
 # Contatos
 @login_required
 def contacts(request):
-    qs = Doctor.objects.order_by('-created_at')
-    if not request.user.is_superuser:
-        rep = _get_rep(request)
-        if rep:
-            qs = qs.filter(assignments__representative=rep, assignments__active=True).distinct()
-        else:
-            qs = qs.filter(owner=request.user)
-    doctors = qs
+    access = _access(request)
+    # a tabela (com os forms de exclusão) fica em cache por escopo, versão, página
+    # e segredo CSRF do usuário: o token embutido continua válido no hit
+    get_token(request)
+    scope, version = caching.doctor_scope(access)
+    csrf = hashlib.sha1(request.META.get('CSRF_COOKIE', '').encode()).hexdigest()[:16]
+    q = request.GET.get('q', '').strip()
+    key = caching.fragment_key('contacts', scope, version, csrf, request.GET.get('cursor', ''),
+                               hashlib.sha1(q.encode()).hexdigest()[:16] if q else '')
+    table = cache.get(key)
+    if table is None:
+        with db.primary():  # a chave já tem a versão nova (ver crm.caching.cached_fragment)
+            qs = access.visible_doctors(Doctor.objects.only('id', 'name', 'crm', 'specialty', 'email', 'phone', 'created_at'))
+            if q:
+                qs = search.matching(qs, q)
+            page = _page(request, qs, DOCTOR_ORDER)
+            if page is None:
+                return redirect('contacts')
+            table = render_to_string('includes/contacts_table.html', {'doctors': page, 'page': page}, request=request)
+        cache.set(key, table, caching.FRAGMENT_TTL)
     form = DoctorForm()
-    return render(request, 'contacts.html', {'doctors': doctors, 'form': form})
+    return render(request, 'contacts.html', {'table': table, 'form': form, 'q': q})
+
+@login_required
+def contact_import(request):
+    """Upload de CSV/XLSX de médicos (gestores), processado em streaming por crm.importers."""
+    if not _access(request).is_manager:
+        return HttpResponseForbidden('not allowed')
+    if request.method == 'POST' and request.FILES.get('arquivo'):
+        job_id, args = importers.start_job(request.FILES['arquivo'], request.user,
+                                           update=bool(request.POST.get('atualizar')),
+                                           dry_run=bool(request.POST.get('simular')))
+        _enqueue(tasks.import_doctors_file, *args)
+        return redirect('contact_import_status', job_id=job_id)
+    return render(request, 'contacts_import.html')
+
+@login_required
+def contact_import_status(request, job_id):
+    """Andamento da importação no worker; recarrega sozinha até terminar."""
+    state = importers.job_state(job_id)
+    if state is None or state['owner_id'] != request.user.pk:
+        raise Http404
+    if state['status'] in ('queued', 'running'):
+        message = f"Importando {state['filename']}…"
+        if state['lines']:
+            message += f" {state['lines']} linhas lidas"
+        return _pending(request, message, hint='A página mostra o resultado quando a importação terminar.')
+    return render(request, 'contacts_import.html', {
+        'report': state.get('report'), 'conflicts': state.get('conflicts', []),
+        'dry_run': state['dry_run'], 'error': state.get('error'),
+    })
 
 @require_POST
 @login_required
@@ -245,27 +451,28 @@ def contact_delete(request, pk):
     return redirect('contacts')
 
 # Consultas
+def _appointments_page(request, form):
+    appts = _scope_by_owner(Appointment.objects.select_related('doctor').only(*APPT_LIST_FIELDS), request)
+    page = _page(request, appts, APPT_ORDER)
+    if page is None:
+        return redirect('appointments')
+    return render(request, 'appointments.html', {'appointments': page, 'page': page, 'form': form})
+
 @login_required
 def appointments(request):
-    appts = Appointment.objects.select_related('doctor').all()
-    form = AppointmentForm(request=request)
-    return render(request, 'appointments.html', {'appointments': appts, 'form': form})
+    return _appointments_page(request, AppointmentForm(request=request))
 
 @require_POST
 @login_required
 def appointment_create(request):
     form = AppointmentForm(request.POST, request=request)
-    if form.is_valid():
-        appt = form.save(commit=False)
-        appt.owner = request.user
-        appt.save()
-        append_visit_to_excel({
-            'Medico': appt.doctor.name, 'CRM': appt.doctor.crm,
-            'Especialidade': appt.doctor.specialty, 'Contato': appt.contact_name,
-            'DataHora': appt.when, 'Status': appt.status, 'Observacoes': appt.notes
-        })
-        start_dt = appt.when; end_dt = start_dt + timedelta(minutes=30)
-        add_event_to_google_calendar(f'Visita: {appt.doctor.name}', start_dt, end_dt, appt.notes or '')
+    if not form.is_valid():
+        # volta com os erros (ex.: conflito de horário) em vez de descartar o envio
+        return _appointments_page(request, form)
+    appt = form.save(commit=False)
+    appt.owner = request.user
+    appt.save()
+    enqueue_visit_export(appt)
     return redirect('appointments')
 
 @login_required
@@ -287,31 +494,113 @@ def appointment_delete(request, pk):
     return redirect('appointments')
 
 # Calendar APIs
+EVENT_FIELDS = ('id', 'when', 'ends_at', 'duration', 'status', 'doctor_id', 'doctor__name', 'notes')
+
+def _apply_window(qs, request):
+    """Janela visível do FullCalendar (?start=&end=); sem parâmetros, não filtra."""
+    start = _parse_iso(request.GET.get('start'))
+    end = _parse_iso(request.GET.get('end'))
+    if start:
+        # inclui eventos que começam antes da janela mas terminam dentro dela
+        qs = qs.filter(when__gt=start - conflicts.MAX_DURATION, ends_at__gt=start)
+    if end:
+        qs = qs.filter(when__lt=end)
+    return qs
+
+def _event_payload(row, tz):
+    col = STATUS_COLORS.get(row['status'], {'bg': '#6c757d', 'bd': '#6c757d'})
+    start = timezone.localtime(row['when'], tz)
+    end = timezone.localtime(row['ends_at'], tz)
+    # render naive strings (no offset) to avoid shifts in client
+    return {
+        'id': row['id'],
+        'title': row['doctor__name'],
+        'start': start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end': end.strftime('%Y-%m-%dT%H:%M:%S'),
+        'status': row['status'],
+        'doctor_id': row['doctor_id'],
+        'duration': row['duration'],
+        'notes': row['notes'] or '',
+        'backgroundColor': col['bg'],
+        'borderColor': col['bd'],
+    }
+
+def _stream_json_list(items, chunk_size=500):
+    """Serializa uma lista JSON em blocos, sem montar a lista inteira em memória."""
+    yield '['
+    sep = ''
+    buf = []
+    for item in items:
+        buf.append(json.dumps(item, cls=DjangoJSONEncoder))
+        if len(buf) >= chunk_size:
+            yield sep + ','.join(buf)
+            sep, buf = ',', []
+    if buf:
+        yield sep + ','.join(buf)
+    yield ']'
+
+def _events_scope(request):
+    return sync.scope_name('appointment', None if _access(request).is_manager else request.user.pk)
+
+def _sync_headers(response, cursor):
+    # o navegador sempre revalida: com ETag igual, recebe 304 sem corpo
+    response['X-Sync-Cursor'] = str(cursor)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 @login_required
+@condition(**sync.conditional(_events_scope, related=('doctor',)))
 def api_events(request):
-    qs = _apply_filters(Appointment.objects.select_related('doctor'), request)
-    qs = _scope_by_owner(qs, request.user)
-    events = []
+    qs = _apply_filters(Appointment.objects.all(), request)
+    qs = _scope_by_owner(qs, request)
+    qs = _apply_window(qs, request)
     tz = timezone.get_current_timezone()
-    for a in qs:
-        col = STATUS_COLORS.get(a.status, {'bg': '#6c757d', 'bd': '#6c757d'})
-        start = timezone.localtime(a.when, tz)
-        end = start + timedelta(minutes=30)
-        # render naive strings (no offset) to avoid shifts in client
-        start_s = start.strftime('%Y-%m-%dT%H:%M:%S')
-        end_s = end.strftime('%Y-%m-%dT%H:%M:%S')
-        events.append({
-            'id': a.id,
-            'title': f"{a.doctor.name}",
-            'start': start_s,
-            'end': end_s,
-            'status': a.status,
-            'doctor_id': a.doctor_id,
-            'notes': a.notes or '',
-            'backgroundColor': col['bg'],
-            'borderColor': col['bd'],
-        })
-    return JsonResponse(events, safe=False)
+    if 'since' in request.GET:
+        # modo delta: só o que mudou desde o cursor, com exclusões (tombstones)
+        cursor = sync.parse_cursor(request.GET['since'])
+        if cursor is None:
+            return HttpResponseBadRequest('invalid since')
+        owner_id = None if _access(request).is_manager else request.user.pk
+        cursor, changed, deleted = sync.changes_since(Appointment, cursor, owner_id)
+        events = [_event_payload(row, tz) for row in qs.filter(pk__in=changed).values(*EVENT_FIELDS)]
+        visible = {e['id'] for e in events}
+        # alterados que saíram do filtro/janela também somem do cliente
+        deleted += [pk for pk in changed if pk not in visible]
+        response = JsonResponse({'cursor': cursor, 'events': events, 'deleted': deleted})
+        return _sync_headers(response, cursor)
+    cursor = sync.history_cursor(Appointment)
+    qs = qs.order_by('when').values(*EVENT_FIELDS)
+    events = (_event_payload(row, tz) for row in qs.iterator(chunk_size=2000))
+    response = StreamingHttpResponse(_stream_json_list(events), content_type='application/json')
+    return _sync_headers(response, cursor)
+
+def _parse_duration(request, default):
+    """?duration= em minutos; ausente, mantém `default`. None se inválido."""
+    raw = request.POST.get('duration')
+    if raw:
+        try:
+            return int(raw)
+        except ValueError:
+            return None
+    return default
+
+def _conflict_response(appt):
+    """409 se a visita se sobrepõe a outra do mesmo dono ou médico; None se está livre."""
+    clashes = conflicts.for_appointment(appt)
+    if clashes.exists():
+        return JsonResponse({'ok': False, 'error': 'conflict', 'conflicts': conflicts.describe(clashes)}, status=409)
+    return None
+
+def _save_checked(appt):
+    """Salva; a constraint de exclusão do Postgres cobre a corrida entre a checagem e o INSERT."""
+    try:
+        with transaction.atomic():
+            appt.save()
+    except IntegrityError as exc:
+        if not conflicts.is_overlap_violation(exc):
+            raise
+        return JsonResponse({'ok': False, 'error': 'conflict', 'conflicts': []}, status=409)
+    return None
 
 @require_POST
 @login_required
@@ -319,15 +608,40 @@ def api_events_create(request):
     when = _parse_iso(request.POST.get('start'))
     if when is None:
         return HttpResponseBadRequest('invalid start')
-    appt = Appointment.objects.create(owner=request.user, 
+    duration = _parse_duration(request, DEFAULT_DURATION_MINUTES)
+    if duration is None or not 5 <= duration <= MAX_DURATION_MINUTES:
+        return HttpResponseBadRequest('invalid duration')
+    appt = Appointment(owner=request.user, 
         doctor_id=int(request.POST.get('doctor')),
         when=when,
+        duration=duration,
         status=request.POST.get('status') or 'agendada',
         contact_name=request.POST.get('contact_name', ''),
         notes=request.POST.get('notes', '')
     )
+    error = _conflict_response(appt) or _save_checked(appt)
+    if error:
+        return error
     return JsonResponse({'ok': True, 'id': appt.id})
 
+@require_POST
+@login_required
+def api_events_bulk(request):
+    """
+    Agenda várias visitas de uma vez. Corpo JSON: lista de
+    {doctor, start, status?, contact_name?, notes?, owner?} (owner só para gestores).
+    Tudo ou nada: com qualquer erro, responde 400 com a lista de erros por índice.
+    """
+    try:
+        entries = json.loads(request.body or b'null')
+    except ValueError:
+        return HttpResponseBadRequest('invalid json')
+    appts, errors = scheduling.validate(entries, request.user, _access(request), _parse_iso)
+    if errors:
+        return JsonResponse({'ok': False, 'errors': errors}, status=400)
+    created = scheduling.create_batch(appts, request.user)
+    return JsonResponse({'ok': True, 'ids': [a.pk for a in created]})
+
 @require_POST
 @login_required
 def api_events_update(request):
@@ -342,7 +656,7 @@ def api_events_update(request):
         return HttpResponseBadRequest('invalid id')
 
     # 2) 🔐 PERMISSÃO: checa o dono ANTES de validar/alterar campos
-    if not _is_manager(request.user) and getattr(appt, 'owner_id', None) != request.user.id:
+    if not _access(request).is_manager and getattr(appt, 'owner_id', None) != request.user.id:
         return HttpResponseForbidden('not allowed')
 
     # 3) atualizações
@@ -352,6 +666,16 @@ def api_events_update(request):
             return HttpResponseBadRequest('invalid start')
         appt.when = when
 
+    if request.POST.get('end'):
+        end = _parse_iso_safe(request.POST['end'])
+        if end is None or end <= appt.when:
+            return HttpResponseBadRequest('invalid end')
+        appt.duration = int((end - appt.when).total_seconds() // 60)
+    elif request.POST.get('duration'):
+        appt.duration = _parse_duration(request, appt.duration)
+    if not appt.duration or not 5 <= appt.duration <= MAX_DURATION_MINUTES:
+        return HttpResponseBadRequest('invalid duration')
+
     status = request.POST.get('status')
     if status in STATUS_MAP:
         appt.status = status
@@ -359,7 +683,10 @@ def api_events_update(request):
     if 'notes' in request.POST:
         appt.notes = request.POST.get('notes', '')
 
-    appt.save()
+    # 4) conflito de horário (arrastar/redimensionar também passa por aqui)
+    error = _conflict_response(appt) or _save_checked(appt)
+    if error:
+        return error
     return JsonResponse({'ok': True})
 
 @require_POST
@@ -375,7 +702,7 @@ def api_events_delete(request):
         return HttpResponseBadRequest('invalid id')
 
     # 🔐 Permissão: representante só pode apagar o que É DELE
-    if not _is_manager(request.user) and getattr(appt, 'owner_id', None) != request.user.id:
+    if not _access(request).is_manager and getattr(appt, 'owner_id', None) != request.user.id:
         return HttpResponseForbidden('not allowed')
 
     appt.delete()
@@ -385,32 +712,59 @@ def api_events_delete(request):
 
 @login_required
 def api_alerts(request):
-    """Retorna eventos 'agendada' nas próximas 72h, marca 'urgent' se < 24h."""
-    now = timezone.now()
-    soon = now + timedelta(hours=72)
-    tz = timezone.get_current_timezone()
-    qs = (Appointment.objects
-            .select_related('doctor')
-            .filter(status='agendada', when__gte=now, when__lte=soon)
-            .order_by('when')[:20])
-    alerts = []
-    for a in qs:
-        delta = a.when - now
-        urgency = 'urgent' if delta.total_seconds() <= 24*3600 else 'soon'
-        when_str = timezone.localtime(a.when, tz).strftime('%d/%m %H:%M')
-        alerts.append({
-            'id': a.id,
-            'doctor': a.doctor.name,
-            'when': when_str,
-            'urgency': urgency,
-            'message': f"Visita com {a.doctor.name} • {when_str}",
-        })
-    return JsonResponse({'count': len(alerts), 'alerts': alerts})
+    """Retorna eventos 'agendada' nas próximas 72h, marca 'urgent' se < 24h (lidos do cache, ver crm.alerts)."""
+    return JsonResponse(alerts.get_alerts(request.user))
+
+ALERTS_STREAM_POLL = 15       # segundos entre leituras do cache
+ALERTS_STREAM_MAX_AGE = 300   # a conexão fecha e o EventSource reconecta
+
+async def api_alerts_stream(request):
+    """
+    Canal SSE de alertas. No ASGI mantém a conexão aberta e envia um evento
+    quando o payload do cache muda. No WSGI (ex.: runserver) envia o payload
+    e um evento "close": o navegador fecha o EventSource em vez de reconectar
+    a cada `retry`, ficando com uma leitura por página, como o fetch.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden('not allowed')
+
+    async def current():
+        payload = await cache.aget(alerts.cache_key(user.pk, await alerts.aversion()))
+        if payload is None:
+            payload = await sync_to_async(alerts.get_alerts)(user)
+        return json.dumps(payload)
+
+    def frame(data, event='alerts'):
+        return f"retry: {ALERTS_STREAM_POLL * 1000}\nevent: {event}\ndata: {data}\n\n"
+
+    if not isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse([frame(await current()), frame('{}', 'close')],
+                                         content_type='text/event-stream')
+    else:
+        async def stream():
+            last = None
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + ALERTS_STREAM_MAX_AGE
+            while loop.time() < deadline:
+                data = await current()
+                yield frame(data) if data != last else ": ping\n\n"
+                last = data
+                await asyncio.sleep(ALERTS_STREAM_POLL)
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # Relatórios
 @login_required
 def report_list(request):
-    items = Appointment.objects.select_related('doctor').order_by('-when')
-    return render(request, 'relatorios/list.html', {'items': items})
+    items = _scope_by_owner(Appointment.objects.select_related('doctor', 'report').only(
+        'id', 'when', 'status', 'doctor__name', 'report__id'), request)
+    page = _page(request, items, APPT_ORDER)
+    if page is None:
+        return redirect('report_list')
+    return render(request, 'relatorios/list.html', {'items': page, 'page': page})
 
 @login_required
 def report_create(request, appointment_id):
@@ -440,12 +794,197 @@ def report_update(request, pk):
         form = VisitReportForm(instance=rep)
     return render(request, 'relatorios/form.html', {'form': form, 'appt': rep.appointment, 'rep': rep})
 
+def _enqueue(task, *args):
+    """Enfileira no Celery; se o broker estiver fora, executa na hora."""
+    try:
+        task.delay(*args)
+    except Exception:
+        logger.warning("broker indisponível, executando %s no request", task.name, exc_info=True)
+        task(*args)
+
+def _enqueue_once(key, timeout, task, *args):
+    # o Refresh do _pending recarrega a página: só um job por arquivo enquanto ele não termina
+    if cache.add(f'pdf-job:{key}', 1, timeout):
+        _enqueue(task, *args)
+
+def _pending(request, message, hint=None):
+    # o navegador recarrega sozinho até o arquivo ficar pronto no storage
+    html = render_to_string('relatorios/pending.html', {'message': message, 'hint': hint}, request=request)
+    response = HttpResponse(html, status=202)
+    response['Refresh'] = '3'
+    response['Retry-After'] = '3'
+    return response
+
 @login_required
 def report_pdf(request, pk):
-    from xhtml2pdf import pisa
-    rep = get_object_or_404(VisitReport, pk=pk)
-    html = render_to_string('relatorios/pdf.html', {'rep': rep})
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename=relatorio-{rep.pk}.pdf'
-    pisa.CreatePDF(src=html, dest=response)
-    return response
+    reports = _access(request).scope_by_owner(VisitReport.objects.select_related('appointment__doctor'), 'appointment__owner')
+    rep = get_object_or_404(reports, pk=pk)
+    key = pdf.storage_key(rep)
+    if not default_storage.exists(key):
+        _enqueue_once(key, 300, tasks.render_report_pdf, rep.pk)
+        if not default_storage.exists(key):
+            return _pending(request, 'Gerando o PDF do relatório…')
+    return FileResponse(default_storage.open(key, 'rb'), as_attachment=True,
+                        filename=f'relatorio-{rep.pk}.pdf', content_type='application/pdf')
+
+@login_required
+def report_export(request):
+    """Zip com os PDFs do período (?inicio=AAAA-MM-DD&fim=AAAA-MM-DD), gerado no worker."""
+    try:
+        start = date.fromisoformat(request.GET.get('inicio', ''))
+        end = date.fromisoformat(request.GET.get('fim', ''))
+    except ValueError:
+        return HttpResponseBadRequest('invalid period')
+    if end < start:
+        return HttpResponseBadRequest('invalid period')
+    owner_id = None if _access(request).is_manager else request.user.pk
+    key = pdf.zip_key(start, end, owner_id)
+    if not default_storage.exists(key):
+        _enqueue_once(key, 1800, tasks.export_reports_zip, start.isoformat(), end.isoformat(), owner_id)
+        if not default_storage.exists(key):
+            return _pending(request, 'Gerando o arquivo com os relatórios do período…')
+    return FileResponse(default_storage.open(key, 'rb'), as_attachment=True,
+                        filename=f'relatorios-{start:%Y%m%d}-{end:%Y%m%d}.zip', content_type='application/zip')
+
+@login_required
+def route_plan(request):
+    """Roteiro sugerido da semana (lote noturno); gestores escolhem o representante com ?rep=."""
+    from .models import RoutePlan
+    access = _access(request)
+    reps = Representative.objects.select_related('user').order_by('user__first_name', 'user__username')
+    rep_id = access.rep_id
+    if access.is_manager:
+        try:
+            rep_id = int(request.GET.get('rep') or 0) or rep_id
+        except ValueError:
+            return HttpResponseBadRequest('invalid rep')
+    if not rep_id:
+        return render(request, 'roteiro.html', {'reps': reps if access.is_manager else None, 'plan': None})
+    rep_id = get_object_or_404(Representative, pk=rep_id).pk
+    week_start, first_day = routing.current_week()
+    plan = RoutePlan.objects.filter(representative_id=rep_id, week_start=week_start).first()
+    if plan is None:
+        # ainda não passou o lote noturno: calcula só este representante
+        routing.build_plans(week_start, rep_ids=[rep_id], first_day=first_day)
+        plan = RoutePlan.objects.filter(representative_id=rep_id, week_start=week_start).first()
+    # sem plano (representante sem médicos/agenda na semana): estado vazio
+    days = [
+        dict(d, date=date.fromisoformat(d['date']),
+             visits=[dict(v, start=datetime.fromisoformat(v['start'])) for v in d['visits']])
+        for d in plan.payload
+    ] if plan else []
+    return render(request, 'roteiro.html', {
+        'reps': reps if access.is_manager else None, 'selected_rep': rep_id,
+        'plan': plan, 'days': days, 'week_start': week_start,
+    })
+
+ATTAINMENT_LEVELS = {'rep': attainment.rep_rows, 'territory': attainment.territory_rows, 'doctor': attainment.doctor_rows}
+
+@login_required
+def api_attainment(request):
+    """
+    Atingimento de metas. ?month=AAAA-MM (padrão: mês atual), ?months=N meses
+    até ele, ?level=rep|territory|doctor, ?rep= (gestores), ?pending=1 (médicos abaixo da meta).
+    """
+    access = _access(request)
+    month = attainment.parse_month(request.GET.get('month')) if request.GET.get('month') else \
+        attainment.month_start(timezone.localdate())
+    level = request.GET.get('level', 'rep')
+    try:
+        count = max(1, min(int(request.GET.get('months') or 1), attainment.MAX_MONTHS))
+        rep_filter = int(request.GET['rep']) if request.GET.get('rep') else None
+    except ValueError:
+        return HttpResponseBadRequest('invalid parameters')
+    if month is None or level not in ATTAINMENT_LEVELS:
+        return HttpResponseBadRequest('invalid parameters')
+    if access.is_manager:
+        rep_ids = {rep_filter} if rep_filter else None
+    elif access.rep_id:
+        rep_ids = {access.rep_id}
+    else:
+        return JsonResponse({'months': []})
+
+    payloads = attainment.get_months(attainment.recent_months(count, month))
+    out = []
+    for m, payload in sorted(payloads.items()):
+        if level == 'doctor':
+            rows = attainment.doctor_rows(payload, rep_ids, pending_only=request.GET.get('pending') == '1')
+        else:
+            rows = ATTAINMENT_LEVELS[level](payload, rep_ids)
+        target = sum(r['target'] for r in rows)
+        done = sum(r['done'] for r in rows)
+        out.append({'month': payload['month'], 'target': target, 'done': done,
+                    'pct': attainment.pct(done, target), 'rows': _attainment_names(rows)})
+    return JsonResponse({'level': level, 'months': out})
+
+@login_required
+def api_cache_stats(request):
+    """Hit/miss do cache (L1/Redis) deste processo e agregados; só gestores."""
+    if not _access(request).is_manager:
+        return HttpResponseForbidden('not allowed')
+    return JsonResponse({'backend': settings.CACHES['default']['BACKEND'], 'stats': cache_stats()})
+
+@login_required
+def api_profiler_stats(request):
+    """Agregados do perfil de queries por view (greens_scheduler.profiling); só admin (staff)."""
+    if not request.user.is_staff:
+        return HttpResponseForbidden('not allowed')
+    return JsonResponse(profiling.stats())
+
+SEARCH_TYPES = {'doctor': ('id', 'name', 'crm', 'uf', 'specialty'), 'organization': ('id', 'name', 'city', 'state')}
+
+@login_required
+def api_search(request):
+    """
+    Typeahead: ?q= (sem acento/caixa, tolera erro de digitação), ?type=doctor|organization,
+    ?limit= (até crm.search.MAX_LIMIT). Resultados ordenados por relevância, no escopo do usuário.
+    """
+    kind = request.GET.get('type', 'doctor')
+    if kind not in SEARCH_TYPES:
+        return HttpResponseBadRequest('invalid type')
+    try:
+        limit = int(request.GET.get('limit') or search.DEFAULT_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest('invalid limit')
+    fields = SEARCH_TYPES[kind]
+    if kind == 'doctor':
+        qs = _access(request).visible_doctors(Doctor.objects.only(*fields))
+    else:
+        qs = _visible_orgs(request, Organization.objects.only(*fields))
+    results = search.ranked(qs, request.GET.get('q', ''), limit)
+    return JsonResponse({'results': [{f: getattr(obj, f) for f in fields} for obj in results]})
+
+LOOKUP_FIELDS = ('id', 'name', 'crm', 'uf', 'specialty')
+LOOKUP_ORDER = ('name', 'id')
+LOOKUP_PAGE = 20
+
+def _doctor_lookup(request):
+    qs = _access(request).visible_doctors(Doctor.objects.only(*LOOKUP_FIELDS))
+    try:
+        per_page = max(1, min(int(request.GET.get('limit') or LOOKUP_PAGE), search.MAX_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest('invalid limit')
+    q = request.GET.get('q', '').strip()
+    if q:
+        # busca ranqueada: uma página só, a mais relevante
+        rows, next_cursor = search.ranked(qs, q, per_page), ''
+    else:
+        page = _page(request, qs, LOOKUP_ORDER, per_page=per_page)
+        if page is None:
+            return HttpResponseBadRequest('invalid cursor')
+        rows, next_cursor = page, page.next_cursor
+    return JsonResponse({
+        'results': [{f: getattr(d, f) for f in LOOKUP_FIELDS} for d in rows],
+        'next': next_cursor or None,
+    })
+
+async def api_doctor_lookup(request):
+    """
+    Médicos para o seletor com busca, no escopo RBAC do usuário.
+    Sem ?q=: ordem alfabética paginada por ?cursor= (campo `next`).
+    Com ?q=: os mais relevantes (crm.search), até ?limit=.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden('not allowed')
+    return await sync_to_async(_doctor_lookup)(request)
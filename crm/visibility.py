@@ -0,0 +1,48 @@
+"""
+Conjunto de médicos visíveis por representante (tabela DoctorVisibility).
+
+Cada par (representante, médico) existe enquanto houver ao menos uma
+atribuição ativa entre eles. Os signals de Assignment chamam
+refresh_pair(); rebuild() refaz tudo (comando `rebuild_visibility`).
+Consultas escopadas viram um join indexado, sem DISTINCT.
+"""
+from django.db import transaction
+
+from . import caching
+
+from .models import Assignment, DoctorVisibility
+
+BATCH_SIZE = 1000
+
+
+def refresh_pair(rep_id, doctor_id):
+    active = Assignment.objects.filter(
+        representative_id=rep_id, physician_id=doctor_id, active=True
+    ).exists()
+    if active:
+        DoctorVisibility.objects.get_or_create(representative_id=rep_id, doctor_id=doctor_id)
+    else:
+        DoctorVisibility.objects.filter(representative_id=rep_id, doctor_id=doctor_id).delete()
+
+
+def rebuild(rep_id=None):
+    pairs = Assignment.objects.filter(active=True)
+    current = DoctorVisibility.objects.all()
+    if rep_id is not None:
+        pairs = pairs.filter(representative_id=rep_id)
+        current = current.filter(representative_id=rep_id)
+    pairs = pairs.values_list('representative_id', 'physician_id').distinct()
+    with transaction.atomic():
+        current.delete()
+        DoctorVisibility.objects.bulk_create(
+            (DoctorVisibility(representative_id=r, doctor_id=d) for r, d in pairs.iterator()),
+            batch_size=BATCH_SIZE,
+        )
+        # fragmentos escopados por representante: mais simples invalidar a versão global
+        caching.bump_on_commit('doctor')
+    return DoctorVisibility.objects.filter(**({'representative_id': rep_id} if rep_id else {})).count()
+
+
+def doctors_for(qs, rep_id):
+    """Restringe um queryset de Doctor aos médicos visíveis do representante."""
+    return qs.filter(visibility__representative_id=rep_id)
@@ -1,4 +1,9 @@
 import os
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'greens_scheduler.settings')
 application = get_asgi_application()
+# uvicorn não serve /static/ como o runserver; em DEBUG o handler do staticfiles faz isso
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    application = ASGIStaticFilesHandler(application)
@@ -0,0 +1,231 @@
+"""
+Cache em dois níveis: L1 em memória do processo na frente do Redis (L2).
+
+- Leituras passam pelo L1 (TTL curto, L1_TIMEOUT); em miss vão ao Redis e
+  populam o L1. Escritas vão aos dois níveis.
+- Chaves com prefixo em L1_BYPASS_PREFIXES (contadores de versão/geração)
+  nunca ficam no L1: são elas que invalidam entre processos, então precisam
+  ser lidas sempre do Redis. As chaves de dados incluem essas versões, e
+  por isso um L1 "velho" nunca serve dado invalidado.
+- Se o Redis cair, o backend degrada para só-L1 por alguns segundos em vez
+  de derrubar as páginas (erros contam em `errors`).
+
+Contadores de hit/miss por processo e agregados no Redis (ver `stats`).
+"""
+import logging
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+STAT_NAMES = ('l1_hits', 'l2_hits', 'misses', 'sets', 'errors')
+STATS_PREFIX = 'cachestats:'
+STATS_FLUSH_EVERY = 200   # operações entre envios dos contadores ao Redis
+L2_RETRY_AFTER = 5        # segundos em modo só-L1 depois de um erro do Redis
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = dict(params.get('OPTIONS') or {})
+        self.l1_timeout = options.pop('L1_TIMEOUT', 5)
+        l1_max = options.pop('L1_MAX_ENTRIES', 5000)
+        self.bypass = tuple(options.pop('L1_BYPASS_PREFIXES', ())) + (STATS_PREFIX,)
+        shared = {k: params[k] for k in ('KEY_PREFIX', 'VERSION', 'KEY_FUNCTION') if k in params}
+        self._l1 = LocMemCache(f'tiered-{id(self)}', dict(
+            shared, TIMEOUT=self.l1_timeout, OPTIONS={'MAX_ENTRIES': l1_max},
+        ))
+        self._l2 = RedisCache(location, dict(shared, TIMEOUT=params.get('TIMEOUT', 300), OPTIONS=options))
+        self._down_until = 0.0
+        self._counts = dict.fromkeys(STAT_NAMES, 0)
+        self._pending = dict.fromkeys(STAT_NAMES, 0)
+        self._ops = 0
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # Infra
+    # -----------------------------
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+            self._pending[name] += n
+            self._ops += n
+            flush = self._ops >= STATS_FLUSH_EVERY
+            if flush:
+                pending, self._pending, self._ops = self._pending, dict.fromkeys(STAT_NAMES, 0), 0
+        if flush:
+            self._push_stats(pending)
+
+    def _push_stats(self, pending):
+        for name, n in pending.items():
+            if not n:
+                continue
+            key = STATS_PREFIX + name
+            self._call_l2(lambda: self._l2.add(key, 0, None) or True, count=False)
+            self._call_l2(lambda: self._l2.incr(key, n), count=False)
+
+    def _l2_available(self):
+        return time.monotonic() >= self._down_until
+
+    def _call_l2(self, fn, default=None, count=True):
+        if not self._l2_available():
+            return default
+        from redis.exceptions import RedisError
+        try:
+            return fn()
+        except RedisError:
+            self._down_until = time.monotonic() + L2_RETRY_AFTER
+            logger.warning('Redis indisponível; cache em modo só-L1 por %ss', L2_RETRY_AFTER, exc_info=True)
+            if count:
+                self._count('errors')
+            return default
+
+    def _l1_ok(self, key):
+        return not key.startswith(self.bypass)
+
+    def _l1_timeout(self, timeout, l2_ok=True):
+        # com o Redis fora, o L1 guarda pelo TTL pedido (é o único nível)
+        if not l2_ok:
+            return timeout
+        expires = self.get_backend_timeout(timeout)
+        return self.l1_timeout if expires is None else min(expires - time.time(), self.l1_timeout)
+
+    # -----------------------------
+    # API do cache
+    # -----------------------------
+    def get(self, key, default=None, version=None):
+        if self._l1_ok(key):
+            value = self._l1.get(key, _MISSING, version)
+            if value is not _MISSING:
+                self._count('l1_hits')
+                return value
+        value = self._call_l2(lambda: self._l2.get(key, _MISSING, version), _MISSING)
+        if value is _MISSING:
+            if not self._l2_available() and not self._l1_ok(key):
+                # contadores com o Redis fora: vale o que o processo tem
+                value = self._l1.get(key, _MISSING, version)
+            if value is _MISSING:
+                self._count('misses')
+                return default
+            self._count('l1_hits')
+        else:
+            self._count('l2_hits')
+        if self._l1_ok(key):
+            self._l1.set(key, value, self.l1_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._count('sets')
+        ok = self._call_l2(lambda: self._l2.set(key, value, timeout, version) or True, False)
+        if self._l1_ok(key) or not ok:
+            self._l1.set(key, value, self._l1_timeout(timeout, ok), version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._call_l2(lambda: self._l2.add(key, value, timeout, version), _MISSING)
+        if added is _MISSING:
+            return self._l1.add(key, value, timeout, version)
+        if added and self._l1_ok(key):
+            self._l1.set(key, value, self._l1_timeout(timeout), version)
+        return added
+
+    def delete(self, key, version=None):
+        l1 = self._l1.delete(key, version)
+        l2 = self._call_l2(lambda: self._l2.delete(key, version), False)
+        return bool(l1 or l2)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1.delete(key, version)
+        return self._call_l2(lambda: self._l2.touch(key, timeout, version), False)
+
+    def incr(self, key, delta=1, version=None):
+        if not self._l2_available():
+            return self._l1.incr(key, delta, version)
+        value = self._call_l2(lambda: self._l2.incr(key, delta, version), _MISSING)
+        if value is _MISSING:
+            return self._l1.incr(key, delta, version)
+        self._l1.delete(key, version)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remaining = []
+        for key in keys:
+            value = self._l1.get(key, _MISSING, version) if self._l1_ok(key) else _MISSING
+            if value is _MISSING:
+                remaining.append(key)
+            else:
+                found[key] = value
+        if found:
+            self._count('l1_hits', len(found))
+        if remaining:
+            from_l2 = self._call_l2(lambda: self._l2.get_many(remaining, version), None)
+            if from_l2 is None:
+                # Redis fora: contadores/versões ficam só no L1 deste processo
+                from_l2 = self._l1.get_many(remaining, version)
+                hit_name = 'l1_hits'
+            else:
+                hit_name = 'l2_hits'
+                for key, value in from_l2.items():
+                    if self._l1_ok(key):
+                        self._l1.set(key, value, self.l1_timeout, version)
+            found.update(from_l2)
+            if from_l2:
+                self._count(hit_name, len(from_l2))
+            if len(remaining) > len(from_l2):
+                self._count('misses', len(remaining) - len(from_l2))
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._count('sets', len(data))
+        ok = self._call_l2(lambda: self._l2.set_many(data, timeout, version) or True, False)
+        for key, value in data.items():
+            if self._l1_ok(key) or not ok:
+                self._l1.set(key, value, self._l1_timeout(timeout, ok), version)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._l1.delete_many(keys, version)
+        self._call_l2(lambda: self._l2.delete_many(keys, version))
+
+    def clear(self):
+        self._l1.clear()
+        self._call_l2(self._l2.clear)
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
+
+    # -----------------------------
+    # Contadores
+    # -----------------------------
+    def stats(self):
+        """Contadores deste processo e os agregados de todos os processos (Redis)."""
+        with self._lock:
+            process = dict(self._counts)
+        cluster = self._call_l2(
+            lambda: self._l2.get_many([STATS_PREFIX + n for n in STAT_NAMES]), {}, count=False,
+        ) or {}
+        cluster = {n: int(cluster.get(STATS_PREFIX + n, 0)) for n in STAT_NAMES}
+        # o que ainda não foi enviado também conta
+        for name, n in self._pending.items():
+            cluster[name] += n
+        return {'process': process, 'cluster': cluster, 'l2_available': self._l2_available()}
+
+
+def stats():
+    """Contadores do cache default; None se o backend não for o TieredCache (ex.: LocMem em dev)."""
+    from django.core.cache import caches
+    backend = caches['default']
+    return backend.stats() if isinstance(backend, TieredCache) else None
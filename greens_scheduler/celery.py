@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "greens_scheduler.settings")
 
@@ -7,6 +8,19 @@ app = Celery("greens_scheduler")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
+
+# duração e contagem das tasks (greens_scheduler.metrics)
+@task_prerun.connect
+def _task_prerun(**kwargs):
+    from . import metrics
+    metrics.task_started(**kwargs)
+
+
+@task_postrun.connect
+def _task_postrun(**kwargs):
+    from . import metrics
+    metrics.task_finished(**kwargs)
+
 @app.task
 def ping():
     return "pong"
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Leituras na réplica, escritas no primário (alias "replica", opcional).
+
+- ReplicaMiddleware libera a réplica só em GET/HEAD/OPTIONS. Os demais
+  métodos ficam no primário e marcam o navegador (cookie) por
+  DB_STICKY_SECONDS: as páginas logo depois de uma escrita do usuário
+  (redirect para a lista, recarregar o kanban) leem do primário e não veem
+  a réplica atrasada.
+- Dentro de um request ou job, depois da primeira escrita (ou dentro de um
+  transaction.atomic no primário) as leituras voltam ao primário.
+- Jobs de relatório/agregação pedem a réplica com `replica_reads()`; fora
+  dele (tasks, shell, comandos) tudo vai ao primário.
+- `primary()` força o primário. Usado ao preencher caches versionados:
+  um valor lido de uma réplica atrasada ficaria guardado sob a versão nova.
+- Sessões ficam sempre no primário (o login é gravado e lido em seguida).
+
+Sem o alias "replica" (dev, CI) o router não é instalado; com
+USE_SQLITE_REPLICA=1 o alias aponta para o mesmo arquivo SQLite (e, nos
+testes, espelha o default via TEST.MIRROR), o que exercita o roteamento sem
+uma réplica real.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_APPS = {'sessions'}
+
+# None: tudo no primário; dict: {'replica': bool, 'wrote': bool} do request/job atual
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+@contextmanager
+def replica_reads():
+    token = _state.set({'replica': True, 'wrote': False})
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary():
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def wrote():
+    """True se o request/job atual já escreveu (as leituras seguintes vão ao primário)."""
+    state = _state.get()
+    return bool(state and state['wrote'])
+
+
+def sticky_seconds():
+    return getattr(settings, 'DB_STICKY_SECONDS', 10)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state['replica'] or state['wrote']:
+            return PRIMARY
+        if model._meta.app_label in PRIMARY_APPS or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        # também cobre select_for_update e get_or_create, que leem pelo db de escrita
+        state = _state.get()
+        if state is not None:
+            state['wrote'] = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS and not request.COOKIES.get(STICKY_COOKIE):
+            with replica_reads():
+                response = self.get_response(request)
+                pin = wrote()
+        else:
+            response = self.get_response(request)
+            pin = request.method not in SAFE_METHODS
+        if pin:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=sticky_seconds(), httponly=True, samesite='Lax')
+        return response
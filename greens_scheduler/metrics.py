@@ -0,0 +1,368 @@
+"""
+Métricas no formato texto do Prometheus (/metrics/) e checagem de prontidão (/ready/).
+
+- Contadores e histogramas (latência por view, duração das tasks, contadores
+  de negócio) são somados na memória do processo e enviados a um hash do
+  Redis (METRICS_REDIS_URL) a cada FLUSH_SECONDS, num pipeline só; as tasks
+  enviam ao terminar. O /metrics/ lê o hash, então qualquer processo web
+  responde pelo cluster. Sem Redis (dev), cada processo expõe o que viu.
+- Gauges são lidos na hora da coleta: fila do Celery (LLEN no broker),
+  idade do heartbeat do worker, pool de conexões do psycopg (deste
+  processo), conexões no Postgres e hit/miss do cache (greens_scheduler.cache).
+"""
+import hmac
+import ipaddress
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'greens_'
+HASH_KEY = 'metrics:greens'
+HEARTBEAT_KEY = 'health:heartbeat'
+FLUSH_SECONDS = 10
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900)
+_LE = re.compile(r',?le="([^"]*)"')
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests por view, método e classe de status.'),
+    'http_request_duration_seconds': ('histogram', 'Latência dos requests por view.'),
+    'celery_tasks_total': ('counter', 'Tasks executadas por nome e estado.'),
+    'celery_task_duration_seconds': ('histogram', 'Duração das tasks por nome.'),
+    'appointments_created_total': ('counter', 'Consultas criadas (tela, API e lotes).'),
+    'pdfs_rendered_total': ('counter', 'PDFs de relatório renderizados.'),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    inner = ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for k, v in sorted(labels.items()))
+    return '{' + inner + '}'
+
+
+class Registry:
+    """Somas deste processo: `totals` (tudo) e `pending` (desde o último envio ao Redis)."""
+
+    def __init__(self):
+        self.totals = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def _add(self, series, value):
+        self.totals[series] = self.totals.get(series, 0) + value
+        self.pending[series] = self.pending.get(series, 0) + value
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self._add(PREFIX + name + _labels(labels), value)
+        self.maybe_flush()
+
+    def observe(self, name, seconds, buckets=LATENCY_BUCKETS, **labels):
+        base = PREFIX + name
+        with self.lock:
+            for le in buckets:
+                if seconds <= le:
+                    self._add(base + '_bucket' + _labels(dict(labels, le=le)), 1)
+            self._add(base + '_bucket' + _labels(dict(labels, le='+Inf')), 1)
+            self._add(base + '_sum' + _labels(labels), seconds)
+            self._add(base + '_count' + _labels(labels), 1)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        client = _redis()
+        if not pending or client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipe.hincrbyfloat(HASH_KEY, series, value)
+            pipe.execute()
+        except Exception:
+            logger.warning('métricas: falha ao enviar ao Redis; somas devolvidas ao pendente', exc_info=True)
+            with self.lock:
+                for series, value in pending.items():
+                    self.pending[series] = self.pending.get(series, 0) + value
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _redis():
+    global _client
+    url = getattr(settings, 'METRICS_REDIS_URL', '')
+    if not url:
+        return None
+    with _client_lock:
+        if _client is None:
+            import redis
+            _client = redis.Redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=0.5)
+    return _client
+
+
+def status_class(code):
+    return f'{code // 100}xx'
+
+
+# -----------------------------
+# Celery (conectado em greens_scheduler.celery)
+# -----------------------------
+_task_started = {}
+
+
+def task_started(task_id=None, **kwargs):
+    _task_started[task_id] = time.monotonic()
+
+
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    name = getattr(task, 'name', 'desconhecida')
+    inc('celery_tasks_total', task=name, state=(state or 'UNKNOWN').lower())
+    if started is not None:
+        observe('celery_task_duration_seconds', time.monotonic() - started, TASK_BUCKETS, task=name)
+    # worker pode ficar parado por muito tempo: envia já
+    registry.flush()
+
+
+def beat():
+    """Chamado pela task de heartbeat: marca o worker como vivo."""
+    cache.set(HEARTBEAT_KEY, time.time(), None)
+
+
+def heartbeat_age():
+    last = cache.get(HEARTBEAT_KEY)
+    return None if last is None else max(0.0, time.time() - last)
+
+
+# -----------------------------
+# Coleta
+# -----------------------------
+def _queue_depths():
+    url = getattr(settings, 'CELERY_BROKER_URL', '')
+    if not url.startswith(('redis://', 'rediss://')):
+        return {}
+    import redis
+    client = redis.Redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=0.5)
+    queues = getattr(settings, 'METRICS_CELERY_QUEUES', ['celery'])
+    pipe = client.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+    return dict(zip(queues, pipe.execute()))
+
+
+def _pool_stats():
+    out = {}
+    for conn in connections.all(initialized_only=True):
+        pool = getattr(conn, 'pool', None) if conn.vendor == 'postgresql' else None
+        if pool is not None:
+            stats = pool.get_stats()
+            out[conn.alias] = {
+                'size': stats.get('pool_size', 0),
+                'available': stats.get('pool_available', 0),
+                'waiting': stats.get('requests_waiting', 0),
+            }
+    return out
+
+
+def _pg_connections():
+    conn = connections['default']
+    if conn.vendor != 'postgresql':
+        return {}
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() GROUP BY 1"
+        )
+        return dict(cursor.fetchall())
+
+
+def _heartbeat_samples():
+    age = heartbeat_age()
+    return [] if age is None else [({}, round(age, 1))]
+
+
+def _gauges():
+    from .cache import stats as cache_stats
+
+    lines = []
+
+    def gauge(name, help_text, samples):
+        if not samples:
+            return
+        lines.append(f'# HELP {PREFIX}{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{name} gauge')
+        for labels, value in samples:
+            lines.append(f'{PREFIX}{name}{_labels(labels)} {value}')
+
+    collectors = (
+        ('celery_queue_depth', 'Mensagens aguardando na fila do broker.',
+         lambda: [({'queue': q}, n) for q, n in _queue_depths().items()]),
+        ('worker_heartbeat_age_seconds', 'Segundos desde o último heartbeat do worker.', _heartbeat_samples),
+        ('db_pool_connections', 'Pool do psycopg deste processo (tamanho, livres, esperando).',
+         lambda: [({'alias': alias, 'state': k, 'pid': os.getpid()}, v)
+                  for alias, s in _pool_stats().items() for k, v in s.items()]),
+        ('db_connections', 'Conexões no Postgres por estado (pg_stat_activity).',
+         lambda: [({'state': state}, n) for state, n in _pg_connections().items()]),
+    )
+    for name, help_text, collect in collectors:
+        try:
+            gauge(name, help_text, collect())
+        except Exception as exc:
+            logger.warning('métricas: coleta de %s falhou: %s', name, exc)
+
+    data = cache_stats()
+    if data:
+        cluster = data['cluster']
+        gauge('cache_operations', 'Operações do cache (todos os processos, desde o último reset do Redis).',
+              [({'result': k}, v) for k, v in sorted(cluster.items())])
+        reads = cluster['l1_hits'] + cluster['l2_hits'] + cluster['misses']
+        if reads:
+            gauge('cache_hit_ratio', 'Fração das leituras do cache servidas pelo L1 ou Redis.',
+                  [({}, round((cluster['l1_hits'] + cluster['l2_hits']) / reads, 4))])
+    return lines
+
+
+def _series():
+    """Somas do cluster (Redis) mais o que este processo ainda não enviou."""
+    client = _redis()
+    if client is None:
+        with registry.lock:
+            return dict(registry.totals)
+    try:
+        stored = client.hgetall(HASH_KEY)
+    except Exception:
+        logger.warning('métricas: Redis indisponível; exportando só este processo', exc_info=True)
+        with registry.lock:
+            return dict(registry.totals)
+    series = {k.decode(): float(v) for k, v in stored.items()}
+    with registry.lock:
+        for name, value in registry.pending.items():
+            series[name] = series.get(name, 0) + value
+    return series
+
+
+def _metric_name(series):
+    name = series.split('{', 1)[0][len(PREFIX):]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _order(item):
+    # agrupa por conjunto de labels e ordena os baldes pelo limite (le)
+    series = item[0]
+    found = _LE.search(series)
+    if not found:
+        return series, 0.0
+    le = found.group(1)
+    return _LE.sub('', series), float('inf') if le == '+Inf' else float(le)
+
+
+def render():
+    """Texto de exposição do Prometheus (version 0.0.4)."""
+    registry.flush()
+    grouped = {}
+    for series, value in _series().items():
+        grouped.setdefault(_metric_name(series), []).append((series, value))
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {PREFIX}{name} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{name} {kind}')
+        for series, value in sorted(grouped.get(name, ()), key=_order):
+            lines.append(f'{series} {_format(value)}')
+    lines.extend(_gauges())
+    return '\n'.join(lines) + '\n'
+
+
+# -----------------------------
+# Acesso e prontidão
+# -----------------------------
+def allowed(request):
+    """
+    Endpoint interno: com METRICS_TOKEN, exige o Bearer. Sem token só vale em
+    DEBUG e de loopback; atrás do proxy o REMOTE_ADDR é sempre de rede privada,
+    então confiar nele deixaria /metrics/ aberto para qualquer um.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not settings.DEBUG:
+        return False
+    try:
+        ip = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return ip.is_loopback
+
+
+def _timed(check):
+    start = time.perf_counter()
+    try:
+        detail = check()
+    except Exception as exc:
+        return {'ok': False, 'error': f'{type(exc).__name__}: {exc}'[:200],
+                'ms': round((time.perf_counter() - start) * 1000, 1)}
+    result = {'ok': True, 'ms': round((time.perf_counter() - start) * 1000, 1)}
+    if isinstance(detail, dict):
+        result.update(detail)
+    return result
+
+
+def _check_db(alias):
+    def check():
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    return check
+
+
+def _check_redis():
+    import redis
+    redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5).ping()
+
+
+def _check_worker():
+    age = heartbeat_age()
+    limit = getattr(settings, 'HEARTBEAT_MAX_AGE', 180)
+    if age is None:
+        raise RuntimeError('sem heartbeat do worker')
+    if age > limit:
+        raise RuntimeError(f'último heartbeat há {age:.0f}s (limite {limit}s)')
+    return {'age_seconds': round(age, 1)}
+
+
+def readiness():
+    """(ok, {check: resultado}): bancos, Redis e heartbeat do worker."""
+    checks = {f'db:{alias}': _timed(_check_db(alias)) for alias in settings.DATABASES}
+    if getattr(settings, 'READINESS_CHECK_REDIS', True):
+        checks['redis'] = _timed(_check_redis)
+    if not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        checks['worker'] = _timed(_check_worker)
+    return all(c['ok'] for c in checks.values()), checks
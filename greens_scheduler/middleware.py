@@ -1,3 +1,6 @@
+import json
+import time
+
 from django.conf import settings
 from django.shortcuts import redirect
 from django.utils.deprecation import MiddlewareMixin
@@ -27,3 +30,60 @@ class LoginRequiredMiddleware(MiddlewareMixin):
         # Enforce login
         login_url = settings.LOGIN_URL or '/accounts/login/'
         return redirect(f"{login_url}?next=/{path}")
+
+
+class RBACMiddleware:
+    """Anexa request.access (crm.rbac.Access), resolvido sob demanda uma vez por request."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from crm.rbac import Access
+        request.access = Access(request.user)
+        return self.get_response(request)
+
+
+class QueryProfilerMiddleware:
+    """
+    Perfil por amostragem (greens_scheduler.profiling): queries, tempo de banco
+    e de template, N+1 e tamanho da resposta por view. Ligado com
+    QUERY_PROFILER_SAMPLE > 0.
+    """
+    def __init__(self, get_response):
+        from . import profiling
+        self.get_response = get_response
+        self.profiling = profiling
+        profiling.install_template_timer()
+
+    def __call__(self, request):
+        if not self.profiling.should_sample():
+            return self.get_response(request)
+        profile, stack = self.profiling.start()
+        with stack:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        record = profile.record(view, request.method, response.status_code, size)
+        self.profiling.logger.info('query_profile %s', json.dumps(record, ensure_ascii=False))
+        self.profiling.add(record)
+        return response
+
+
+class MetricsMiddleware:
+    """Contador e histograma de latência por view (greens_scheduler.metrics)."""
+    def __init__(self, get_response):
+        from . import metrics
+        self.get_response = get_response
+        self.metrics = metrics
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        # rotas sem nome/404 ficam agrupadas: o path não vira label (cardinalidade)
+        view = (match.view_name or 'sem_nome') if match else 'unresolved'
+        self.metrics.observe('http_request_duration_seconds', time.perf_counter() - start, view=view)
+        self.metrics.inc('http_requests_total', view=view, method=request.method,
+                         status=self.metrics.status_class(response.status_code))
+        return response
@@ -0,0 +1,260 @@
+"""
+Perfil de requests por amostragem (QueryProfilerMiddleware).
+
+Uma fração QUERY_PROFILER_SAMPLE dos requests (0 = desligado; fora da
+amostra o custo é um random()) registra, por view:
+
+- número de queries e tempo total no banco (todas as conexões, via
+  execute_wrapper);
+- queries repetidas: o SQL com os literais de IN (...) colapsados vira uma
+  impressão digital; a mesma impressão N1_THRESHOLD vezes ou mais no mesmo
+  request é a assinatura de um N+1;
+- tempo de renderização dos templates (render() / render_to_string; inclui
+  as queries disparadas pelo template) e tamanho da resposta.
+
+Cada request amostrado vira uma linha JSON no log "greens_scheduler.profiling".
+Os agregados ficam em baldes de BUCKET_SECONDS na memória do processo e são
+enviados ao cache ("qprof:") a cada FLUSH_EVERY requests; `stats()` junta os
+processos da última janela (WINDOW_BUCKETS baldes).
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+N1_THRESHOLD = 5
+BUCKET_SECONDS = 300
+WINDOW_BUCKETS = 12          # 1 hora
+FLUSH_EVERY = 50
+TOP_DUPLICATES = 5
+CACHE_PREFIX = 'qprof:'
+PROCS_KEY = CACHE_PREFIX + 'procs'
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACES = re.compile(r'\s+')
+
+_current = contextvars.ContextVar('query_profile', default=None)
+
+
+def sample_rate():
+    return getattr(settings, 'QUERY_PROFILER_SAMPLE', 0.0)
+
+
+def fingerprint(sql):
+    """SQL parametrizado do Django (%s) com listas IN colapsadas -> (hash curto, SQL normalizado)."""
+    sql = _SPACES.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+    return hashlib.sha1(sql.encode()).hexdigest()[:12], sql
+
+
+class Profile:
+    """Coleta de um request: queries (por impressão digital), tempos e tamanho."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.prints = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            key, normalized = fingerprint(sql)
+            entry = self.prints.get(key)
+            if entry is None:
+                self.prints[key] = [1, normalized]
+            else:
+                entry[0] += 1
+
+    def duplicates(self):
+        return sorted(
+            ((key, n, sql) for key, (n, sql) in self.prints.items() if n >= N1_THRESHOLD),
+            key=lambda item: -item[1],
+        )
+
+    def record(self, view, method, status, size):
+        dups = self.duplicates()
+        return {
+            'view': view,
+            'method': method,
+            'status': status,
+            'ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'bytes': size,
+            'n1': [{'fingerprint': key, 'count': n, 'sql': sql[:300]} for key, n, sql in dups[:TOP_DUPLICATES]],
+        }
+
+
+def start():
+    """Começa o perfil do request atual; devolve (profile, ExitStack com os wrappers)."""
+    profile = Profile()
+    stack = ExitStack()
+    for conn in connections.all(initialized_only=False):
+        stack.enter_context(conn.execute_wrapper(profile))
+    token = _current.set(profile)
+    stack.callback(_current.reset, token)
+    return profile, stack
+
+
+# -----------------------------
+# Tempo de template
+# -----------------------------
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install_template_timer():
+    """Envolve o render dos templates do backend Django (uma vez por processo)."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        from django.template.backends.django import Template
+
+        original = Template.render
+
+        def render(self, context=None, request=None):
+            profile = _current.get()
+            if profile is None:
+                return original(self, context, request)
+            start = time.perf_counter()
+            try:
+                return original(self, context, request)
+            finally:
+                profile.template_time += time.perf_counter() - start
+
+        Template.render = render
+        _installed = True
+
+
+# -----------------------------
+# Agregados
+# -----------------------------
+_PROC = f'{socket.gethostname()}-{os.getpid()}'
+_buckets = {}                # {bucket: {view: agregado}}
+_lock = threading.Lock()
+_since_flush = 0
+
+
+def _empty():
+    return {'requests': 0, 'queries': 0, 'max_queries': 0, 'ms': 0.0, 'db_ms': 0.0,
+            'template_ms': 0.0, 'bytes': 0, 'n1_requests': 0, 'n1': {}}
+
+
+def _merge(into, other):
+    for name in ('requests', 'queries', 'ms', 'db_ms', 'template_ms', 'bytes', 'n1_requests'):
+        into[name] += other[name]
+    into['max_queries'] = max(into['max_queries'], other['max_queries'])
+    for key, (n, sql) in other['n1'].items():
+        seen = into['n1'].get(key)
+        into['n1'][key] = [n + (seen[0] if seen else 0), sql]
+
+
+def add(record):
+    """Soma o request ao balde atual e, a cada FLUSH_EVERY, envia o snapshot do processo ao cache."""
+    global _since_flush
+    bucket = int(time.time() // BUCKET_SECONDS)
+    one = _empty()
+    one.update(requests=1, queries=record['queries'], max_queries=record['queries'], ms=record['ms'],
+               db_ms=record['db_ms'], template_ms=record['template_ms'], bytes=record['bytes'] or 0,
+               n1_requests=1 if record['n1'] else 0,
+               n1={d['fingerprint']: [d['count'], d['sql']] for d in record['n1']})
+    with _lock:
+        views = _buckets.setdefault(bucket, {})
+        _merge(views.setdefault(record['view'], _empty()), one)
+        for old in [b for b in _buckets if b <= bucket - WINDOW_BUCKETS]:
+            del _buckets[old]
+        _since_flush += 1
+        flush = _since_flush >= FLUSH_EVERY
+        if flush:
+            _since_flush = 0
+            snapshot = json.loads(json.dumps(_buckets))
+    if flush:
+        _push(snapshot)
+
+
+def _push(snapshot):
+    ttl = BUCKET_SECONDS * WINDOW_BUCKETS
+    try:
+        cache.set(CACHE_PREFIX + _PROC, snapshot, ttl)
+        procs = cache.get(PROCS_KEY) or {}
+        now = time.time()
+        procs = {p: seen for p, seen in procs.items() if now - seen < ttl}
+        procs[_PROC] = now
+        cache.set(PROCS_KEY, procs, ttl)
+    except Exception:
+        logger.warning('perfil: falha ao enviar agregados ao cache', exc_info=True)
+
+
+def _summary(views):
+    out = []
+    for view, agg in views.items():
+        n = agg['requests']
+        top = sorted(agg['n1'].items(), key=lambda item: -item[1][0])[:TOP_DUPLICATES]
+        out.append({
+            'view': view,
+            'requests': n,
+            'avg_queries': round(agg['queries'] / n, 1),
+            'max_queries': agg['max_queries'],
+            'avg_ms': round(agg['ms'] / n, 1),
+            'avg_db_ms': round(agg['db_ms'] / n, 1),
+            'avg_template_ms': round(agg['template_ms'] / n, 1),
+            'avg_bytes': agg['bytes'] // n,
+            'n1_requests': agg['n1_requests'],
+            'n1': [{'fingerprint': key, 'count': c, 'sql': sql} for key, (c, sql) in top],
+        })
+    out.sort(key=lambda row: (-row['avg_queries'], row['view']))
+    return out
+
+
+def stats():
+    """Por view, na última janela: deste processo e de todos os processos que já enviaram ao cache."""
+    floor = int(time.time() // BUCKET_SECONDS) - WINDOW_BUCKETS
+    with _lock:
+        local = json.loads(json.dumps(_buckets))
+    procs = cache.get(PROCS_KEY) or {}
+    snapshots = cache.get_many([CACHE_PREFIX + p for p in procs])
+    # o snapshot deste processo no cache está atrasado: vale o da memória
+    snapshots[CACHE_PREFIX + _PROC] = local
+
+    def merged(sources):
+        views = {}
+        for buckets in sources:
+            for bucket, items in buckets.items():
+                if int(bucket) <= floor:
+                    continue
+                for view, agg in items.items():
+                    _merge(views.setdefault(view, _empty()), agg)
+        return _summary(views)
+
+    return {
+        'sample_rate': sample_rate(),
+        'window_seconds': BUCKET_SECONDS * WINDOW_BUCKETS,
+        'processes': len(snapshots),
+        'process': merged([local]),
+        'cluster': merged(snapshots.values()),
+    }
+
+
+def should_sample():
+    rate = sample_rate()
+    return rate > 0 and (rate >= 1 or random.random() < rate)
@@ -54,11 +54,13 @@ INSTALLED_APPS = [
 # Middleware
 # -----------------------------
 MIDDLEWARE = [
+    "greens_scheduler.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "greens_scheduler.middleware.RBACMiddleware",
     "simple_history.middleware.HistoryRequestMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -70,8 +72,8 @@ MIDDLEWARE = [
 # -----------------------------
 ROOT_URLCONF = f"{PROJECT_MODULE}.urls"
 WSGI_APPLICATION = f"{PROJECT_MODULE}.wsgi.application"
-# Se você tiver ASGI, descomente:
-# ASGI_APPLICATION = f"{PROJECT_MODULE}.asgi.application"
+# ASGI (canal SSE de alertas): uvicorn greens_scheduler.asgi:application
+ASGI_APPLICATION = f"{PROJECT_MODULE}.asgi.application"
 
 # -----------------------------
 # Templates
@@ -95,17 +97,46 @@ TEMPLATES = [
 # -----------------------------
 # Banco de dados (Postgres)
 # -----------------------------
-DATABASES = {
-    "default": {
+# Pool de conexões: POSTGRES_POOL_MAX_SIZE > 0 liga o pool do psycopg 3 (um por
+# processo; o total no Postgres é workers x max_size). Atrás do pgbouncer em modo
+# transaction use PGBOUNCER=1 (sem cursores server-side nem prepared statements).
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "0"))
+PGBOUNCER = os.getenv("PGBOUNCER", "0") == "1"
+
+
+def _postgres(host, port):
+    db = {
         "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv("POSTGRES_DB", "greens_prm"),
         "USER": os.getenv("POSTGRES_USER", "greens"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "greens"),
-        "HOST": os.getenv("POSTGRES_HOST", "127.0.0.1"),
-        "PORT": int(os.getenv("POSTGRES_PORT", "5432")),
+        "HOST": host,
+        "PORT": int(port),
         "CONN_MAX_AGE": int(os.getenv("POSTGRES_CONN_MAX_AGE", "60")),
+        "OPTIONS": {},
     }
+    if POSTGRES_POOL_MAX_SIZE:
+        db["CONN_MAX_AGE"] = 0  # o pool é quem mantém as conexões abertas
+        db["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1")),
+            "max_size": POSTGRES_POOL_MAX_SIZE,
+            "timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", "10")),
+        }
+    if PGBOUNCER:
+        db["DISABLE_SERVER_SIDE_CURSORS"] = True
+        db["OPTIONS"]["prepare_threshold"] = None
+    return db
+
+
+DATABASES = {
+    "default": _postgres(os.getenv("POSTGRES_HOST", "127.0.0.1"), os.getenv("POSTGRES_PORT", "5432")),
 }
+# Réplica de leitura (greens_scheduler.db): GETs, dashboards e jobs de relatório
+if os.getenv("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = dict(
+        _postgres(os.getenv("POSTGRES_REPLICA_HOST"), os.getenv("POSTGRES_REPLICA_PORT", "5432")),
+        TEST={"MIRROR": "default"},
+    )
 
 # --- Fallback para SQLite (usado no CI e, se quiser, no dev local) ---
 if os.getenv("USE_SQLITE", "0") == "1":
@@ -115,6 +146,22 @@ if os.getenv("USE_SQLITE", "0") == "1":
             "NAME": BASE_DIR / "db.sqlite3",
         }
     }
+    # "réplica" no mesmo arquivo: exercita o router sem uma réplica real
+    if os.getenv("USE_SQLITE_REPLICA", "0") == "1":
+        DATABASES["replica"] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+
+if "replica" in DATABASES:
+    DATABASE_ROUTERS = ["greens_scheduler.db.ReplicaRouter"]
+    MIDDLEWARE.insert(MIDDLEWARE.index("django.middleware.common.CommonMiddleware"),
+                      "greens_scheduler.db.ReplicaMiddleware")
+# Segundos em que o navegador lê só do primário depois de um POST (ler o que escreveu)
+DB_STICKY_SECONDS = int(os.getenv("DB_STICKY_SECONDS", "10"))
+
+# Perfil de queries por amostragem (greens_scheduler.profiling): fração dos requests
+# medidos, ex. 0.01; 0 = middleware fora da pilha. Agregados em /api/profiler/stats/.
+QUERY_PROFILER_SAMPLE = float(os.getenv("QUERY_PROFILER_SAMPLE", "0"))
+if QUERY_PROFILER_SAMPLE > 0:
+    MIDDLEWARE.insert(0, "greens_scheduler.middleware.QueryProfilerMiddleware")
 
 # -----------------------------
 # Internacionalização / Fuso
@@ -129,6 +176,9 @@ USE_TZ = True
 # -----------------------------
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
+# PDFs e zips de relatórios gerados pelo worker (default_storage)
+MEDIA_URL = "/media/"
+MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", BASE_DIR / "media"))
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # -----------------------------
@@ -138,15 +188,6 @@ LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
 
-# -----------------------------
-# Cache (opcional, simples)
-# -----------------------------
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-    }
-}
-
 # -----------------------------
 # Celery / Redis
 # -----------------------------
@@ -156,8 +197,68 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", REDIS_URL)
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "0") == "1"
 
+# -----------------------------
+# Cache: L1 em memória + Redis compartilhado (greens_scheduler.cache.TieredCache).
+# CACHE_BACKEND=locmem usa só memória do processo (dev sem Redis).
+# -----------------------------
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis")
+if CACHE_BACKEND == "locmem":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "greens_scheduler.cache.TieredCache",
+            "LOCATION": os.getenv("CACHE_URL", REDIS_URL),
+            "TIMEOUT": 300,
+            "KEY_PREFIX": "greens",
+            "OPTIONS": {
+                "L1_TIMEOUT": int(os.getenv("CACHE_L1_TIMEOUT", "5")),
+                "L1_MAX_ENTRIES": 5000,
+                # contadores de versão/geração: sempre do Redis (invalidação entre processos)
+                "L1_BYPASS_PREFIXES": ["ver:", "rbac:gen", "attainment:ver:", "attainment:gen", "qprof:", "health:"],
+                "socket_connect_timeout": 0.5,
+                "socket_timeout": 0.5,
+            },
+        }
+    }
+
+# RBAC: cache entre requests do papel/escopo do usuário (0 = só por request).
+# Só ligue com cache compartilhado entre processos (ver CACHES).
+RBAC_CACHE_TTL = int(os.getenv("RBAC_CACHE_TTL", "300" if CACHE_BACKEND != "locmem" else "0"))
+
+# Métricas Prometheus (greens_scheduler.metrics) em /metrics/ e prontidão em /ready/.
+# Somas do cluster num hash do Redis; vazio = cada processo expõe só as suas.
+METRICS_REDIS_URL = os.getenv("METRICS_REDIS_URL", REDIS_URL if CACHE_BACKEND != "locmem" else "")
+# O scraper manda "Authorization: Bearer <token>"; sem token, /metrics/ só responde em DEBUG (loopback)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_CELERY_QUEUES = os.getenv("METRICS_CELERY_QUEUES", "celery").split(",")
+# /ready/ falha se o último heartbeat do worker (beat a cada minuto) for mais antigo que isso
+HEARTBEAT_MAX_AGE = int(os.getenv("HEARTBEAT_MAX_AGE", "180"))
+READINESS_CHECK_REDIS = os.getenv("READINESS_CHECK_REDIS", "1") == "1"
+
 # Agenda / Google Calendar (flag já existente)
 GOOGLE_CALENDAR_SYNC = os.getenv("GOOGLE_CALENDAR_SYNC", "0") == "1"
+# Cliente usado pelo worker do outbox (crm.google_calendar); LogClient só registra no log
+GOOGLE_CALENDAR_CLIENT = os.getenv("GOOGLE_CALENDAR_CLIENT", "crm.google_calendar.LogClient")
+GOOGLE_CALENDAR_ID = os.getenv("GOOGLE_CALENDAR_ID", "primary")
+GOOGLE_CALENDAR_CREDENTIALS = os.getenv("GOOGLE_CALENDAR_CREDENTIALS", "")
+GOOGLE_CALENDAR_RATE = float(os.getenv("GOOGLE_CALENDAR_RATE", "5"))  # chamadas/segundo
+
+# Retenção do histórico (crm.history): meses mais antigos que COMPACT_AFTER_DAYS são
+# compactados; além de RETENTION_DAYS vão para history/*.jsonl.gz no storage e saem do banco
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "730"))
+HISTORY_COMPACT_AFTER_DAYS = int(os.getenv("HISTORY_COMPACT_AFTER_DAYS", "30"))
+HISTORY_COMPACT_WINDOW = int(os.getenv("HISTORY_COMPACT_WINDOW", "30"))  # minutos
+
+# Matriz local de deslocamento (CSV origem;destino;minutos, "Cidade/UF") do roteiro semanal
+ROUTE_DISTANCE_MATRIX = os.getenv("ROUTE_DISTANCE_MATRIX", str(BASE_DIR / "data" / "distancias.csv"))
+
+# Planilha de visitas (segmentos CSV mensais gerados pelo worker)
+VISIT_EXPORT_DIR = Path(os.getenv("VISIT_EXPORT_DIR", BASE_DIR / "data" / "visitas"))
 
 # -----------------------------
 # Logs (stdout)
@@ -193,7 +294,31 @@ if SENTRY_DSN:
 
 CELERY_BEAT_SCHEDULE = {
     "heartbeat-cada-minuto": {
-        "task": "algum_app.tasks.heartbeat",
+        "task": "greens_scheduler.tasks.heartbeat",
         "schedule": crontab(),  # a cada minuto
-    }
+    },
+    "exportar-visitas": {
+        "task": "crm.tasks.export_visits",
+        "schedule": crontab(minute="*/5"),
+    },
+    "cobertura-diaria": {
+        "task": "crm.tasks.rebuild_coverage",
+        "schedule": crontab(hour=0, minute=5),
+    },
+    "sincronizar-agenda": {
+        "task": "crm.tasks.sync_calendar",
+        "schedule": crontab(),  # rede de segurança: reenvios com backoff e broker fora do ar
+    },
+    "roteiros-noturnos": {
+        "task": "crm.tasks.plan_routes",
+        "schedule": crontab(hour=2, minute=0),
+    },
+    "alertas-por-usuario": {
+        "task": "crm.tasks.precompute_alerts",
+        "schedule": crontab(),  # a cada minuto
+    },
+    "historico-retencao": {
+        "task": "crm.tasks.history_maintenance",
+        "schedule": crontab(hour=3, minute=30),
+    },
 }
@@ -5,5 +5,7 @@ logger = logging.getLogger(__name__)
 
 @shared_task
 def heartbeat():
+    from . import metrics
+    metrics.beat()
     logger.info("heartbeat ok")
     return True
@@ -1,11 +1,23 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.contrib import admin
 from django.urls import path, include
 from crm import views
+from . import metrics as metrics_module
 
 def health(request):
+    """Liveness: o processo responde (sem tocar em banco ou Redis)."""
     return JsonResponse({"ok": True})
 
+def ready(request):
+    """Readiness: bancos, Redis e heartbeat do worker; 503 se algum falhar."""
+    ok, checks = metrics_module.readiness()
+    return JsonResponse({"ok": ok, "checks": checks}, status=200 if ok else 503)
+
+def metrics(request):
+    if not metrics_module.allowed(request):
+        return HttpResponseForbidden('not allowed')
+    return HttpResponse(metrics_module.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
 
@@ -16,6 +28,8 @@ urlpatterns = [
 
     path('contatos/', views.contacts, name='contacts'),
     path('contatos/novo/', views.contact_create, name='contact_create'),
+    path('contatos/importar/', views.contact_import, name='contact_import'),
+    path('contatos/importar/<str:job_id>/', views.contact_import_status, name='contact_import_status'),
     path('contatos/<int:pk>/editar/', views.contact_update, name='contact_update'),
     path('contatos/<int:pk>/excluir/', views.contact_delete, name='contact_delete'),
 
@@ -27,16 +41,25 @@ urlpatterns = [
     # Calendar APIs
     path('api/events/', views.api_events, name='api_events'),
     path('api/events/create', views.api_events_create, name='api_events_create'),
+    path('api/events/bulk', views.api_events_bulk, name='api_events_bulk'),
+    path('api/attainment/', views.api_attainment, name='api_attainment'),
+    path('api/cache/stats/', views.api_cache_stats, name='api_cache_stats'),
+    path('api/profiler/stats/', views.api_profiler_stats, name='api_profiler_stats'),
+    path('api/search/', views.api_search, name='api_search'),
+    path('api/doctors/lookup/', views.api_doctor_lookup, name='api_doctor_lookup'),
     path('api/events/update', views.api_events_update, name='api_events_update'),
     path('api/events/delete', views.api_events_delete, name='api_events_delete'),
 
     path('api/alerts/', views.api_alerts, name='api_alerts'),
+    path('api/alerts/stream/', views.api_alerts_stream, name='api_alerts_stream'),
 
     # Relatórios
     path('relatorios/', views.report_list, name='report_list'),
     path('relatorios/novo/<int:appointment_id>/', views.report_create, name='report_create'),
     path('relatorios/<int:pk>/editar/', views.report_update, name='report_update'),
     path('relatorios/<int:pk>/pdf/', views.report_pdf, name='report_pdf'),
+    path('relatorios/exportar/', views.report_export, name='report_export'),
+    path('roteiro/', views.route_plan, name='route_plan'),
     path('crm/contas/', views.org_list, name='org_list'),
     path('crm/contas/nova/', views.org_create, name='org_create'),
     path('crm/deals/', views.deal_list, name='deal_list'),
@@ -45,5 +68,7 @@ urlpatterns = [
     path('api/deals/move', views.api_deal_move, name='api_deal_move'),
 
     path("health/", health, name="health"),
+    path("ready/", ready, name="ready"),
+    path("metrics/", metrics, name="metrics"),
 
 ]
@@ -0,0 +1,93 @@
+// Seletor de médico com busca (/api/doctors/lookup/): substitui o <select> com todos os médicos.
+// O valor fica no <input type="hidden"> (id/nome do campo); mudanças disparam 'change' nele.
+(function(){
+  const URL = '/api/doctors/lookup/';
+
+  function label(d){
+    const crm = d.crm ? ` — CRM ${d.crm}${d.uf ? '/' + d.uf : ''}` : '';
+    return d.name + crm;
+  }
+
+  function init(root){
+    if(root.dataset.pickerReady) return;
+    root.dataset.pickerReady = '1';
+    const hidden = root.querySelector('input[type=hidden]');
+    const input = root.querySelector('[data-picker-input]');
+    const menu = root.querySelector('[data-picker-menu]');
+    let timer = null, seq = 0, next = '', current = input.value;
+
+    function open(show){
+      menu.classList.toggle('show', show);
+      input.setAttribute('aria-expanded', show ? 'true' : 'false');
+    }
+
+    function choose(id, text){
+      const changed = hidden.value !== String(id || '');
+      hidden.value = id || '';
+      input.value = current = text || '';
+      open(false);
+      if(changed) hidden.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+
+    function item(text, onClick, cls){
+      const a = document.createElement('button');
+      a.type = 'button';
+      a.className = 'dropdown-item text-truncate' + (cls ? ' ' + cls : '');
+      a.textContent = text;
+      a.addEventListener('mousedown', e => { e.preventDefault(); onClick(); });
+      return a;
+    }
+
+    async function load(q, append){
+      const mine = ++seq;
+      const params = new URLSearchParams();
+      if(q) params.set('q', q);
+      if(append && next) params.set('cursor', next);
+      const r = await fetch(URL + '?' + params.toString(), {headers: {'Accept': 'application/json'}});
+      if(!r.ok || mine !== seq) return;
+      const data = await r.json();
+      if(!append){
+        menu.innerHTML = '';
+        if(root.dataset.emptyLabel) menu.appendChild(item(root.dataset.emptyLabel, () => choose('', ''), 'text-muted'));
+      }
+      const more = menu.querySelector('[data-more]');
+      if(more) more.remove();
+      data.results.forEach(d => menu.appendChild(item(label(d), () => choose(d.id, d.name))));
+      if(!data.results.length && !append) menu.appendChild(item('Nenhum médico encontrado', () => {}, 'disabled'));
+      next = data.next || '';
+      if(next){
+        const m = item('Carregar mais…', () => load(q, true), 'small');
+        m.dataset.more = '1';
+        menu.appendChild(m);
+      }
+      open(true);
+    }
+
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      const q = input.value.trim();
+      if(!q && hidden.value) choose('', '');
+      timer = setTimeout(() => load(q, false), 200);
+    });
+    input.addEventListener('focus', () => load(input.value === current ? '' : input.value.trim(), false));
+    input.addEventListener('keydown', e => { if(e.key === 'Escape') open(false); });
+    input.addEventListener('picker:set', () => { current = input.value; });
+    input.addEventListener('blur', () => setTimeout(() => { open(false); input.value = current; }, 150));
+  }
+
+  window.DoctorPicker = {
+    init: init,
+    // valor definido por código (ex.: abrir o modal com um evento existente)
+    set: function(hidden, id, text){
+      const root = hidden.closest('[data-doctor-picker]');
+      hidden.value = id || '';
+      const input = root.querySelector('[data-picker-input]');
+      input.value = text || '';
+      input.dispatchEvent(new CustomEvent('picker:set'));
+    },
+  };
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-doctor-picker]').forEach(init);
+  });
+})();